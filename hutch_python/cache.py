@@ -3,12 +3,16 @@ This module is responsible for accumulating all loaded objects and making sure
 they are available in the ``xxx.db`` virtual module. It is used extensively in
 `load_conf.load_conf`.
 """
+from functools import partial
 from importlib import import_module
 from pathlib import Path
 import datetime
+import json
 import logging
 import sys
 
+from .disk_cache import write_json
+from .lazy import LazyDevice
 from .utils import IterableNamespace
 
 logger = logging.getLogger(__name__)
@@ -38,9 +42,17 @@ class LoadCache:
     objs: `IterableNamespace`
         This is a namespace containing all the objects that have been attached
         to the ``LoadCache``.
+
+    sources: ``dict``
+        Mapping from object name to the ``source`` given to
+        `LoadCache.update` when the object was added, e.g. the name of the
+        startup stage.
     """
     def __init__(self, module, hutch_dir=None, **objs):
         self.objs = IterableNamespace(**objs)
+        self.sources = {name: None for name in objs}
+        self.subscribers = []
+        self._source = None
         self.hutch_dir = hutch_dir
         self.module = module
         self.spoof_module(module)
@@ -74,26 +86,200 @@ class LoadCache:
             The key will is the namespace-accessible name, and the object
             is the object we are adding.
         """
-        self.objs.__dict__.update(**objs)
+        self.update(objs)
+
+    def update(self, objs, source=None):
+        """
+        Add objects to the namespace and remember where they came from.
+
+        Parameters
+        ----------
+        objs: ``dict``
+            Mapping from namespace-accessible name to object
+
+        source: ``str``, optional
+            Where the objects came from, saved in `LoadCache.sources` and the
+            manifest. Objects added by subscribers while handling this update
+            share the same source. If omitted, use the source of the update
+            in progress, if any.
+        """
+        outer_source = self._source
+        if source is not None:
+            self._source = source
+        try:
+            replaced = {name: getattr(self.objs, name) for name in objs
+                        if hasattr(self.objs, name)}
+            for name, obj in objs.items():
+                setattr(self.objs, name, obj)
+                self.sources[name] = self._source
+                if isinstance(obj, LazyDevice) and not obj.lazy_loaded:
+                    obj.lazy_subscribe(partial(self._lazy_loaded, name))
+            if replaced:
+                self._notify('remove', replaced)
+            if objs:
+                self._notify('add', objs)
+        finally:
+            self._source = outer_source
+
+    def remove(self, *names):
+        """
+        Remove objects from the namespace.
+
+        Parameters
+        ----------
+        *names: ``str``
+            The names of the objects to remove. Names that are not in the
+            namespace are ignored.
+        """
+        removed = {name: getattr(self.objs, name) for name in names
+                   if hasattr(self.objs, name)}
+        for name in removed:
+            delattr(self.objs, name)
+            self.sources.pop(name, None)
+        if removed:
+            self._notify('remove', removed)
+
+    def _lazy_loaded(self, name, obj):
+        """
+        Send the events again once the real object behind a `LazyDevice`
+        exists, so subscribers can index its components.
+        """
+        if getattr(self.objs, name, None) is obj:
+            logger.debug('Updating subscribers for loaded %s', name)
+            self._notify('remove', {name: obj})
+            self._notify('add', {name: obj})
+
+    def subscribe(self, callback):
+        """
+        Call a function each time objects are added or removed.
+
+        Parameters
+        ----------
+        callback: ``callable``
+            Called as ``callback(event, objs)``, where ``event`` is ``add`` or
+            ``remove`` and ``objs`` maps the names to the objects that were
+            added or removed. Replacing an object sends a ``remove`` event for
+            the old object and then an ``add`` event for the new one. The
+            same two events are sent again when the real object behind a
+            `LazyDevice` is created.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling a function given to `LoadCache.subscribe`.
+        """
+        self.subscribers.remove(callback)
+
+    def _notify(self, event, objs):
+        for callback in list(self.subscribers):
+            try:
+                callback(event, objs)
+            except Exception:
+                logger.error('Error updating %s after %s event',
+                             callback, event)
+                logger.debug('', exc_info=True)
 
     def write_file(self):
         """
         Write a ``db.txt`` file in the hutch's directory. This file informs
         the user which objects get loaded by ``hutch-python``.
+
+        A ``db.json`` manifest is written next to it, see
+        `LoadCache.write_manifest`.
         """
         if self.hutch_dir is not None:
             parts = self.module.split('.')
             parts[-1] = parts[-1] + '.txt'
             db_path = self.hutch_dir / Path('/'.join(parts))
-            text = (header.format(parts[0])
-                    + body.format(datetime.datetime.now()))
+            lines = [header.format(parts[0]),
+                     body.format(datetime.datetime.now())]
             for name, obj in self.objs.__dict__.items():
-                text += '{:<20} {}\n'.format(name, obj.__class__)
+                lines.append('{:<20} {}\n'.format(name, _obj_class(obj)))
             if not db_path.exists():
                 db_path.touch()
                 db_path.chmod(0o666)
             with db_path.open('w') as f:
-                f.write(text)
+                f.write(''.join(lines))
+            self.write_manifest(db_path.with_suffix('.json'))
+
+    def manifest(self):
+        """
+        Describe every object in the namespace.
+
+        Returns
+        -------
+        manifest: ``list`` of ``dict``
+            One entry per object, in the order they were added, with keys
+            ``name``, ``class``, ``happi_id``, ``prefix`` and ``source``.
+            ``class`` is the import path of the object's class, and
+            ``happi_id`` and ``prefix`` are ``None`` for objects that do not
+            come from ``happi`` or have no PV prefix.
+        """
+        entries = []
+        for name, obj in self.objs.__dict__.items():
+            if isinstance(obj, LazyDevice):
+                md = obj.lazy_md
+            else:
+                md = _get_attr(obj, 'md')
+            cls = _obj_class(obj)
+            if cls is not None:
+                cls = '{}.{}'.format(cls.__module__, cls.__qualname__)
+            prefix = _get_attr(md, 'prefix') or _get_attr(obj, 'prefix')
+            happi_id = _get_attr(md, '_id')
+            entries.append({
+                'name': name,
+                'class': cls,
+                'happi_id': happi_id if isinstance(happi_id, str) else None,
+                'prefix': prefix if isinstance(prefix, str) else None,
+                'source': self.sources.get(name)})
+        return entries
+
+    def write_manifest(self, path):
+        """
+        Save `LoadCache.manifest` as JSON for use by other programs.
+
+        The file is written atomically, and only if its contents would change.
+
+        Parameters
+        ----------
+        path: ``str`` or ``Path``
+
+        Returns
+        -------
+        written: ``bool``
+            ``True`` if the file was written
+        """
+        contents = dict(module=self.module, objects=self.manifest())
+        try:
+            with open(str(path), 'r') as f:
+                if json.load(f) == contents:
+                    logger.debug('Manifest %s is up to date', path)
+                    return False
+        except (OSError, ValueError):
+            pass
+        return write_json(path, contents)
+
+
+def _obj_class(obj):
+    """
+    The class of an object, without loading a `LazyDevice`.
+    """
+    if isinstance(obj, LazyDevice):
+        return obj.lazy_class
+    return obj.__class__
+
+
+def _get_attr(obj, attr):
+    """
+    ``getattr`` that returns ``None`` instead of raising any error.
+    """
+    if obj is None or isinstance(obj, LazyDevice):
+        return None
+    try:
+        return getattr(obj, attr, None)
+    except Exception:
+        return None
 
 
 # For writing the files
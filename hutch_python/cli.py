@@ -2,24 +2,21 @@
 This module defines the command-line interface arguments for the
 ``hutch-python`` script. It also provides utilities that are only used at
 startup.
+
+Large dependencies like ``IPython``, ``matplotlib``, ``cookiecutter`` and the
+device loading modules are imported inside the functions that use them, so
+that options like ``--create`` and ``--help`` start quickly.
 """
 from pathlib import Path
 import argparse
 import logging
-import matplotlib.pyplot as plt
 import os
 import sys
 
-from IPython.terminal.embed import InteractiveShellEmbed
-from cookiecutter.main import cookiecutter
-from pcdsdaq.sim import set_sim_mode as set_daq_sim
-
-from .bug import BugMagics
 from .constants import CONDA_BASE, DIR_MODULE
-from .ipython_log import init_ipython_logger
-from .load_conf import load
 from .log_setup import (setup_logging, set_console_level, debug_mode,
-                        debug_context, debug_wrapper)
+                        debug_context, debug_wrapper, get_debug_handler)
+from .timing import startup_timer
 
 logger = logging.getLogger(__name__)
 opts_cache = {}
@@ -35,6 +32,15 @@ parser.add_argument('--sim', action='store_true', default=False,
                     help='Run with simulated DAQ')
 parser.add_argument('--create', action='store', default=False,
                     help='Create a new hutch deployment')
+parser.add_argument('--profile-startup', action='store_true', default=False,
+                    help='Show and save the time taken by each startup step')
+parser.add_argument('--json-log', action='store_true', default=False,
+                    help='Also write the log as JSON, for log_query')
+parser.add_argument('--log-queue', action='store_true', default=False,
+                    help=('Write the log files on a background thread, '
+                          'dropping messages if it falls behind'))
+parser.add_argument('--clean-logs', action='store_true', default=False,
+                    help='Delete your own old log files')
 parser.add_argument('script', nargs='?',
                     help='Run a script instead of running interactively')
 
@@ -65,7 +71,8 @@ def setup_cli_env():
         log_dir = None
     else:
         log_dir = os.path.join(os.path.dirname(args.cfg), 'logs')
-    setup_logging(dir_logs=log_dir)
+    setup_logging(dir_logs=log_dir, use_queue=args.log_queue,
+                  structured=args.json_log, use_retention=args.clean_logs)
 
     # Debug mode next
     if args.debug:
@@ -86,19 +93,29 @@ def setup_cli_env():
             env = os.environ['CONDA_DEFAULT_ENV']
         logger.info(('Creating hutch-python dir for hutch %s using'
                      ' base=%s env=%s'), hutch, base, env)
+        from cookiecutter.main import cookiecutter
         cookiecutter(str(DIR_MODULE / 'cookiecutter'), no_input=True,
                      extra_context=dict(base=base, env=env, hutch=hutch))
         return {}
 
     # Now other flags
     if args.sim:
+        from pcdsdaq.sim import set_sim_mode as set_daq_sim
         set_daq_sim(True)
 
     # Save whether we are an interactive session or a script session
     opts_cache['script'] = args.script
 
     # Load objects based on the configuration file
-    objs = load(cfg=args.cfg)
+    from .load_conf import load
+    if args.profile_startup:
+        startup_timer.clear()
+        startup_timer.enabled = True
+    with startup_timer.time('startup', kind='total'):
+        objs = load(cfg=args.cfg)
+    if args.profile_startup:
+        startup_timer.enabled = False
+        report_startup_timing()
 
     # Add cli debug tools
     objs['_debug_console_level'] = set_console_level
@@ -109,6 +126,29 @@ def setup_cli_env():
     return objs
 
 
+def report_startup_timing():
+    """
+    Show the startup timing table and save it next to the session log.
+
+    The table from `timing.startup_timer` is logged at the ``INFO`` level.
+    If there is a log file, the timing records are also saved as
+    ``{log name}_startup.json`` in the same directory.
+    """
+    logger.info('Startup timing, slowest first:\n%s', startup_timer.table())
+    try:
+        handler = get_debug_handler()
+    except RuntimeError:
+        logger.debug('No log file, skip saving startup timing')
+        return
+    log_path = Path(handler.baseFilename)
+    json_path = log_path.with_name(log_path.stem + '_startup.json')
+    try:
+        startup_timer.save(json_path)
+        logger.info('Saved startup timing to %s', json_path)
+    except OSError:
+        logger.warning('Unable to save startup timing to %s', json_path)
+
+
 def hutch_ipython_embed(stack_offset=0):
     """
     Make a shell, customize it, then run it
@@ -126,6 +166,10 @@ def hutch_ipython_embed(stack_offset=0):
     # 1 = whoever called this function
     # + 1 = 2 because this is used inside the shell call
     # + stack_offset for extra levels between this call and user space
+    import matplotlib.pyplot as plt
+    from IPython.terminal.embed import InteractiveShellEmbed
+    from .bug import BugMagics
+    from .ipython_log import init_ipython_logger
     shell = InteractiveShellEmbed.instance()
     init_ipython_logger(shell)
     shell.enable_matplotlib()
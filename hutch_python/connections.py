@@ -0,0 +1,257 @@
+"""
+This module checks which of the loaded devices are connected. Rather than
+checking each device in turn, `connection_report` watches every signal at
+once and stops waiting at a single deadline, so a session with many offline
+IOCs is checked in about the time of one timeout.
+"""
+from collections import namedtuple
+from threading import Thread
+import logging
+import time
+
+from ophyd import Device
+
+from .constants import CONNECTION_TIMEOUT
+from .lazy import LazyDevice
+from .utils import extract_objs
+
+logger = logging.getLogger(__name__)
+
+CONNECTED = 'connected'
+PARTIAL = 'partial'
+DISCONNECTED = 'disconnected'
+
+DeviceConnection = namedtuple('DeviceConnection',
+                              ['name', 'status', 'connected', 'total',
+                               'missing'])
+DeviceConnection.__doc__ = """
+The connection status of one device, from `connection_report`.
+
+``status`` is ``connected``, ``partial`` or ``disconnected``, ``connected``
+and ``total`` count the device's signals, and ``missing`` lists the dotted
+names of the signals that did not connect.
+"""
+
+
+class ConnectionReport:
+    """
+    The result of `connection_report`.
+
+    Attributes
+    ----------
+    devices: ``dict``
+        Mapping from device name to `DeviceConnection`, sorted by name
+
+    elapsed: ``float``
+        The number of seconds spent waiting for the signals
+    """
+    def __init__(self, devices, elapsed):
+        self.devices = {name: devices[name] for name in sorted(devices)}
+        self.elapsed = elapsed
+
+    def names(self, status):
+        """
+        The names of the devices with a given status.
+
+        Parameters
+        ----------
+        status: ``str``
+            ``connected``, ``partial`` or ``disconnected``
+        """
+        return [name for name, dev in self.devices.items()
+                if dev.status == status]
+
+    @property
+    def connected(self):
+        """
+        The names of the devices with every signal connected.
+        """
+        return self.names(CONNECTED)
+
+    @property
+    def partial(self):
+        """
+        The names of the devices with only some signals connected.
+        """
+        return self.names(PARTIAL)
+
+    @property
+    def disconnected(self):
+        """
+        The names of the devices with no signals connected.
+        """
+        return self.names(DISCONNECTED)
+
+    def summary(self):
+        """
+        One line count of the devices with each status.
+        """
+        return ('{} connected, {} partially connected, {} disconnected '
+                'after {:.1f}s'.format(len(self.connected), len(self.partial),
+                                       len(self.disconnected), self.elapsed))
+
+    def table(self):
+        """
+        Create a text table of the devices that are not fully connected.
+
+        Returns
+        -------
+        table: ``str``
+        """
+        problems = [dev for dev in self.devices.values()
+                    if dev.status != CONNECTED]
+        width = max([len(dev.name) for dev in problems] + [6])
+        row = '{:<%d} {:<12} {:>9} {}' % width
+        lines = [row.format('device', 'status', 'signals', 'missing')]
+        for dev in problems:
+            lines.append(row.format(dev.name, dev.status,
+                                    '{}/{}'.format(dev.connected, dev.total),
+                                    ', '.join(dev.missing)))
+        lines.append(self.summary())
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.table()
+
+
+def connection_report(objs=None, timeout=CONNECTION_TIMEOUT, poll=0.05):
+    """
+    Check the connection status of every device.
+
+    All of the signals are checked together, and each check is repeated
+    until every signal is connected or ``timeout`` seconds have passed in
+    total. A `LazyDevice` that has not been loaded is not checked, because
+    that would create it.
+
+    Parameters
+    ----------
+    objs: ``dict``, optional
+        Mapping from name to object. Objects that are not ``ophyd`` devices
+        or signals are ignored. If omitted, check everything in
+        ``hutch_python.db``.
+
+    timeout: ``float``, optional
+        The total number of seconds to wait for the signals to connect
+
+    poll: ``float``, optional
+        The number of seconds to wait between checks
+
+    Returns
+    -------
+    report: `ConnectionReport`
+    """
+    if objs is None:
+        objs = extract_objs(scope='hutch_python.db')
+    devices = {}
+    for name, obj in objs.items():
+        signals = device_signals(obj)
+        if signals:
+            devices[name] = signals
+
+    start = time.monotonic()
+    deadline = start + timeout
+    pending = [(name, attr, signal) for name, signals in devices.items()
+               for attr, signal in signals]
+    while True:
+        pending = [item for item in pending if not _is_connected(item[2])]
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(poll)
+    elapsed = time.monotonic() - start
+
+    missing = {}
+    for name, attr, signal in pending:
+        missing.setdefault(name, []).append(attr)
+    results = {}
+    for name, signals in devices.items():
+        dev_missing = missing.get(name, [])
+        total = len(signals)
+        connected = total - len(dev_missing)
+        if connected == total:
+            status = CONNECTED
+        elif connected == 0:
+            status = DISCONNECTED
+        else:
+            status = PARTIAL
+        results[name] = DeviceConnection(name, status, connected, total,
+                                         dev_missing)
+    return ConnectionReport(results, elapsed)
+
+
+def device_signals(obj):
+    """
+    Find the signals to check for one object.
+
+    Parameters
+    ----------
+    obj: ``object``
+
+    Returns
+    -------
+    signals: ``list`` of ``(str, Signal)``
+        The dotted name and signal for each of the object's non-lazy signals.
+        A signal that is not part of a device has an empty name, and objects
+        that are not ``ophyd`` devices or signals have no signals.
+    """
+    if isinstance(obj, LazyDevice):
+        if not obj.lazy_loaded:
+            return []
+        obj = obj.lazy_load()
+    if isinstance(obj, Device):
+        return [(walk.dotted_name, walk.item)
+                for walk in obj.walk_signals(include_lazy=False)]
+    elif hasattr(type(obj), 'connected'):
+        return [('', obj)]
+    return []
+
+
+def _is_connected(signal):
+    try:
+        return bool(signal.connected)
+    except Exception:
+        logger.debug('Error checking connection of %s', signal, exc_info=True)
+        return False
+
+
+def log_connection_report(report):
+    """
+    Log a `ConnectionReport`, with a warning if anything did not connect.
+    """
+    if report.partial or report.disconnected:
+        logger.warning('Some devices did not connect: %s', report.summary())
+        logger.info('Connection report:\n%s', report.table())
+    else:
+        logger.info('All devices connected: %s', report.summary())
+
+
+def start_connection_report(objs=None, timeout=CONNECTION_TIMEOUT,
+                            callback=log_connection_report):
+    """
+    Run `connection_report` in a background thread.
+
+    Parameters
+    ----------
+    objs: ``dict``, optional
+        See `connection_report`
+
+    timeout: ``float``, optional
+        See `connection_report`
+
+    callback: ``callable``, optional
+        Called with the `ConnectionReport` when it is done. The default is to
+        log the report.
+
+    Returns
+    -------
+    thread: ``Thread``
+    """
+    def run():
+        try:
+            callback(connection_report(objs=objs, timeout=timeout))
+        except Exception:
+            logger.error('Error checking device connections')
+            logger.debug('', exc_info=True)
+
+    thread = Thread(target=run, name='connection_report', daemon=True)
+    thread.start()
+    return thread
@@ -2,8 +2,14 @@ from pathlib import Path
 
 CONDA_BASE = Path('/reg/g/pcds/pyps/conda/py36')
 
+CONNECTION_TIMEOUT = 5
+
 CUR_EXP_SCRIPT = '/reg/g/pcds/engineering_tools/{0}/scripts/get_curr_exp {0}'
 
+CUR_EXP_TTL = 60
+
+CUR_EXP_MAX_AGE = 0
+
 CLASS_SEARCH_PATH = ['pcdsdevices.device_types']
 
 DIR_MODULE = Path(__file__).resolve().parent
@@ -21,6 +27,11 @@ HUTCH_COLORS = dict(
 
 INPUT_LEVEL = 5
 
+QS_CACHE_TTL = 3600
+
 SUCCESS_LEVEL = 35
 
-VALID_KEYS = ('hutch', 'db', 'load', 'experiment', 'daq_platform')
+VALID_KEYS = ('hutch', 'db', 'load', 'experiment', 'daq_platform',
+              'device_workers', 'lazy_devices', 'qs_cache_ttl',
+              'check_connections', 'experiment_max_age', 'warm_start',
+              'skip_output')
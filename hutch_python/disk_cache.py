@@ -0,0 +1,204 @@
+"""
+This module provides helpers for the small JSON files that ``hutch-python``
+keeps in the hutch's ``.cache`` directory to speed up the next startup. Each
+file stores a ``key`` that describes the inputs that produced the data, and
+the data is only used if the ``key`` still matches.
+
+Some of these files name the classes to import for the session's devices, so
+each user gets their own subdirectory that only they can change.
+"""
+from pathlib import Path
+import getpass
+import json
+import logging
+import os
+import stat
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# The shared .cache directory lets the hutch's group add their own
+# subdirectories. The sticky bit stops them from renaming or removing each
+# other's, and the setgid bit gives new entries the directory's group.
+CACHE_DIR_MODE = 0o3775
+# Each user's subdirectory and its files are private
+USER_CACHE_MODE = 0o700
+CACHE_FILE_MODE = 0o600
+# Files that are written for other programs, e.g. the session manifest
+SHARED_FILE_MODE = 0o664
+
+# The process umask, for files written with the same permissions as open
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def get_cache_dir(hutch_dir):
+    """
+    Find or create the current user's cache directory for a hutch.
+
+    This is ``.cache/<user>`` in the hutch's directory. Only the user can
+    read or change it. The shared ``.cache`` directory can be written to by
+    the hutch's group, but each member can only remove their own
+    subdirectory. A subdirectory that we own with looser permissions is
+    corrected, and one that is owned by someone else is not used.
+
+    Parameters
+    ----------
+    hutch_dir: ``str`` or ``Path``, optional
+        The hutch's launch directory
+
+    Returns
+    -------
+    cache_dir: ``Path`` or ``None``
+        ``None`` if ``hutch_dir`` is ``None`` or the directory could not be
+        created or trusted.
+    """
+    if hutch_dir is None:
+        return None
+    shared_dir = Path(hutch_dir) / '.cache'
+    cache_dir = shared_dir / getpass.getuser()
+    try:
+        for path, mode in ((shared_dir, CACHE_DIR_MODE),
+                           (cache_dir, USER_CACHE_MODE)):
+            if not path.exists():
+                path.mkdir()
+                path.chmod(mode)
+        _restrict_mode(shared_dir, ~stat.S_IWOTH)
+        _restrict_mode(cache_dir, USER_CACHE_MODE)
+    except OSError:
+        logger.warning('Unable to create cache directory %s', cache_dir)
+        logger.debug('', exc_info=True)
+        return None
+    info = cache_dir.stat()
+    if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        logger.warning('Not using cache directory %s, it can be changed by '
+                       'other users', cache_dir)
+        return None
+    return cache_dir
+
+
+def _restrict_mode(path, allowed):
+    """
+    Remove the permissions outside of ``allowed`` from a path that we own.
+    """
+    info = path.stat()
+    mode = stat.S_IMODE(info.st_mode)
+    if mode & ~allowed and info.st_uid == os.getuid():
+        path.chmod(mode & allowed)
+
+
+def normalize_key(key):
+    """
+    Convert ``key`` to the form it will have after a trip through JSON.
+
+    This makes sure that tuples and lists, or int and str dict keys, compare
+    equal to what we read back from the file.
+    """
+    return json.loads(json.dumps(key, sort_keys=True))
+
+
+def read_cache(path, key=None):
+    """
+    Read the data from a cache file.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``
+        The cache file
+
+    key: ``object``, optional
+        JSON-compatible description of the inputs. If provided, the data is
+        only returned if it was written with an equal ``key``.
+
+    Returns
+    -------
+    data: ``object`` or ``None``
+        ``None`` if the file is missing, unreadable, or has a different
+        ``key``.
+    """
+    try:
+        with open(str(path), 'r') as f:
+            contents = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.debug('Unable to read cache file %s', path, exc_info=True)
+        return None
+    if key is not None and contents.get('key') != normalize_key(key):
+        logger.debug('Cache file %s is out of date', path)
+        return None
+    return contents.get('data')
+
+
+def write_cache(path, data, key=None, mode=CACHE_FILE_MODE):
+    """
+    Write data to a cache file.
+
+    The file is written atomically using `write_json`. Failures are logged but
+    not raised, because a cache is never required.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``
+        The cache file
+
+    data: ``object``
+        JSON-compatible data to save
+
+    key: ``object``, optional
+        JSON-compatible description of the inputs, see `read_cache`.
+
+    mode: ``int``, optional
+        The file's permissions, see `write_json`
+
+    Returns
+    -------
+    success: ``bool``
+    """
+    contents = dict(key=normalize_key(key), data=data)
+    return write_json(path, contents, mode=mode)
+
+
+def write_json(path, contents, mode=SHARED_FILE_MODE):
+    """
+    Write any JSON-compatible object to a file.
+
+    The file is written to a temporary file first and then moved into place,
+    so other processes never see a partially written file. Failures are
+    logged but not raised.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``
+
+    contents: ``object``
+        JSON-compatible data to save
+
+    mode: ``int``, optional
+        The file's permissions. The default lets the hutch's group, but not
+        other users, change the file. Use ``None`` to follow the umask like a
+        file created with ``open``.
+
+    Returns
+    -------
+    success: ``bool``
+    """
+    path = Path(path)
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=str(path.parent),
+                                        prefix=path.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(contents, f)
+            if mode is None:
+                mode = 0o666 & ~_umask
+            os.chmod(tmp_name, mode)
+            os.replace(tmp_name, str(path))
+        except Exception:
+            os.remove(tmp_name)
+            raise
+    except (OSError, TypeError, ValueError):
+        logger.warning('Unable to write file %s', path)
+        logger.debug('', exc_info=True)
+        return False
+    return True
@@ -1,20 +1,229 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
 
 import happi
 import lightpath
 from lightpath.config import beamlines
-from happi.loader import load_devices
+from happi.backends.json_db import JSONBackend
+from happi.loader import from_container
+
+from .disk_cache import read_cache, write_cache
+from .lazy import LazyDevice
+from .timing import startup_timer
 
 logger = logging.getLogger(__name__)
 
+# Shared clients, keyed by database path
+_clients = {}
+_clients_lock = Lock()
+
 
-def get_happi_objs(db, hutch):
+class IndexedBackend(JSONBackend):
     """
-    Get the relevant devices for ``hutch`` from ``db``.
+    ``happi`` JSON backend that reads its file only once.
 
-    This depends on a JSON ``happi`` database stored somewhere in the file
-    system and handles setting up the ``happi.Client`` and querying the data
-    base for devices.
+    The parsed database is kept in memory and indexed by ``_id`` and by
+    ``beamline`` and ``active``, with each beamline sorted by ``z``. Searches
+    that include these keys only check the matching documents instead of
+    rereading and scanning the whole file.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``, optional
+        Path to the JSON database
+
+    docs: ``dict``, optional
+        Already parsed documents, keyed by ``_id``. If provided, the file at
+        ``path`` is never read.
+    """
+    def __init__(self, path=None, docs=None):
+        super().__init__(str(path) if path is not None else None)
+        self._lock = Lock()
+        self._docs = docs
+        self._by_beamline = None
+
+    def load(self):
+        """
+        Return the parsed database, reading the file on the first call.
+        """
+        with self._lock:
+            if self._docs is None:
+                logger.debug('Reading happi database %s', self.path)
+                self._docs = super().load()
+            return self._docs
+
+    def store(self, db):
+        """
+        Save the database and update the in-memory copy.
+        """
+        super().store(db)
+        with self._lock:
+            self._docs = db
+            self._by_beamline = None
+
+    def beamline_index(self):
+        """
+        Mapping from ``(beamline, active)`` to documents sorted by ``z``.
+        """
+        db = self.load()
+        with self._lock:
+            if self._by_beamline is None:
+                index = {}
+                for doc in sorted(db.values(), key=_z_key):
+                    key = (doc.get('beamline'), doc.get('active'))
+                    index.setdefault(key, []).append(doc)
+                self._by_beamline = index
+            return self._by_beamline
+
+    def find(self, multiples=False, **kwargs):
+        """
+        Find the document or documents that match all of ``kwargs``.
+        """
+        if '_id' in kwargs:
+            doc = self.load().get(kwargs['_id'])
+            candidates = [doc] if doc is not None else []
+        elif 'beamline' in kwargs and 'active' in kwargs:
+            key = (kwargs['beamline'], kwargs['active'])
+            candidates = self.beamline_index().get(key, [])
+        else:
+            candidates = sorted(self.load().values(), key=_z_key)
+        matches = [doc for doc in candidates
+                   if all(doc.get(key) == value
+                          for key, value in kwargs.items())]
+        if multiples:
+            return matches
+        elif matches:
+            return matches[0]
+        else:
+            return None
+
+
+def _z_key(doc):
+    # Sort documents without z to the end
+    z = doc.get('z')
+    return (z is None, z or 0)
+
+
+def get_happi_client(db):
+    """
+    Get the shared ``happi.Client`` for a database file.
+
+    The same client, backed by an `IndexedBackend`, is returned for every
+    call with the same ``db`` so that the file is read once per session. If
+    the file has been modified since the client was made, a new client is
+    created.
+
+    Parameters
+    ----------
+    db: ``str`` or ``Path``
+        Path to database
+
+    Returns
+    -------
+    client: ``happi.Client``
+    """
+    path = Path(db).resolve()
+    stat = path.stat()
+    key = (stat.st_mtime, stat.st_size)
+    with _clients_lock:
+        try:
+            old_key, client = _clients[str(path)]
+            if old_key == key:
+                return client
+        except KeyError:
+            pass
+        client = happi.Client(database=IndexedBackend(path))
+        _clients[str(path)] = (key, client)
+        return client
+
+
+def get_hutch_client(db, hutch, cache_dir=None):
+    """
+    Get a ``happi.Client`` for the devices that ``hutch`` needs.
+
+    If ``cache_dir`` is provided, the database documents found by
+    `search_hutch` are saved there, along with the database file's
+    modification time and size and the ``lightpath`` configuration for the
+    hutch. The next call with the same inputs skips reading and searching the
+    full database and returns a client that only contains the saved
+    documents. If anything has changed, the full database is searched again
+    and the saved documents are replaced.
+
+    Parameters
+    ----------
+    db: ``str`` or ``Path``
+        Path to database
+
+    hutch: ``str``
+        Name of hutch
+
+    cache_dir: ``Path``, optional
+        Directory for the saved search results. If omitted, this returns the
+        full client from `get_happi_client`.
+
+    Returns
+    -------
+    client: ``happi.Client``
+    """
+    if cache_dir is None:
+        return get_happi_client(db)
+    path = Path(db).resolve()
+    key = database_key(path, hutch)
+    snapshot = Path(cache_dir) / 'happi_{}.json'.format(hutch.lower())
+    with _clients_lock:
+        try:
+            old_key, client = _clients[str(snapshot)]
+            if old_key == key:
+                return client
+        except KeyError:
+            pass
+    docs = read_cache(snapshot, key=key)
+    if docs is None:
+        logger.debug('Searching %s for %s devices', path, hutch)
+        full_client = get_happi_client(path)
+        names = set(container.name
+                    for container in search_hutch(full_client, hutch))
+        docs = {_id: doc for _id, doc in full_client.backend.load().items()
+                if doc.get('name') in names}
+        write_cache(snapshot, docs, key=key)
+    else:
+        logger.debug('Using saved happi search results from %s', snapshot)
+    client = happi.Client(database=IndexedBackend(docs=docs))
+    with _clients_lock:
+        _clients[str(snapshot)] = (key, client)
+    return client
+
+
+def database_key(db, hutch):
+    """
+    Describe everything that the ``happi`` search for ``hutch`` depends on.
+
+    Parameters
+    ----------
+    db: ``str`` or ``Path``
+        Path to database
+
+    hutch: ``str``
+        Name of hutch
+
+    Returns
+    -------
+    key: ``dict``
+        The database path, modification time and size, and the hutch name and
+        its ``lightpath`` configuration.
+    """
+    path = Path(db).resolve()
+    stat = path.stat()
+    return dict(db=str(path), mtime=stat.st_mtime_ns, size=stat.st_size,
+                hutch=hutch.upper(),
+                beamlines=beamlines.get(hutch.upper()) or {})
+
+
+def get_happi_docs(db, hutch, names, cache_dir=None):
+    """
+    Get the database documents for some of the hutch's devices.
 
     Parameters
     ----------
@@ -24,13 +233,66 @@ def get_happi_objs(db, hutch):
     hutch: ``str``
         Name of hutch
 
+    names: ``list`` of ``str``
+        The device names to find
+
+    cache_dir: ``Path``, optional
+        See `get_hutch_client`
+
+    Returns
+    -------
+    docs: ``list`` of ``dict``
+        The documents, in the same order as ``names``. Names that are not in
+        the database are skipped.
+    """
+    client = get_hutch_client(db, hutch, cache_dir=cache_dir)
+    by_name = {doc.get('name'): doc for doc in client.backend.load().values()}
+    return [by_name[name] for name in names if name in by_name]
+
+
+def load_docs(docs, max_workers=None, lazy=False):
+    """
+    Instantiate the devices described by database documents.
+
+    Parameters
+    ----------
+    docs: ``list`` of ``dict``
+        Documents from `get_happi_docs`
+
+    max_workers: ``int``, optional
+        See `load_containers`
+
+    lazy: ``bool``, optional
+        See `load_containers`
+
     Returns
     -------
     objs: ``dict``
-        A mapping from device name to device
+        A mapping from device name to device, in the same order as ``docs``
+    """
+    client = happi.Client(database=IndexedBackend(
+        docs={doc['_id']: doc for doc in docs}))
+    containers = [client.find_device(_id=doc['_id']) for doc in docs]
+    return load_containers(*containers, max_workers=max_workers, lazy=lazy)
+
+
+def search_hutch(client, hutch):
+    """
+    Find the ``happi`` containers for ``hutch`` and its upstream beamlines.
+
+    Parameters
+    ----------
+    client: ``happi.Client``
+
+    hutch: ``str``
+        Name of hutch
+
+    Returns
+    -------
+    containers: ``list``
+        The active containers on the hutch's beamline and in the
+        ``lightpath`` bounds of each upstream beamline.
     """
-    # Load the happi Client
-    client = happi.Client(path=db)
     containers = list()
     # Find upstream devices based on lightpath configuration
     beamline_conf = beamlines.get(hutch.upper())
@@ -39,7 +301,8 @@ def get_happi_objs(db, hutch):
         logger.warning("Unable to find lightpath for %s",
                        hutch.upper())
         beamline_conf = {}
-    # Add the complete hutch beamline
+    # Add the complete hutch beamline, without changing the lightpath config
+    beamline_conf = dict(beamline_conf)
     beamline_conf[hutch.upper()] = {}
     # Base beamline
     for beamline, conf in beamline_conf.items():
@@ -55,12 +318,104 @@ def get_happi_objs(db, hutch):
         else:
             logger.warning("No devices found in database for %s",
                            beamline.upper())
+    return containers
+
+
+def get_happi_objs(db, hutch, max_workers=None, lazy=False, cache_dir=None):
+    """
+    Get the relevant devices for ``hutch`` from ``db``.
+
+    This depends on a JSON ``happi`` database stored somewhere in the file
+    system and handles querying the client from `get_hutch_client` for
+    devices.
+
+    Parameters
+    ----------
+    db: ``str``
+        Path to database
+
+    hutch: ``str``
+        Name of hutch
+
+    max_workers: ``int``, optional
+        Number of threads to use to instantiate the devices. See
+        `load_containers`.
+
+    lazy: ``bool``, optional
+        If ``True``, return `LazyDevice` placeholders instead of devices. See
+        `load_containers`.
+
+    cache_dir: ``Path``, optional
+        Directory to save the search results in. See `get_hutch_client`.
+
+    Returns
+    -------
+    objs: ``dict``
+        A mapping from device name to device
+    """
+    client = get_hutch_client(db, hutch, cache_dir=cache_dir)
+    containers = search_hutch(client, hutch)
     # Instantiate the devices needed
-    dev_namespace = load_devices(*containers, pprint=False)
-    return dev_namespace.__dict__
+    return load_containers(*containers, max_workers=max_workers, lazy=lazy)
 
 
-def get_lightpath(db, hutch):
+def load_containers(*containers, max_workers=None, lazy=False):
+    """
+    Instantiate the devices described by ``happi`` containers.
+
+    This does the same job as ``happi.loader.load_devices``, but each device
+    is timed separately using `timing.startup_timer` and the devices can be
+    created on a thread pool. A device that fails to load does not stop the
+    others. Instead, the exception is logged and put in place of the device so
+    that it can be inspected.
+
+    Parameters
+    ----------
+    *containers:
+        The ``happi`` containers to load
+
+    max_workers: ``int``, optional
+        Number of threads to use to instantiate the devices. If omitted or
+        less than two, the devices are created one at a time.
+
+    lazy: ``bool``, optional
+        If ``True``, do not create any devices. Instead, return a `LazyDevice`
+        for each container that will create the device when it is first used.
+
+    Returns
+    -------
+    objs: ``dict``
+        A mapping from device name to device, in the same order as
+        ``containers`` regardless of ``max_workers``.
+    """
+    if lazy:
+        return {container.name: LazyDevice.from_container(container)
+                for container in containers}
+    if max_workers is None or max_workers < 2 or len(containers) < 2:
+        loaded = [_load_container(container) for container in containers]
+    else:
+        logger.debug('Loading %s devices with %s threads',
+                     len(containers), max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            loaded = list(executor.map(_load_container, containers))
+    return {container.name: obj
+            for container, obj in zip(containers, loaded)}
+
+
+def _load_container(container):
+    """
+    Instantiate one device, returning the exception if it fails.
+    """
+    with startup_timer.time(container.name, kind='device'):
+        try:
+            return from_container(container)
+        except Exception as exc:
+            logger.error('Failed to load device %s', container.name)
+            logger.debug(exc, exc_info=True)
+            return exc
+
+
+def get_lightpath(db, hutch, cache_dir=None):
     """
     Create a lightpath from relevant ``happi`` objects.
 
@@ -72,14 +427,16 @@ def get_lightpath(db, hutch):
     hutch: ``str``
         Name of hutch
 
+    cache_dir: ``Path``, optional
+        Directory to save the search results in. See `get_hutch_client`.
+
     Returns
     -------
     path: ``lightpath.BeamPath``
         Object that provides a convenient way to visualize all the devices
         that may block the beam on the way to the interaction point.
     """
-    # Load the happi Client
-    client = happi.Client(path=db)
+    client = get_hutch_client(db, hutch, cache_dir=cache_dir)
     # Allow the lightpath module to create a path
     lc = lightpath.LightController(client, endstations=[hutch.upper()])
     # Return the BeamPath object created by the LightController
@@ -4,6 +4,8 @@ tracebacks to a custom ``logger.input`` level. The ``INPUT`` level is lower
 than the ``DEBUG`` level to avoid a terminal echo in debug mode.
 """
 import sys
+import reprlib
+import collections
 import traceback
 import functools
 import logging
@@ -13,6 +15,143 @@ from .constants import INPUT_LEVEL
 logger = logging.getLogger(__name__)
 logger.input = functools.partial(logger.log, INPUT_LEVEL)
 
+# Longest output to log, the max tweet length
+OUTPUT_LIMIT = 280
+
+# Output types that are never converted to text, see skip_output
+_skip_types = set()
+
+
+# Built-in containers that OutputRepr shortens, the same text as str
+_container_types = (list, tuple, dict, set, frozenset, collections.deque)
+
+
+class OutputRepr(reprlib.Repr):
+    """
+    ``reprlib.Repr`` that shortens outputs without building their full text.
+
+    Containers only show their first few items, and ``numpy`` arrays and
+    ``pandas`` tables are summarized by their own libraries using only the
+    rows and columns at the edges. Other objects use their usual ``repr``,
+    cut down to ``maxother`` characters. See `short_repr` for the outputs
+    that are shortened this way.
+    """
+    def __init__(self, limit=OUTPUT_LIMIT):
+        super().__init__()
+        self.maxlevel = 3
+        self.maxtuple = self.maxlist = self.maxarray = 20
+        self.maxdict = self.maxset = self.maxfrozenset = self.maxdeque = 10
+        self.maxstring = self.maxlong = self.maxother = limit
+        self.edgeitems = 3
+
+    def repr_ndarray(self, x, level):
+        numpy = sys.modules.get('numpy')
+        if numpy is None or not isinstance(x, numpy.ndarray):
+            return self.repr_instance(x, level)
+        if level == self.maxlevel:
+            # The output itself, written like str
+            text = numpy.array2string(x, threshold=self.maxarray,
+                                      edgeitems=self.edgeitems)
+        else:
+            # An item in a container, written like repr
+            text = 'array({})'.format(numpy.array2string(
+                x, threshold=self.maxarray, edgeitems=self.edgeitems,
+                separator=', '))
+        return text[:self.maxother]
+
+    def repr_DataFrame(self, x, level):
+        return self._repr_pandas(x, level, max_cols=self.edgeitems * 2)
+
+    def repr_Series(self, x, level):
+        return self._repr_pandas(x, level, name=True, dtype=True)
+
+    def _repr_pandas(self, x, level, **kwargs):
+        if not type(x).__module__.startswith('pandas'):
+            return self.repr_instance(x, level)
+        return x.to_string(max_rows=self.edgeitems * 2,
+                           **kwargs)[:self.maxother]
+
+
+_output_repr = OutputRepr()
+
+
+def skip_output(*types):
+    """
+    Stop logging the text of some types of output.
+
+    Outputs of these types, or their subclasses, are logged by their class
+    name only. Use this for outputs that are slow to convert to text.
+
+    Parameters
+    ----------
+    *types: ``type`` or ``str``
+        The classes, or their names including any parent package of their
+        module, e.g. ``'pandas.DataFrame'``. Names avoid importing the module
+        just to skip its types.
+    """
+    for cls in types:
+        if not isinstance(cls, str):
+            cls = '{}.{}'.format(cls.__module__, cls.__qualname__)
+        _skip_types.add(cls)
+
+
+def short_repr(obj, limit=OUTPUT_LIMIT):
+    """
+    Describe an output in at most ``limit`` characters.
+
+    This is the start of ``str(obj)``. Built-in containers, ``numpy`` arrays
+    and ``pandas`` tables are shortened by `OutputRepr` first, so only the
+    items that are shown are converted to text.
+
+    Parameters
+    ----------
+    obj: ``object``
+
+    limit: ``int``, optional
+        The most characters to return
+
+    Returns
+    -------
+    text: ``str``
+        The start of ``obj`` as text, or just its class name if it is one of
+        the types given to `skip_output`.
+    """
+    for cls in type(obj).__mro__:
+        if any(_type_matches(cls, name) for name in _skip_types):
+            return '<{}.{} object>'.format(type(obj).__module__,
+                                           type(obj).__qualname__)
+    if not _summarized(obj):
+        return str(obj)[:limit]
+    if limit == OUTPUT_LIMIT:
+        output_repr = _output_repr
+    else:
+        output_repr = OutputRepr(limit=limit)
+    return output_repr.repr(obj)[:limit]
+
+
+def _summarized(obj):
+    """
+    Check if `OutputRepr` can shorten ``obj`` without changing its text.
+    """
+    if type(obj) in _container_types:
+        return True
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and type(obj) is numpy.ndarray:
+        return True
+    pandas = sys.modules.get('pandas')
+    return (pandas is not None
+            and type(obj) in (pandas.DataFrame, pandas.Series))
+
+
+def _type_matches(cls, name):
+    """
+    Check if ``name`` is ``cls``, allowing for names from a parent package.
+    """
+    module, _, qualname = name.rpartition('.')
+    return (cls.__qualname__ == qualname
+            and (cls.__module__ == module
+                 or cls.__module__.startswith(module + '.')))
+
 
 class IPythonLogger:
     """
@@ -48,7 +187,7 @@ class IPythonLogger:
             try:
                 last_out = self.Out[line_num]
                 # Convert to string, limit to max tweet length
-                last_out = str(last_out)[:280]
+                last_out = short_repr(last_out)
                 logger.input('Out [{}]: {}'.format(line_num, last_out))
             except KeyError:
                 pass
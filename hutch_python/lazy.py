@@ -0,0 +1,181 @@
+"""
+This module provides placeholders for objects that should only be created
+when they are first used. This is used for the optional lazy loading of
+``happi`` devices, where most of the devices in a session are never touched.
+"""
+from functools import partial, reduce
+from threading import RLock
+import logging
+
+from .utils import find_class
+
+logger = logging.getLogger(__name__)
+
+
+class LazyDevice:
+    """
+    Stand-in for an object that is created on first attribute access.
+
+    Any attribute access other than ``name`` and ``md`` will create the real
+    object and forward the access to it. Before the object exists, ``name``
+    and ``md`` are answered from the metadata given here, which lets
+    namespaces group the object without creating it.
+
+    Functions that check the type or identity of an object will see the
+    `LazyDevice`, not the real object. Use `LazyDevice.lazy_load` to get the
+    real object in these cases.
+
+    Parameters
+    ----------
+    loader: ``callable``
+        Function with no arguments that creates the real object
+
+    name: ``str``
+        The name of the object
+
+    cls: ``type`` or ``str``, optional
+        The class that ``loader`` will return, or its import path.
+
+    md: ``object``, optional
+        The ``happi`` container that describes the object.
+    """
+    __slots__ = ('_lazy_loader', '_lazy_name', '_lazy_cls', '_lazy_md',
+                 '_lazy_obj', '_lazy_lock', '_lazy_callbacks', '__weakref__')
+
+    def __init__(self, loader, name, cls=None, md=None):
+        object.__setattr__(self, '_lazy_loader', loader)
+        object.__setattr__(self, '_lazy_name', name)
+        object.__setattr__(self, '_lazy_cls', cls)
+        object.__setattr__(self, '_lazy_md', md)
+        object.__setattr__(self, '_lazy_obj', None)
+        object.__setattr__(self, '_lazy_lock', RLock())
+        object.__setattr__(self, '_lazy_callbacks', [])
+
+    @classmethod
+    def from_container(cls, container):
+        """
+        Create a `LazyDevice` for a ``happi`` container.
+        """
+        from happi.loader import from_container
+        return cls(partial(from_container, container), container.name,
+                   cls=container.device_class, md=container)
+
+    @property
+    def lazy_loaded(self):
+        """
+        ``True`` if the real object has been created.
+        """
+        return self._lazy_obj is not None
+
+    @property
+    def lazy_md(self):
+        """
+        The ``happi`` container for the object, if one was given.
+
+        This does not create the real object.
+        """
+        return self._lazy_md
+
+    @property
+    def lazy_class(self):
+        """
+        The class of the real object, or ``None`` if it cannot be found.
+
+        This does not create the real object.
+        """
+        if self._lazy_obj is not None:
+            return type(self._lazy_obj)
+        cls = self._lazy_cls
+        if isinstance(cls, str):
+            try:
+                cls = find_class(cls)
+            except Exception:
+                logger.debug('Could not find class %s for %s', cls,
+                             self._lazy_name, exc_info=True)
+                cls = None
+            object.__setattr__(self, '_lazy_cls', cls)
+        return cls
+
+    def lazy_load(self):
+        """
+        Create the real object if needed and return it.
+        """
+        with self._lazy_lock:
+            if self._lazy_obj is not None:
+                return self._lazy_obj
+            logger.debug('Creating lazy object %s', self._lazy_name)
+            obj = self._lazy_loader()
+            object.__setattr__(self, '_lazy_obj', obj)
+            callbacks = self._lazy_callbacks
+            object.__setattr__(self, '_lazy_callbacks', [])
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.error('Error in %s after creating %s', callback,
+                             self._lazy_name)
+                logger.debug('', exc_info=True)
+        return obj
+
+    def lazy_subscribe(self, callback):
+        """
+        Call a function once the real object has been created.
+
+        Parameters
+        ----------
+        callback: ``callable``
+            Called as ``callback(lazy_device)`` on the thread that created
+            the object. Nothing is called if it already exists.
+        """
+        with self._lazy_lock:
+            if self._lazy_obj is None:
+                self._lazy_callbacks.append(callback)
+
+    def lazy_component(self, attrs, cls=None):
+        """
+        Create a `LazyDevice` for a component of this object.
+
+        Parameters
+        ----------
+        attrs: ``list`` of ``str``
+            The attribute names that lead from this object to the component
+
+        cls: ``type``, optional
+            The class of the component
+
+        Returns
+        -------
+        component: `LazyDevice`
+            Placeholder named using the ``ophyd`` convention of joining the
+            parent name and attribute names with underscores.
+        """
+        def loader():
+            return reduce(getattr, attrs, self.lazy_load())
+
+        name = '_'.join([self._lazy_name] + list(attrs))
+        return LazyDevice(loader, name, cls=cls)
+
+    def __getattr__(self, attr):
+        if self._lazy_obj is None:
+            if attr == 'name':
+                return self._lazy_name
+            if attr == 'md' and self._lazy_md is not None:
+                return self._lazy_md
+        return getattr(self.lazy_load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.lazy_load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self.lazy_load(), attr)
+
+    def __dir__(self):
+        return dir(self.lazy_load())
+
+    def __repr__(self):
+        if self._lazy_obj is None:
+            cls = self.lazy_class
+            cls_name = cls.__name__ if cls is not None else 'unknown class'
+            return '<{} (lazy {}, not loaded)>'.format(self._lazy_name,
+                                                       cls_name)
+        return repr(self._lazy_obj)
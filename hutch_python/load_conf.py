@@ -2,9 +2,12 @@
 This module is responsible for reading and interpreting the ``conf.yml`` file.
 The file's specification can be found on the `yaml_files` page.
 """
+import hashlib
+import json
 import logging
 import yaml
-from copy import copy
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from socket import gethostname
 
@@ -14,17 +17,28 @@ from bluesky.utils import install_kicker
 from elog import HutchELog
 from pcdsdevices.mv_interface import setup_preset_paths
 
-from . import plan_defaults
+from . import plan_defaults, __version__
 from .cache import LoadCache
-from .constants import VALID_KEYS
+from .connections import connection_report, start_connection_report
+from .constants import (VALID_KEYS, QS_CACHE_TTL, CONNECTION_TIMEOUT,
+                        CUR_EXP_MAX_AGE)
 from .daq import get_daq_objs
+from .disk_cache import get_cache_dir, normalize_key
 from .exp_load import get_exp_objs
-from .happi import get_happi_objs, get_lightpath
-from .namespace import class_namespace, tree_namespace
-from .qs_load import get_qs_objs
+from .happi import (get_happi_objs, get_lightpath, database_key,
+                    get_happi_docs, load_docs)
+from .ipython_log import skip_output
+from .lazy import LazyDevice
+from .namespace import (ClassNamespaces, TreeNamespace,
+                        load_component_index, save_component_index)
+from .pv_index import PVIndex
+from .qs_load import (get_qs_docs, get_qs_objs, strip_credentials,
+                      add_credentials)
+from .search import SearchIndex
+from .stages import Stage, run_stages, SessionSnapshot
 from .user_load import get_user_objs
-from .utils import (get_current_experiment, safe_load, hutch_banner,
-                    count_ns_leaves)
+from .utils import (get_current_experiment, hutch_banner,
+                    count_ns_leaves, extract_objs, IterableNamespace)
 
 logger = logging.getLogger(__name__)
 
@@ -77,15 +91,45 @@ def load_conf(conf, hutch_dir=None):
       to define the ``platform`` argument if provided. The default value if
       ``daq_platform`` was not defined is 0.
     - Use ``db`` key to load devices from the ``happi`` beamline database
-      and create a ``hutch_beampath`` object from ``lightpath``
+      and create a ``hutch_beampath`` object from ``lightpath``. If
+      ``device_workers`` is provided, create the devices using that many
+      threads. If ``lazy_devices`` is ``True``, wait to create each device
+      until it is first used. The database search results are saved in the
+      hutch's ``.cache`` directory and reused until the database changes.
     - Use ``load`` key to bring up the user's ``beamline`` modules
     - Use ``experiment`` key to select the current experiment
 
         - If ``experiment`` was missing, autoselect experiment using
           ``hutch`` key
 
-    - Use current experiment to load experiment objects from questionnaire
+    - Use current experiment to load experiment objects from questionnaire.
+      The experiment selection and the questionnaire request are started
+      right after the configuration is read, so that they can finish while
+      everything else is loading. Devices are created using the
+      ``device_workers`` and ``lazy_devices`` settings. The
+      questionnaire is saved in the hutch's ``.cache`` directory and trusted
+      for ``qs_cache_ttl`` seconds, or longer if the questionnaire cannot be
+      reached.
     - Use current experiment to load experiment file
+    - If ``warm_start`` is ``True``, save the database entries of the
+      ``happi`` and questionnaire devices in the user's ``.cache``
+      directory. The next session with the same configuration, hutch Python
+      files and ``hutch-python`` version creates these devices directly. The
+      ``happi`` devices are reused while the database file and ``lightpath``
+      configuration are unchanged, and the questionnaire devices while the
+      experiment is the same. The questionnaire is still checked in the
+      background, and changes are used by the following session.
+    - If ``check_connections`` is set, check which devices are connected in
+      a background thread and log the results, using `connection_report`.
+      ``True`` waits for the default timeout, and a number sets the timeout
+      in seconds.
+    - Use ``skip_output`` to log outputs of these types by class name only,
+      using `ipython_log.skip_output`.
+
+    Steps that do not depend on each other, such as the ``daq``, the
+    ``happi`` database, the ``elog`` and the experiment selection, are run at
+    the same time using `stages.run_stages`. Objects are still added to the
+    ``hutch.db`` namespace in the order listed above.
 
     If a conf key is missing, we'll note it in a ``logger.info`` message.
     If an extra conf entry is found, we'll note it in a ``logger.warning``
@@ -105,7 +149,8 @@ def load_conf(conf, hutch_dir=None):
         hutchname directory e.g. ``mfx``
         If this is missing, we'll be unable to write the ``db.txt`` file,
         do relative filepath database selection for ``happi``,
-        or establish a preset positions directory.
+        establish a preset positions directory, or save results in the
+        ``.cache`` directory to speed up the next startup.
 
     Returns
     ------
@@ -160,6 +205,47 @@ def load_conf(conf, hutch_dir=None):
         load = None
         logger.info('Missing load from conf. Will skip loading hutch files.')
 
+    try:
+        qs_cache_ttl = conf['qs_cache_ttl']
+        if (not isinstance(qs_cache_ttl, (int, float))
+                or qs_cache_ttl < 0):
+            logger.error(('Invalid qs_cache_ttl conf %s, must be a '
+                          'non-negative number of seconds.'), qs_cache_ttl)
+            qs_cache_ttl = QS_CACHE_TTL
+    except KeyError:
+        qs_cache_ttl = QS_CACHE_TTL
+
+    try:
+        experiment_max_age = conf['experiment_max_age']
+        if (isinstance(experiment_max_age, bool)
+                or not isinstance(experiment_max_age, (int, float))
+                or experiment_max_age < 0):
+            logger.error(('Invalid experiment_max_age conf %s, must be a '
+                          'non-negative number of seconds.'),
+                         experiment_max_age)
+            experiment_max_age = CUR_EXP_MAX_AGE
+    except KeyError:
+        experiment_max_age = CUR_EXP_MAX_AGE
+
+    # Directory for files that speed up the next startup
+    cache_dir = get_cache_dir(hutch_dir)
+
+    try:
+        warm_start = conf['warm_start']
+        if not isinstance(warm_start, bool):
+            logger.error('Invalid warm_start conf %s, must be a boolean.',
+                         warm_start)
+            warm_start = False
+    except KeyError:
+        warm_start = False
+    if warm_start and cache_dir is not None:
+        snapshot_path = cache_dir / 'session_{}.json'.format(
+            (hutch or 'hutch').lower())
+        snapshot = SessionSnapshot(snapshot_path,
+                                   key=session_key(conf, hutch_dir, hutch))
+    else:
+        snapshot = None
+
     try:
         experiment = conf['experiment']
         if (not isinstance(experiment, dict)
@@ -175,6 +261,33 @@ def load_conf(conf, hutch_dir=None):
                          'load objects from questionnaire or experiment '
                          'file.'))
 
+    # Start the slow experiment lookups now, they are not needed until the
+    # questionnaire and experiment stages
+    prefetch = ThreadPoolExecutor(max_workers=2)
+    exp_future = None
+    qs_future = None
+    if experiment is not None or hutch is not None:
+        def find_experiment():
+            if experiment is not None:
+                return experiment['proposal'], experiment['run']
+            # xpplp1216
+            expname = get_current_experiment(hutch, cache_dir=cache_dir,
+                                             max_age=experiment_max_age)
+            logger.info('Selected active experiment %s', expname)
+            # lp12, 16
+            return expname[3:-2], expname[-2:]
+
+        def fetch_questionnaire():
+            proposal, run = exp_future.result()
+            return get_qs_docs(proposal.upper(), run, cache_dir=cache_dir,
+                               ttl=qs_cache_ttl)
+
+        exp_future = prefetch.submit(find_experiment)
+        qs_future = prefetch.submit(fetch_questionnaire)
+    # Nothing else is submitted. The threads finish the lookups and exit even
+    # if the rest of the startup fails.
+    prefetch.shutdown(wait=False)
+
     try:
         # This is an internal variable here for note-keeping. The ELog uses
         # this to determine if we are in the secondary or primary DAQ mode
@@ -194,6 +307,52 @@ def load_conf(conf, hutch_dir=None):
         daq_platform = 0
         logger.info('Selected default hutch-python daq platform: 0')
 
+    try:
+        device_workers = conf['device_workers']
+        if not isinstance(device_workers, int) or device_workers < 1:
+            logger.error(('Invalid device_workers conf %s, must be a '
+                          'positive integer.'), device_workers)
+            device_workers = None
+    except KeyError:
+        device_workers = None
+
+    try:
+        lazy_devices = conf['lazy_devices']
+        if not isinstance(lazy_devices, bool):
+            logger.error('Invalid lazy_devices conf %s, must be a boolean.',
+                         lazy_devices)
+            lazy_devices = False
+    except KeyError:
+        lazy_devices = False
+
+    try:
+        check_connections = conf['check_connections']
+        if check_connections is True:
+            check_connections = CONNECTION_TIMEOUT
+        elif (isinstance(check_connections, bool)
+              or not isinstance(check_connections, (int, float))
+              or check_connections <= 0):
+            if check_connections is not False:
+                logger.error(('Invalid check_connections conf %s, must be a '
+                              'boolean or a positive number.'),
+                             check_connections)
+            check_connections = None
+    except KeyError:
+        check_connections = None
+
+    try:
+        output_types = conf['skip_output']
+        if isinstance(output_types, str):
+            output_types = [output_types]
+        if (not isinstance(output_types, list)
+                or not all(isinstance(name, str) for name in output_types)):
+            logger.error(('Invalid skip_output conf %s, must be a string or '
+                          'a list of strings.'), output_types)
+            output_types = []
+    except KeyError:
+        output_types = []
+    skip_output(*output_types)
+
     # Make cache namespace
     cache = LoadCache((hutch or 'hutch') + '.db', hutch_dir=hutch_dir)
 
@@ -201,7 +360,7 @@ def load_conf(conf, hutch_dir=None):
     RE = RunEngine({})
     bec = BestEffortCallback()
     RE.subscribe(bec)
-    cache(RE=RE)
+    cache.update(dict(RE=RE), source='run engine')
     try:
         install_kicker()
     except RuntimeError:
@@ -209,24 +368,57 @@ def load_conf(conf, hutch_dir=None):
         pass
 
     # Collect Plans
-    cache(plans=plan_defaults)
-    cache(p=plan_defaults)
+    cache.update(dict(plans=plan_defaults, p=plan_defaults),
+                 source='plans')
+
+    # Everything else is split into stages that can run at the same time if
+    # they do not depend on each other. See hutch_python.stages
+    stages = []
 
     # Daq
-    with safe_load('daq'):
-        daq_objs = get_daq_objs(daq_platform, RE)
-        cache(**daq_objs)
+    def load_daq():
+        return get_daq_objs(daq_platform, RE)
+
+    stages.append(Stage('daq', load_daq))
 
     # Happi db and Lightpath
     if db is not None:
-        with safe_load('database'):
-            happi_objs = get_happi_objs(db, hutch)
-            cache(**happi_objs)
-            bp = get_lightpath(db, hutch)
-            cache(**{"{}_beampath".format(hutch.lower()): bp})
+        def load_database():
+            objs = get_happi_objs(db, hutch, max_workers=device_workers,
+                                  lazy=lazy_devices, cache_dir=cache_dir)
+            objs.update(load_beampath())
+            return objs
+
+        def load_beampath():
+            bp_name = "{}_beampath".format(hutch.lower())
+            if lazy_devices:
+                # The lightpath creates every device on the beamline
+                bp = LazyDevice(partial(get_lightpath, db, hutch,
+                                        cache_dir=cache_dir),
+                                bp_name, cls='lightpath.BeamPath')
+            else:
+                bp = get_lightpath(db, hutch, cache_dir=cache_dir)
+            return {bp_name: bp}
+
+        def database_inputs():
+            return database_key(db, hutch)
+
+        def record_database(objs):
+            return dict(docs=get_happi_docs(db, hutch, list(objs),
+                                            cache_dir=cache_dir))
+
+        def replay_database(outputs):
+            objs = load_docs(outputs['docs'], max_workers=device_workers,
+                             lazy=lazy_devices)
+            objs.update(load_beampath())
+            return objs
+
+        stages.append(Stage('database', load_database,
+                            inputs=database_inputs, record=record_database,
+                            replay=replay_database))
 
     # Elog
-    with safe_load('elog'):
+    def load_elog():
         # Use the fact if we we used the default_platform or not to decide
         # whether we are in a specialty station or not
         if default_platform:
@@ -235,65 +427,118 @@ def load_conf(conf, hutch_dir=None):
         else:
             logger.info("Configuring ELog to post to secondary experiment")
             kwargs = {'station': '1'}
-        cache(elog=HutchELog.from_conf(hutch.upper(), **kwargs))
+        return dict(elog=HutchELog.from_conf(hutch.upper(), **kwargs))
+
+    stages.append(Stage('elog', load_elog))
 
     # Load user files
     if load is not None:
-        load_objs = get_user_objs(load)
-        cache(**load_objs)
+        def load_user():
+            return get_user_objs(load)
+
+        # User files may import anything loaded before them
+        stages.append(Stage('beamline', load_user, safe=False,
+                            requires=['daq', 'database', 'elog']))
 
     # Auto select experiment if we need to
-    proposal = None
-    if experiment is None:
-        if hutch is not None:
+    exp_info = {}
+    if experiment is not None:
+        exp_info['proposal'] = experiment['proposal']
+        exp_info['run'] = experiment['run']
+    elif hutch is not None:
+        def select_experiment():
             try:
-                # xpplp1216
-                expname = get_current_experiment(hutch)
-                logger.info('Selected active experiment %s', expname)
-                # lp12
-                proposal = expname[3:-2]
-                # 16
-                run = expname[-2:]
+                exp_info['proposal'], exp_info['run'] = exp_future.result()
             except Exception:
                 err = 'Failed to select experiment automatically'
                 logger.error(err)
                 logger.debug(err, exc_info=True)
 
-    # Experiment objects
-    if experiment is not None:
-        proposal = experiment['proposal']
-        run = experiment['run']
+        stages.append(Stage('experiment', select_experiment, safe=False))
 
-    if proposal is not None:
-        qs_objs = get_qs_objs(proposal, run)
-        cache(**qs_objs)
-        user = get_exp_objs(proposal, run)
-        for name, obj in qs_objs.items():
-            setattr(user, name, obj)
-        cache(x=user, user=user)
+    # Experiment objects
+    qs_objs = {}
+
+    def load_questionnaire():
+        if 'proposal' in exp_info:
+            qs_objs.update(get_qs_objs(exp_info['proposal'], exp_info['run'],
+                                       max_workers=device_workers,
+                                       lazy=lazy_devices, docs=qs_future))
+        return qs_objs
+
+    def questionnaire_inputs():
+        if 'proposal' in exp_info:
+            return dict(proposal=exp_info['proposal'].upper(),
+                        run=str(exp_info['run']))
+
+    def record_questionnaire(objs):
+        # Never save the login details, see qs_load.strip_credentials
+        docs, login_ids = strip_credentials(qs_future.result())
+        return dict(docs=docs, login_ids=login_ids)
+
+    def replay_questionnaire(outputs):
+        inputs = questionnaire_inputs()
+        docs = add_credentials(outputs['docs'], outputs['login_ids'])
+        qs_objs.update(get_qs_objs(inputs['proposal'], inputs['run'],
+                                   max_workers=device_workers,
+                                   lazy=lazy_devices, docs=docs))
+        # The questionnaire is still requested in the background. Save any
+        # changes for the next session.
+        qs_future.add_done_callback(partial(
+            check_questionnaire, snapshot, inputs, outputs['docs']))
+        return qs_objs
+
+    stages.append(Stage('questionnaire', load_questionnaire, safe=False,
+                        requires=['experiment'], inputs=questionnaire_inputs,
+                        record=record_questionnaire,
+                        replay=replay_questionnaire))
+
+    def load_experiment():
+        if 'proposal' in exp_info:
+            user = get_exp_objs(exp_info['proposal'], exp_info['run'])
+            for name, obj in qs_objs.items():
+                setattr(user, name, obj)
+            return dict(x=user, user=user)
+
+    # Experiment files may import anything loaded before them
+    stages.append(Stage('user', load_experiment, safe=False,
+                        requires=['daq', 'database', 'elog', 'beamline',
+                                  'experiment', 'questionnaire']))
 
     # Default namespaces
-    with safe_load('default groups'):
-        default_class_namespace('EpicsMotor', 'motors', cache)
-        default_class_namespace('Slits', 'slits', cache)
+    def load_default_groups():
+        if cache_dir is not None:
+            index_file = cache_dir / 'components.json'
+            load_component_index(index_file)
+        # Names of the groups, which should not be grouped themselves
+        group_names = set(['a', 'all_objects'])
+        default_class_namespaces([('EpicsMotor', 'motors'),
+                                  ('Slits', 'slits')], cache,
+                                 skip=group_names)
+        if cache_dir is not None:
+            save_component_index(index_file)
         if hutch is not None:
-            tree = tree_namespace(scope='hutch_python.db')
-            # Prune meta, remove branches with only one object
-            for name, space in tree.__dict__.items():
-                if count_ns_leaves(space) > 1:
-                    cache(**{name: space})
+            default_tree_namespace(cache, skip=group_names)
+        default_search(cache, skip=group_names)
+        default_pv_index(cache, skip=group_names)
+        group_names.add('connection_report')
+        cache.update(dict(connection_report=connection_report),
+                     source='default groups')
+        default_all_objects(cache)
 
-        all_objs = copy(cache.objs)
-        cache(a=all_objs, all_objects=all_objs)
+    stages.append(Stage('default groups', load_default_groups,
+                        requires=[stage.name for stage in stages]))
 
     # Install Presets
     if hutch_dir is not None:
-        with safe_load('position presets'):
+        def load_presets():
+            proposal = exp_info.get('proposal')
             presets_dir = Path(hutch_dir) / 'presets'
             beamline_presets = presets_dir / 'beamline'
             preset_paths = [presets_dir, beamline_presets]
             if proposal is not None:
-                experiment_presets = presets_dir / (proposal + str(run))
+                experiment_presets = presets_dir / (proposal
+                                                    + str(exp_info['run']))
                 preset_paths.append(experiment_presets)
             for path in preset_paths:
                 if not path.exists():
@@ -305,15 +550,107 @@ def load_conf(conf, hutch_dir=None):
                 setup_preset_paths(hutch=beamline_presets,
                                    exp=experiment_presets)
 
+        stages.append(Stage('position presets', load_presets,
+                            requires=['experiment']))
+
+    run_stages(stages, cache, snapshot=snapshot)
+    if snapshot is not None:
+        snapshot.save()
+
     # Write db.txt info file to the user's module
     try:
         cache.write_file()
     except OSError:
         logger.warning('No permissions to write db.txt file')
 
+    # Check the device connections without holding up the session
+    if check_connections is not None:
+        start_connection_report(objs=extract_objs(scope=cache.objs),
+                                timeout=check_connections)
+
     return cache.objs.__dict__
 
 
+def session_key(conf, hutch_dir=None, hutch=None):
+    """
+    Describe a configuration for use as a `SessionSnapshot` key.
+
+    Parameters
+    ----------
+    conf: ``dict``
+        ``dict`` interpretation of the original yaml file
+
+    hutch_dir: ``Path`` or ``str``, optional
+        The hutch's launch directory
+
+    hutch: ``str``, optional
+        The name of the hutch
+
+    Returns
+    -------
+    key: ``dict``
+        A hash of the configuration, the ``hutch-python`` version, and the
+        modification time and size of each of the hutch's Python files. See
+        `module_stamps`.
+    """
+    text = json.dumps(conf, sort_keys=True, default=str)
+    return dict(conf=hashlib.sha256(text.encode()).hexdigest(),
+                version=__version__,
+                modules=module_stamps(hutch_dir, hutch))
+
+
+def module_stamps(hutch_dir, hutch=None):
+    """
+    Describe the Python files in the hutch's module and ``experiments``
+    directory.
+
+    Returns
+    -------
+    stamps: ``dict``
+        Mapping from the path of each file, relative to ``hutch_dir``, to its
+        modification time and size
+    """
+    stamps = {}
+    if hutch_dir is None:
+        return stamps
+    hutch_dir = Path(hutch_dir)
+    directories = [hutch_dir / 'experiments']
+    if hutch is not None:
+        directories.append(hutch_dir / hutch)
+    for directory in directories:
+        for path in sorted(directory.glob('**/*.py')):
+            try:
+                info = path.stat()
+            except OSError:
+                continue
+            stamps[str(path.relative_to(hutch_dir))] = '{}:{}'.format(
+                info.st_mtime_ns, info.st_size)
+    return stamps
+
+
+def check_questionnaire(snapshot, inputs, replayed, future):
+    """
+    Compare a replayed questionnaire with the one that was just requested.
+
+    If they differ, the new documents are saved in the ``snapshot`` for the
+    next session and a warning is logged, because this session was started
+    with the old devices.
+    """
+    try:
+        docs, login_ids = strip_credentials(future.result())
+    except Exception:
+        logger.debug('Unable to check the questionnaire', exc_info=True)
+        return
+    if normalize_key(docs) == normalize_key(replayed):
+        return
+    logger.warning('The questionnaire for %s%s changed since the last '
+                   'session. Restart to load the new devices.',
+                   inputs['proposal'], inputs['run'])
+    snapshot.record('questionnaire', inputs,
+                    dict(docs=docs, login_ids=login_ids))
+    snapshot.save()
+
+
 def default_class_namespace(cls, name, cache):
     """
     Create a class namespace and add it to the cache.
@@ -332,6 +669,183 @@ def default_class_namespace(cls, name, cache):
 
     cache: `LoadCache`
     """
-    objs = class_namespace(cls, scope='hutch_python.db')
-    if len(objs) > 0:
-        cache(**{name: objs, name[0]: objs})
+    default_class_namespaces([(cls, name)], cache)
+
+
+def default_class_namespaces(groups, cache, skip=None):
+    """
+    Create several class namespaces at once and add them to the cache.
+
+    This does the same thing as `default_class_namespace` for each group, but
+    only checks each object once. The namespaces are kept up to date as
+    objects are added to or removed from the cache, and a namespace that
+    starts out empty is added to the cache when it gains its first object.
+
+    Parameters
+    ----------
+    groups: ``list`` of ``(cls, name)``
+        The class and namespace name for each group
+
+    cache: `LoadCache`
+
+    skip: ``set`` of ``str``, optional
+        Names in the cache that should not be grouped. The names of the new
+        namespaces are added to this ``set``.
+
+    Returns
+    -------
+    namespaces: `ClassNamespaces`
+    """
+    skip = skip if skip is not None else set()
+    for cls, name in groups:
+        skip.update([name, name[0]])
+    namespaces = ClassNamespaces([cls for cls, name in groups], skip=skip)
+
+    def update(event, objs):
+        namespaces.update(event, objs)
+        new_groups = {}
+        for (cls, name), space in zip(groups, namespaces.spaces):
+            if len(space) > 0 and getattr(cache.objs, name, None) is not space:
+                new_groups.update({name: space, name[0]: space})
+        if new_groups:
+            cache.update(new_groups, source='default groups')
+
+    update('add', extract_objs(scope=cache.objs))
+    cache.subscribe(update)
+    return namespaces
+
+
+def default_tree_namespace(cache, skip=None):
+    """
+    Create a tree namespace and add its larger branches to the cache.
+
+    Each top-level branch of the tree with more than one object is added to
+    the cache. The tree is kept up to date as objects are added to or removed
+    from the cache, and branches are added as soon as they gain a second
+    object.
+
+    Parameters
+    ----------
+    cache: `LoadCache`
+
+    skip: ``set`` of ``str``, optional
+        Names in the cache that should not be added to the tree. The names of
+        the branches are added to this ``set``.
+
+    Returns
+    -------
+    tree: `TreeNamespace`
+    """
+    skip = skip if skip is not None else set()
+    tree = TreeNamespace(skip=skip)
+
+    def update(event, objs):
+        tree.update(event, objs)
+        # Only the branches of the changed objects need to be checked
+        touched = set(name.split('_')[0].lower() for name in objs)
+        # Prune meta, remove branches with only one object
+        branches = {}
+        for name in touched:
+            space = getattr(tree.space, name, None)
+            if (isinstance(space, IterableNamespace)
+                    and count_ns_leaves(space) > 1
+                    and getattr(cache.objs, name, None) is not space):
+                branches[name] = space
+        if branches:
+            skip.update(branches)
+            cache.update(branches, source='default groups')
+
+    update('add', extract_objs(scope=cache.objs))
+    cache.subscribe(update)
+    return tree
+
+
+def default_search(cache, skip=None):
+    """
+    Add a ``search`` function for the objects in the cache.
+
+    The `SearchIndex` behind the function is kept up to date as objects are
+    added to or removed from the cache.
+
+    Parameters
+    ----------
+    cache: `LoadCache`
+
+    skip: ``set`` of ``str``, optional
+        Names in the cache that should not be searched. ``search`` is added to
+        this ``set``.
+
+    Returns
+    -------
+    index: `SearchIndex`
+    """
+    skip = skip if skip is not None else set()
+    skip.add('search')
+    index = SearchIndex(skip=skip)
+    index.update('add', extract_objs(scope=cache.objs))
+    cache.subscribe(index.update)
+    cache.update(dict(search=index.search), source='default groups')
+    return index
+
+
+def default_pv_index(cache, skip=None):
+    """
+    Add a ``find_pv`` function for the objects in the cache.
+
+    ``find_pv`` is `PVIndex.owner` for a `PVIndex` that is kept up to date as
+    objects are added to or removed from the cache. The objects are only
+    inspected the first time ``find_pv`` is used after they are added.
+
+    Parameters
+    ----------
+    cache: `LoadCache`
+
+    skip: ``set`` of ``str``, optional
+        Names in the cache that should not be indexed. ``find_pv`` is added to
+        this ``set``.
+
+    Returns
+    -------
+    index: `PVIndex`
+    """
+    skip = skip if skip is not None else set()
+    skip.add('find_pv')
+    index = PVIndex(skip=skip)
+    index.update('add', extract_objs(scope=cache.objs))
+    cache.subscribe(index.update)
+    cache.update(dict(find_pv=index.owner), source='default groups')
+    return index
+
+
+def default_all_objects(cache):
+    """
+    Add the ``a`` and ``all_objects`` namespaces to the cache.
+
+    These contain every other object in the cache, and are kept up to date as
+    objects are added to or removed from the cache.
+
+    Parameters
+    ----------
+    cache: `LoadCache`
+
+    Returns
+    -------
+    all_objs: `IterableNamespace`
+    """
+    names = ('a', 'all_objects')
+    all_objs = IterableNamespace(**{name: obj for name, obj
+                                    in cache.objs.__dict__.items()
+                                    if name not in names})
+
+    def update(event, objs):
+        for name, obj in objs.items():
+            if name in names:
+                continue
+            if event == 'add':
+                setattr(all_objs, name, obj)
+            elif getattr(all_objs, name, None) is obj:
+                delattr(all_objs, name)
+
+    cache.subscribe(update)
+    cache.update({name: all_objs for name in names}, source='default groups')
+    return all_objs
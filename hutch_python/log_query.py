@@ -0,0 +1,343 @@
+"""
+This module searches the JSON log files written by the ``json`` handler in
+``logging.yml``. Each file is split into blocks of lines, and the offset, time
+range, highest level and loggers of each block are saved in an index next to
+the file. A query only reads the blocks that can contain a match, so looking
+at a few minutes of a long session does not read the whole file. Files
+compressed with ``gzip`` cannot be read from an offset without decompressing
+everything before it, so they are not indexed and are read in full.
+
+The search can also be run from the command line:
+
+.. code-block:: bash
+
+    python -m hutch_python.log_query logs/2018_03 --start '2018-03-05 14:00' \\
+        --level WARNING --logger ophyd
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import gzip
+import json
+import logging
+import time
+
+from .disk_cache import read_cache, write_cache
+
+logger = logging.getLogger(__name__)
+
+# Number of lines in each block of the index
+BLOCK_SIZE = 1000
+INDEX_VERSION = 1
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+ENTRY_FORMAT = ('{asctime} - PID {pid} {file:>18}: {line:<3} {func:<18} '
+                '{level:<8} {message}')
+
+
+def query_logs(paths, start=None, end=None, level=None, name=None,
+               block_size=BLOCK_SIZE):
+    """
+    Find the entries in JSON log files that match all of the filters.
+
+    Parameters
+    ----------
+    paths: ``str``, ``Path`` or ``list``
+        JSON log files, which may be compressed with ``gzip``, or directories
+        to search for them. See `find_log_files`.
+
+    start: ``float``, ``datetime`` or ``str``, optional
+        The earliest time to include, as seconds since the epoch, a
+        ``datetime``, or a local time like ``2018-03-05 14:00:00``
+
+    end: ``float``, ``datetime`` or ``str``, optional
+        The latest time to include
+
+    level: ``int`` or ``str``, optional
+        The lowest level to include, e.g. ``logging.WARNING`` or ``WARNING``
+
+    name: ``str``, optional
+        Only include this logger and its children, e.g. ``ophyd`` includes
+        ``ophyd.signal``
+
+    block_size: ``int``, optional
+        The number of lines in each block of the index. Compressed files are
+        not indexed.
+
+    Returns
+    -------
+    entries: ``iterator`` of ``dict``
+        The matching entries, in file order. See `log_setup.JSONFormatter`.
+    """
+    start = _timestamp(start)
+    end = _timestamp(end)
+    level = _levelno(level)
+    for path in find_log_files(paths):
+        if _compressed(path):
+            with _open(path) as f:
+                yield from _matching(f, start, end, level, name)
+            continue
+        blocks = build_index(path, block_size=block_size)
+        with _open(path) as f:
+            for block in blocks:
+                if not _block_matches(block, start, end, level, name):
+                    continue
+                f.seek(block['offset'])
+                data = f.read(block['end'] - block['offset'])
+                yield from _matching(data.splitlines(), start, end, level,
+                                     name)
+
+
+def find_log_files(paths):
+    """
+    Find the JSON log files in files and directories.
+
+    Parameters
+    ----------
+    paths: ``str``, ``Path`` or ``list``
+        Files are used as they are. Directories are searched, including
+        subdirectories, for files named like ``*.jsonl`` or ``*.jsonl.1.gz``.
+
+    Returns
+    -------
+    files: ``list`` of ``Path``
+        The files given directly, in order, followed by the files found in
+        each directory, oldest first.
+    """
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            found = [log for log in path.glob('**/*.jsonl*')
+                     if log.is_file() and not log.name.endswith('.idx')]
+            files.extend(sorted(found, key=lambda log: log.stat().st_mtime))
+        else:
+            files.append(path)
+    return files
+
+
+def build_index(path, block_size=BLOCK_SIZE):
+    """
+    Create or update the index for one JSON log file.
+
+    The index is saved next to the file as ``<file>.idx``, with the
+    permissions given by the umask. If the file has grown since the index was
+    saved, only the new lines are read. If the index cannot be saved, it is
+    rebuilt on every query.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``
+        An uncompressed JSON log file
+
+    block_size: ``int``, optional
+        The number of lines in each block
+
+    Returns
+    -------
+    blocks: ``list`` of ``dict``
+        One entry per block, with the keys ``offset`` and ``end`` (the bytes
+        of the file), ``start`` and ``stop`` (the earliest and
+        latest times), ``levelno`` (the highest level) and ``loggers``.
+    """
+    path = Path(path)
+    if _compressed(path):
+        raise ValueError('Compressed log file {} cannot be indexed'
+                         ''.format(path))
+    index_path = index_file(path)
+    key = dict(version=INDEX_VERSION, block_size=block_size)
+    size = path.stat().st_size
+    with _open(path) as f:
+        head = f.readline().decode('utf-8', 'replace')
+        data = read_cache(index_path, key=key)
+        if data is not None and data.get('head') == head:
+            if data.get('size') == size:
+                return data['blocks']
+            if data['end'] <= size:
+                # The file has grown, so read it again from the last block,
+                # which may not have been full
+                blocks = data['blocks'][:-1]
+                offset = blocks[-1]['end'] if blocks else 0
+                blocks.extend(_scan(f, offset, block_size))
+                _save_index(index_path, key, head, size, blocks)
+                return blocks
+        blocks = _scan(f, 0, block_size)
+    _save_index(index_path, key, head, size, blocks)
+    return blocks
+
+
+def index_file(path):
+    """
+    The path of the index for a JSON log file.
+    """
+    path = Path(path)
+    return path.with_name(path.name + '.idx')
+
+
+def format_entry(entry):
+    """
+    Format an entry like a line in the text log files.
+    """
+    values = dict(pid='', file='', line='', func='', level='', message='')
+    values.update((key, value) for key, value in entry.items()
+                  if value is not None)
+    values['asctime'] = time.strftime('%Y-%m-%d %H:%M:%S',
+                                      time.localtime(entry.get('time', 0)))
+    text = ENTRY_FORMAT.format(**values)
+    if entry.get('exc'):
+        text += '\n' + entry['exc']
+    return text
+
+
+def _save_index(index_path, key, head, size, blocks):
+    end = blocks[-1]['end'] if blocks else 0
+    write_cache(index_path, dict(head=head, size=size, end=end,
+                                 blocks=blocks), key=key, mode=None)
+
+
+def _scan(f, offset, block_size):
+    """
+    Read the complete lines from ``offset`` and summarize them in blocks.
+    """
+    f.seek(offset)
+    blocks = []
+    block = None
+    for line in f:
+        if not line.endswith(b'\n'):
+            # Still being written
+            break
+        if block is None:
+            block = dict(offset=offset, end=offset, start=None, stop=None,
+                         levelno=0, loggers=set(), lines=0)
+        offset += len(line)
+        block['end'] = offset
+        block['lines'] += 1
+        entry = _parse(line)
+        if entry is not None:
+            stamp = entry.get('time')
+            if isinstance(stamp, (int, float)):
+                if block['start'] is None or stamp < block['start']:
+                    block['start'] = stamp
+                if block['stop'] is None or stamp > block['stop']:
+                    block['stop'] = stamp
+            block['levelno'] = max(block['levelno'], entry.get('levelno', 0))
+            block['loggers'].add(entry.get('logger', ''))
+        if block['lines'] >= block_size:
+            blocks.append(block)
+            block = None
+    if block is not None:
+        blocks.append(block)
+    for block in blocks:
+        block['loggers'] = sorted(block['loggers'])
+        del block['lines']
+    return blocks
+
+
+def _compressed(path):
+    return str(path).endswith('.gz')
+
+
+def _open(path):
+    if _compressed(path):
+        return gzip.open(str(path), 'rb')
+    return open(str(path), 'rb')
+
+
+def _matching(lines, start, end, level, name):
+    for line in lines:
+        entry = _parse(line)
+        if (entry is not None
+                and _entry_matches(entry, start, end, level, name)):
+            yield entry
+
+
+def _parse(line):
+    try:
+        entry = json.loads(line.decode('utf-8', 'replace'))
+    except ValueError:
+        return None
+    if not isinstance(entry, dict):
+        return None
+    return entry
+
+
+def _block_matches(block, start, end, level, name):
+    # Blocks without any times are always read
+    if start is not None and block['stop'] is not None:
+        if block['stop'] < start:
+            return False
+    if end is not None and block['start'] is not None:
+        if block['start'] > end:
+            return False
+    if level is not None and block['levelno'] < level:
+        return False
+    if name is not None:
+        return any(_logger_matches(found, name) for found in block['loggers'])
+    return True
+
+
+def _entry_matches(entry, start, end, level, name):
+    stamp = entry.get('time')
+    if start is not None and (stamp is None or stamp < start):
+        return False
+    if end is not None and (stamp is None or stamp > end):
+        return False
+    if level is not None and entry.get('levelno', 0) < level:
+        return False
+    if name is not None:
+        return _logger_matches(entry.get('logger', ''), name)
+    return True
+
+
+def _logger_matches(found, name):
+    return found == name or found.startswith(name + '.')
+
+
+def _timestamp(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError('Unable to read time {!r}, use the format {}'
+                     ''.format(value, TIME_FORMATS[0]))
+
+
+def _levelno(level):
+    if level is None or isinstance(level, int):
+        return level
+    if level.isdigit():
+        return int(level)
+    levelno = logging.getLevelName(level.upper())
+    if not isinstance(levelno, int):
+        raise ValueError('Unknown log level {!r}'.format(level))
+    return levelno
+
+
+def main(args=None):
+    """
+    Print the matching log entries for the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m hutch_python.log_query',
+        description='Search hutch-python JSON log files')
+    parser.add_argument('paths', nargs='+',
+                        help='Log files, or directories to search for them')
+    parser.add_argument('--start', help='Earliest time, e.g. "{}"'
+                        ''.format(time.strftime(TIME_FORMATS[0])))
+    parser.add_argument('--end', help='Latest time')
+    parser.add_argument('--level', help='Lowest level, e.g. WARNING')
+    parser.add_argument('--logger', help='Logger name, e.g. ophyd')
+    args = parser.parse_args(args)
+    for entry in query_logs(args.paths, start=args.start, end=args.end,
+                            level=args.level, name=args.logger):
+        print(format_entry(entry))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,22 @@ This module is used to set up and manipulate the ``logging`` configuration for
 utilities like debug mode.
 """
 import os
+import re
+import sys
+import gzip
+import json
 import time
+import shutil
+import atexit
 import logging
 import logging.config
+import traceback
 from contextlib import contextmanager
+from logging.handlers import (QueueHandler, QueueListener,
+                              RotatingFileHandler)
 from pathlib import Path
+from queue import Queue, Full
+from threading import Lock, Thread
 
 from .constants import FILE_YAML
 
@@ -15,8 +26,251 @@ import yaml
 
 logger = logging.getLogger(__name__)
 
+# The listener for the handlers behind the queue, if there is one
+_listener = None
+# Used with use_queue when logging.yml does not list the queue settings
+QUEUE_HANDLERS = ['debug', 'json']
+QUEUE_MAXSIZE = 10000
+# Used with use_retention when logging.yml does not list the limits
+RETENTION_MAX_BYTES = 10737418240  # 10GB
+RETENTION_MAX_DAYS = 365
 
-def setup_logging(dir_logs=None):
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    ``QueueHandler`` that drops records instead of waiting for a full queue.
+
+    The number of dropped records is kept in ``dropped``. Once the queue has
+    room again, a warning with the number of records dropped since the last
+    warning is sent through the queue ahead of the next record, so the gap is
+    visible in the log file.
+
+    Parameters
+    ----------
+    queue: ``Queue``
+        Queue with a ``maxsize``, read by a ``QueueListener``
+    """
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def enqueue(self, record):
+        """
+        Put a record on the queue without blocking.
+        """
+        if self.dropped > self._reported:
+            count = self.dropped - self._reported
+            warning = logging.makeLogRecord(dict(
+                name=__name__, levelno=logging.WARNING, levelname='WARNING',
+                msg='Dropped %s log messages because the queue was full',
+                args=(count,)))
+            try:
+                self.queue.put_nowait(warning)
+                self._reported += count
+            except Full:
+                self.dropped += 1
+                return
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    ``RotatingFileHandler`` that compresses its old log files.
+
+    At each rollover, the full log file is renamed and then compressed with
+    ``gzip`` on a separate thread, so the thread doing the logging only waits
+    for a rename. The old files are named ``<log>.1.gz``, ``<log>.2.gz``, etc.
+    The next rollover waits for the previous compression to finish.
+
+    This takes the same arguments as ``RotatingFileHandler``.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compressor = None
+
+    def rotation_filename(self, default_name):
+        """
+        Add ``.gz`` to the name of each old log file.
+        """
+        return super().rotation_filename(default_name) + '.gz'
+
+    def doRollover(self):
+        """
+        Start a new log file, compressing the old one.
+        """
+        self.wait()
+        super().doRollover()
+
+    def rotate(self, source, dest):
+        """
+        Rename the full log file and start compressing it to ``dest``.
+        """
+        if not os.path.exists(source):
+            return
+        plain = dest[:-len('.gz')]
+        os.replace(source, plain)
+        self._compressor = Thread(target=self._compress, args=(plain, dest),
+                                  name='log_compressor')
+        self._compressor.start()
+
+    def wait(self):
+        """
+        Wait for the last old log file to be compressed.
+        """
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    def close(self):
+        """
+        Close the log file after any compression is done.
+        """
+        self.wait()
+        super().close()
+
+    @staticmethod
+    def _compress(source, dest):
+        try:
+            with open(source, 'rb') as f_in:
+                with gzip.open(dest, 'wb') as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            os.remove(source)
+        except Exception:
+            # Keep the uncompressed file, logging here could recurse
+            if logging.raiseExceptions:
+                traceback.print_exc(file=sys.stderr)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    ``Filter`` that drops repeated log messages.
+
+    Messages are repeats if they come from the same logger with the same
+    level and the same message template, i.e. before the arguments are filled
+    in. Only the first ``burst`` repeats in each ``window`` are kept. The
+    number of dropped messages is added to the next message that is kept, and
+    a message is logged for any that were dropped in a window without a later
+    repeat. The total is kept in ``suppressed``.
+
+    The same filter can be used on several handlers, as in ``logging.yml``.
+    Each message is only counted once, and the other handlers reuse the
+    decision.
+
+    Parameters
+    ----------
+    window: ``float``, optional
+        The number of seconds to count repeats over
+
+    burst: ``int``, optional
+        The number of repeats to keep in each window
+
+    min_level: ``int``, optional
+        Messages below this level are never dropped
+
+    max_keys: ``int``, optional
+        The most different messages to count at once. Messages that are not
+        already being counted are kept once this is reached.
+    """
+    def __init__(self, window=10, burst=10, min_level=0, max_keys=1000):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.min_level = min_level
+        self.max_keys = max_keys
+        self.suppressed = 0
+        # Mapping from key to [window start, count, suppressed]
+        self._counts = {}
+        self._last_sweep = time.monotonic()
+        self._lock = Lock()
+        self._attr = '_rate_limit_{}'.format(id(self))
+
+    def filter(self, record):
+        """
+        Decide whether to keep a record, counting it the first time it is
+        seen.
+        """
+        try:
+            return getattr(record, self._attr)
+        except AttributeError:
+            pass
+        if record.levelno < self.min_level:
+            keep = True
+            expired = []
+        else:
+            with self._lock:
+                keep = self._count(record)
+                expired = self._sweep()
+        setattr(record, self._attr, keep)
+        for name, levelno, count in expired:
+            logger.log(levelno, 'Suppressed %s similar messages from %s',
+                       count, name)
+        return keep
+
+    def _count(self, record):
+        now = time.monotonic()
+        key = (record.name, record.levelno, str(record.msg))
+        counts = self._counts.get(key)
+        if counts is None or now - counts[0] >= self.window:
+            if counts is None and len(self._counts) >= self.max_keys:
+                return True
+            if counts is not None and counts[2]:
+                record.msg = '{} (suppressed {} similar messages)'.format(
+                    record.msg, counts[2])
+            self._counts[key] = [now, 1, 0]
+            return True
+        counts[1] += 1
+        if counts[1] <= self.burst:
+            return True
+        counts[2] += 1
+        self.suppressed += 1
+        return False
+
+    def _sweep(self):
+        """
+        Forget the expired windows, returning the ones with dropped messages.
+        """
+        now = time.monotonic()
+        if now - self._last_sweep < self.window:
+            return []
+        self._last_sweep = now
+        expired = []
+        for key, counts in list(self._counts.items()):
+            if now - counts[0] >= self.window:
+                del self._counts[key]
+                if counts[2]:
+                    expired.append((key[0], key[1], counts[2]))
+        return expired
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    ``Formatter`` that writes each record as one line of JSON.
+
+    Each line is an object with the keys ``time`` (seconds since the epoch),
+    ``level``, ``levelno``, ``logger``, ``pid``, ``thread``, ``file``,
+    ``line``, ``func`` and ``message``, plus ``exc`` if there is a traceback.
+    These files can be searched with :mod:`log_query`.
+    """
+    def format(self, record):
+        """
+        Convert a record to a line of JSON.
+        """
+        entry = dict(time=record.created, level=record.levelname,
+                     levelno=record.levelno, logger=record.name,
+                     pid=record.process, thread=record.threadName,
+                     file=record.filename, line=record.lineno,
+                     func=record.funcName, message=record.getMessage())
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(dir_logs=None, use_queue=False, structured=False,
+                  use_retention=False):
     """
     Sets up the ``logging`` configuration.
 
@@ -27,14 +281,36 @@ def setup_logging(dir_logs=None):
     ----------
     dir_logs: ``str`` or ``Path``, optional
         Path to the log directory. If omitted, we won't use a log file.
+
+    use_queue: ``bool``, optional
+        If ``True``, the log file handlers run on a background thread and
+        records are dropped if they fall too far behind. The handlers and the
+        size of the queue can be changed under ``queue`` in ``logging.yml``.
+        See `setup_queue`. This is off by default.
+
+    structured: ``bool``, optional
+        If ``True``, also write each message as a line of JSON to a ``.jsonl``
+        file next to the log file, using the ``json`` handler. These files
+        can be searched with `log_query.query_logs`. This does nothing without
+        ``dir_logs``.
+
+    use_retention: ``bool``, optional
+        If ``True``, delete the current user's old log files from
+        ``dir_logs`` on a background thread. The limits can be changed under
+        ``retention`` in ``logging.yml``. See `clean_logs`. This is off by
+        default.
     """
     with open(FILE_YAML, 'rt') as f:
         config = yaml.safe_load(f.read())
+    queue_config = config.pop('queue', None) or {}
+    retention = config.pop('retention', None) or {}
 
     if dir_logs is None:
-        # Remove debug file from the config
-        del config['handlers']['debug']
-        config['root']['handlers'].remove('debug')
+        # Remove the log files from the config
+        for name in ('debug', 'json'):
+            config['handlers'].pop(name, None)
+            if name in config['root']['handlers']:
+                config['root']['handlers'].remove(name)
     else:
         # Ensure Path object
         dir_logs = Path(dir_logs)
@@ -55,14 +331,180 @@ def setup_logging(dir_logs=None):
         path_log_file = dir_month / log_file
         path_log_file.touch()
         config['handlers']['debug']['filename'] = str(path_log_file)
-
+        path_json_file = path_log_file.with_suffix('.jsonl')
+        if 'json' in config['handlers']:
+            config['handlers']['json']['filename'] = str(path_json_file)
+            if structured and 'json' not in config['root']['handlers']:
+                config['root']['handlers'].append('json')
+
+        if use_retention:
+            Thread(target=clean_logs, args=(dir_logs,),
+                   kwargs=dict(max_bytes=retention.get('max_bytes',
+                                                       RETENTION_MAX_BYTES),
+                               max_days=retention.get('max_days',
+                                                      RETENTION_MAX_DAYS),
+                               keep=[path_log_file, path_json_file]),
+                   name='clean_logs', daemon=True).start()
+
+    stop_queue()
     logging.config.dictConfig(config)
+    if use_queue:
+        setup_queue(queue_config.get('handlers', QUEUE_HANDLERS),
+                    maxsize=queue_config.get('maxsize', QUEUE_MAXSIZE))
     # Disable parso logging because it spams DEBUG messages
     # https://github.com/ipython/ipython/issues/10946
     logging.getLogger('parso.python.diff').disabled = True
     logging.getLogger('parso.cache').disabled = True
 
 
+def setup_queue(names, maxsize=0):
+    """
+    Move some of the root logger's handlers to a background thread.
+
+    The handlers are taken off of the root logger and given to a
+    ``QueueListener``. A `DroppingQueueHandler` named ``queue`` takes their
+    place and passes each record to them through a queue, so the thread that
+    logged the record never waits for the handlers to format and write it.
+    Each handler still applies its own level and filters, and filters that
+    all of the handlers share are also applied before the queue. The handlers
+    can still be found by name with `get_handler`.
+
+    Parameters
+    ----------
+    names: ``list`` of ``str``
+        Names of the handlers to move. Names that are not on the root logger
+        are ignored.
+
+    maxsize: ``int``, optional
+        The most records to hold in the queue before new records are dropped.
+        If zero, the default, the queue is unbounded.
+
+    Returns
+    -------
+    handler: `DroppingQueueHandler` or ``None``
+        ``None`` if none of the handlers were found.
+    """
+    global _listener
+    root = logging.getLogger('')
+    handlers = [handler for handler in root.handlers if handler.name in names]
+    if not handlers:
+        return None
+    stop_queue()
+    queue_handler = DroppingQueueHandler(Queue(maxsize=maxsize))
+    queue_handler.name = 'queue'
+    queue_handler.setLevel(min(handler.level for handler in handlers))
+    # Filters used by every handler can drop records before the queue
+    for log_filter in handlers[0].filters:
+        if all(log_filter in handler.filters for handler in handlers):
+            queue_handler.addFilter(log_filter)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    _listener = QueueListener(queue_handler.queue, *handlers,
+                              respect_handler_level=True)
+    _listener.start()
+    logger.debug('Logging to %s on a background thread',
+                 ', '.join(handler.name for handler in handlers))
+    return queue_handler
+
+
+def stop_queue():
+    """
+    Stop the thread started by `setup_queue`.
+
+    Every record already in the queue is handled first. This is done
+    automatically when Python exits.
+    """
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+atexit.register(stop_queue)
+
+
+def clean_logs(dir_logs, max_bytes=None, max_days=None, keep=None):
+    """
+    Delete the current user's old files from the log directory.
+
+    The log directory is shared, so only files owned by the current user are
+    considered, and the size limit applies to those files alone. Only the
+    month subdirectories made by `setup_logging`, named like ``2018_03``, are
+    cleaned. Files older than ``max_days`` are deleted, and then the oldest
+    remaining files are deleted until their total size is at most
+    ``max_bytes``. Month directories that are left empty are removed.
+
+    Parameters
+    ----------
+    dir_logs: ``str`` or ``Path``
+        Path to the log directory
+
+    max_bytes: ``int``, optional
+        The most bytes to keep in the current user's log files. If omitted,
+        there is no limit on the size.
+
+    max_days: ``float``, optional
+        The most days since a log file was last written to. If omitted, there
+        is no limit on the age.
+
+    keep: ``list`` of ``str`` or ``Path``, optional
+        Files that must not be deleted, such as the current session's log
+        file. Old files from the same session are also kept.
+
+    Returns
+    -------
+    removed: ``list`` of ``Path``
+        The files that were deleted
+    """
+    keep = [Path(path).name for path in keep or []]
+    uid = os.getuid()
+    month_dirs = [path for path in Path(dir_logs).iterdir()
+                  if path.is_dir() and re.fullmatch(r'\d{4}_\d{2}', path.name)]
+    files = []
+    for month_dir in month_dirs:
+        for path in month_dir.iterdir():
+            if not path.is_file() or any(path.name.startswith(name)
+                                         for name in keep):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if stat.st_uid != uid:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+
+    now = time.time()
+    total = sum(size for mtime, size, path in files)
+    removed = []
+    for mtime, size, path in files:
+        too_old = max_days is not None and now - mtime > max_days * 86400
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            logger.debug('Unable to remove old log file %s', path,
+                         exc_info=True)
+            continue
+        total -= size
+        removed.append(path)
+
+    for month_dir in {path.parent for path in removed}:
+        try:
+            month_dir.rmdir()
+        except OSError:
+            # Not empty
+            pass
+    if removed:
+        logger.debug('Removed %s old log files from %s', len(removed),
+                     dir_logs)
+    return removed
+
+
 def get_session_logfiles():
     """
     Get the path to the current debug log file
@@ -71,8 +513,9 @@ def get_session_logfiles():
     -------
     logs : list
         List of absolute paths to log files that were created by this session.
-        Returns an empty list if there is no ``RotatingFileHandler`` with the
-        name ``debug``
+        This includes old files that were compressed by a
+        `CompressingRotatingFileHandler`. Returns an empty list if there is
+        no ``RotatingFileHandler`` with the name ``debug``
     """
     # Grab the debug file handler
     try:
@@ -80,6 +523,9 @@ def get_session_logfiles():
     except RuntimeError:
         logger.warning("No debug RotatingFileHandler configured for session")
         return list()
+    # Make sure no file is still being compressed
+    if isinstance(handler, CompressingRotatingFileHandler):
+        handler.wait()
     # Find all the log files that were generated by this session
     base = Path(handler.baseFilename)
     return [str(base.parent / log)
@@ -115,12 +561,18 @@ def get_handler(name):
     """
     Helper function to get an arbitrary `Handler`
 
+    This includes the handlers that were moved to a background thread by
+    `setup_queue`.
+
     Returns
     -------
     hander : `Handler`
     """
     root = logging.getLogger('')
-    for handler in root.handlers:
+    handlers = list(root.handlers)
+    if _listener is not None:
+        handlers.extend(_listener.handlers)
+    for handler in handlers:
         if handler.name == name:
             return handler
     raise RuntimeError('No {} handler'.format(name))
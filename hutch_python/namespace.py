@@ -1,16 +1,26 @@
 """
 This module provides utilities for grouping objects into namespaces.
 """
+from functools import reduce
+from importlib import import_module
 from inspect import isfunction
 import logging
+import os
+import sys
 
 from ophyd import Device
 
-from .utils import (IterableNamespace, find_class, strip_prefix,
-                    extract_objs)
+from .disk_cache import read_cache, write_cache
+from .lazy import LazyDevice
+from .utils import IterableNamespace, find_class, extract_objs
 
 logger = logging.getLogger(__name__)
 
+# Component paths of each Device class, shared by every namespace
+_component_index = {}
+# Component paths read from disk, by class import path
+_saved_index = {}
+
 
 def class_namespace(cls, scope=None):
     """
@@ -28,96 +38,442 @@ def class_namespace(cls, scope=None):
         object's components as part of the scope, using the ``name`` attribute
         to identify them rather than the attribute name on the device. This
         will continue recursively, skipping lazy and dynamic components.
+        `LazyDevice` objects that have not been loaded yet are grouped by
+        their expected class, and their components are included as
+        `LazyDevice` objects as well, so nothing is created here.
 
     Returns
     -------
     namespace: `IterableNamespace`
     """
     logger.debug('Create class_namespace cls=%s, scope=%s', cls, scope)
-    class_space = IterableNamespace()
     scope_objs = extract_objs(scope=scope, stack_offset=1)
+    return _class_namespaces([cls], scope_objs)[0]
+
+
+def class_namespaces(classes, scope=None):
+    """
+    Create a `class_namespace` for each of several types at once.
+
+    This checks each object in ``scope``, and each ``Device`` class's
+    components, only once no matter how many ``classes`` there are.
+
+    Parameters
+    ----------
+    classes: ``list`` of ``type`` or ``str``
+
+    scope: ``module``, ``namespace``, or ``list`` of these
+        See `class_namespace`
+
+    Returns
+    -------
+    namespaces: ``list`` of `IterableNamespace`
+        One namespace for each entry in ``classes``, in the same order.
+    """
+    logger.debug('Create class_namespaces classes=%s, scope=%s',
+                 classes, scope)
+    scope_objs = extract_objs(scope=scope, stack_offset=1)
+    return _class_namespaces(classes, scope_objs)
+
+
+def _class_namespaces(classes, scope_objs):
+    """
+    Shared implementation of `class_namespace` and `class_namespaces`.
+    """
+    spaces = [IterableNamespace() for cls in classes]
+    targets = _resolve_classes(classes)
+    for name, obj in scope_objs.items():
+        for index, member_name, member in _class_matches(targets, name, obj):
+            setattr(spaces[index], member_name, member)
+    return spaces
 
-    # Resolve str arguments for cls
-    if isinstance(cls, str):
-        if cls != 'function':
+
+def _resolve_classes(classes):
+    """
+    Resolve str arguments for cls, returning ``(index, cls)`` pairs.
+
+    Classes that cannot be found are logged and left out.
+    """
+    targets = []
+    for index, cls in enumerate(classes):
+        if isinstance(cls, str) and cls != 'function':
             try:
                 cls = find_class(cls)
             except Exception as exc:
                 err = 'Type {} could not be loaded'
                 logger.error(err.format(cls))
                 logger.debug(exc, exc_info=True)
-                return class_space
+                continue
+        targets.append((index, cls))
+    return targets
+
+
+def _class_matches(targets, name, obj):
+    """
+    Find everything that one object contributes to the class namespaces.
+
+    Yields
+    ------
+    match: ``(int, str, object)``
+        The index of the matching target, the name to use in its namespace,
+        and the object or subdevice to add.
+    """
+    # Determine whether or not to include this object
+    if isinstance(obj, LazyDevice):
+        obj_cls = obj.lazy_class
+    else:
+        obj_cls = None
+    for index, cls in targets:
+        if cls == 'function':
+            include = isfunction(obj)
+        elif isinstance(obj, LazyDevice):
+            include = obj_cls is not None and issubclass(obj_cls, cls)
+        else:
+            include = isinstance(obj, cls)
+        if include:
+            logger.debug('Adding %s to %s namespace', name, cls)
+            yield index, name, obj
+
+    # Determine whether or not to include any subdevices
+    type_targets = [(index, cls) for index, cls in targets
+                    if cls != 'function']
+    if isinstance(obj, LazyDevice):
+        if obj.lazy_loaded:
+            obj = obj.lazy_load()
+        elif obj_cls is not None:
+            for attrs, sub_cls in component_paths(obj_cls):
+                matches = [(index, cls) for index, cls in type_targets
+                           if issubclass(sub_cls, cls)]
+                if matches:
+                    device = obj.lazy_component(attrs, cls=sub_cls)
+                    for index, cls in matches:
+                        logger.debug('Adding lazy %s to %s namespace',
+                                     device.name, cls)
+                        yield index, device.name, device
+    if isinstance(obj, Device):
+        for attrs, sub_cls, device in component_devices(obj):
+            matches = [(index, cls) for index, cls in type_targets
+                       if issubclass(sub_cls, cls)]
+            if matches:
+                for index, cls in matches:
+                    logger.debug('Adding %s to %s namespace',
+                                 device.name, cls)
+                    yield index, device.name, device
+
+
+class ClassNamespaces:
+    """
+    Class namespaces that are kept up to date as objects come and go.
+
+    Pass `ClassNamespaces.update` to `LoadCache.subscribe` and the namespaces
+    will follow the contents of the cache. Each event only checks the objects
+    that were added or removed.
+
+    Parameters
+    ----------
+    classes: ``list`` of ``type`` or ``str``
+        The classes to group, as in `class_namespaces`
 
-    # Mapping from Device class to list of lists of attrs that lead us to
-    # subdevices of the correct type
-    cache = {}
+    skip: ``set`` of ``str``, optional
+        Names that should never be grouped, such as the names of other
+        namespaces. This is checked at each event, so it may be changed
+        later.
 
-    def inspect_device_cls(device_cls, desired_cls, cache):
+    Attributes
+    ----------
+    spaces: ``list`` of `IterableNamespace`
+        One namespace for each entry in ``classes``, in the same order.
+    """
+    def __init__(self, classes, skip=None):
+        self.classes = list(classes)
+        self.skip = skip if skip is not None else set()
+        self.spaces = [IterableNamespace() for cls in self.classes]
+        self._targets = _resolve_classes(self.classes)
+        # The namespace entries added for each object, by object name
+        self._members = {}
+
+    def update(self, event, objs):
         """
-        Recursive helper function.
+        Add or remove objects from the namespaces.
 
-        Gets a list of components of device_class that match desired_cls,
-        skipping lazy components. Uses cache to improve speed for hutch-python
-        environments with large numbers of objects with the same class.
+        Parameters
+        ----------
+        event: ``str``
+            Either ``add`` or ``remove``
+
+        objs: ``dict``
+            Mapping from name to object for the objects that changed
         """
+        for name, obj in objs.items():
+            if name.startswith('_') or name in self.skip:
+                continue
+            if event == 'add':
+                self._add(name, obj)
+            elif event == 'remove':
+                self._remove(name)
+
+    def _add(self, name, obj):
+        self._remove(name)
+        members = []
+        for index, member_name, member in _class_matches(self._targets,
+                                                         name, obj):
+            setattr(self.spaces[index], member_name, member)
+            members.append((index, member_name, member))
+        if members:
+            self._members[name] = members
+
+    def _remove(self, name):
+        for index, member_name, member in self._members.pop(name, []):
+            space = self.spaces[index]
+            if getattr(space, member_name, None) is member:
+                logger.debug('Removing %s from %s namespace', member_name,
+                             self.classes[index])
+                delattr(space, member_name)
+
+
+def component_paths(device_cls, cache=None):
+    """
+    Find every component of a ``Device`` class, including subcomponents.
+
+    Lazy components, and components without a ``cls`` such as dynamic
+    components, are skipped along with everything beneath them. Each class is
+    only scanned once per session, and classes loaded from disk by
+    `load_component_index` are not scanned at all.
+
+    Parameters
+    ----------
+    device_cls: ``type``
+        The class to inspect. Classes that are not ``Device`` subclasses have
+        no components.
+
+    cache: ``dict``, optional
+        Results from previous calls, used to avoid scanning the same class
+        more than once. This is updated with the new results. If omitted, use
+        the module's shared index.
+
+    Returns
+    -------
+    paths: ``list`` of ``(tuple, type)``
+        For each component, the attribute names that lead to it from an
+        instance of ``device_cls``, and the component's class. Parents come
+        before their own subcomponents.
+    """
+    if cache is None:
+        cache = _component_index
+    try:
+        return cache[device_cls]
+    except KeyError:
+        pass
+    paths = _saved_paths(device_cls)
+    if paths is None:
+        paths = []
+        if isinstance(device_cls, type) and issubclass(device_cls, Device):
+            logger.debug('Checking subdevices for class %s', device_cls)
+            for cpt_name in device_cls.component_names:
+                cpt = getattr(device_cls, cpt_name)
+                if hasattr(cpt, 'cls') and not cpt.lazy:
+                    paths.append(((cpt_name,), cpt.cls))
+                    for attrs, sub_cls in component_paths(cpt.cls, cache):
+                        paths.append(((cpt_name,) + attrs, sub_cls))
+    cache[device_cls] = paths
+    return paths
+
+
+def component_devices(device):
+    """
+    Find every component of a ``Device`` instance, including subcomponents.
+
+    This uses `component_paths`. If a saved path no longer exists on the
+    device, e.g. because the class was edited without changing its file's
+    size or modification time, the saved paths for the class are dropped and
+    the class is scanned again.
+
+    Parameters
+    ----------
+    device: ``Device``
+
+    Returns
+    -------
+    components: ``list`` of ``(tuple, type, object)``
+        The attribute names, class and instance of each component
+    """
+    for attempt in range(2):
+        paths = component_paths(type(device))
         try:
-            return cache[device_cls]
-        except KeyError:
-            attrs = []
-            if issubclass(device_cls, Device):
-                logger.debug('Checking subdevices for class %s', device_cls)
-                for cpt_name in device_cls.component_names:
-                    cpt = getattr(device_cls, cpt_name)
-                    if hasattr(cpt, 'cls') and not cpt.lazy:
-                        if issubclass(cpt.cls, desired_cls):
-                            attrs.append([cpt_name])
-                        subattrs = inspect_device_cls(cpt.cls, desired_cls,
-                                                      cache)
-                        expand_subattrs = [[cpt_name] + a for a in subattrs]
-                        attrs.extend(expand_subattrs)
-                if attrs:
-                    logger.debug('Class %s has matching subdevices %s',
-                                 device_cls, attrs)
-                else:
-                    logger.debug('Class %s has no matching subdevices',
-                                 device_cls)
-            cache[device_cls] = attrs
-            return attrs
+            return [(attrs, cls, reduce(getattr, attrs, device))
+                    for attrs, cls in paths]
+        except AttributeError:
+            logger.debug('Component paths for %s are out of date',
+                         type(device), exc_info=True)
+            _forget_paths(type(device), paths)
+    return []
 
-    for name, obj in scope_objs.items():
-        # Determine whether or not to include this object
-        include = False
-        if cls == 'function':
-            if isfunction(obj):
-                include = True
-        elif isinstance(obj, cls):
-            include = True
 
-        if include:
-            logger.debug('Adding %s to %s namespace', name, cls)
-            setattr(class_space, name, obj)
+def _forget_paths(device_cls, paths):
+    """
+    Drop a class and its components from the component indices.
+    """
+    for cls in [device_cls] + [sub_cls for attrs, sub_cls in paths]:
+        _component_index.pop(cls, None)
+        if isinstance(cls, type):
+            _saved_index.pop(_class_path(cls), None)
+
+
+def load_component_index(path):
+    """
+    Read component paths saved by `save_component_index`.
+
+    Saved entries are used by `component_paths` in place of scanning a class,
+    as long as the class's package has the same version and the files that
+    define the class and its components have the same size and modification
+    time as when the entry was saved.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``
+        The index file
+
+    Returns
+    -------
+    count: ``int``
+        The number of classes read from the file
+    """
+    data = read_cache(path)
+    if not isinstance(data, dict):
+        return 0
+    _saved_index.update(data)
+    logger.debug('Read component paths for %s classes from %s',
+                 len(data), path)
+    return len(data)
+
+
+def save_component_index(path):
+    """
+    Save the component paths of every class scanned so far.
+
+    Entries from `load_component_index` are kept, so the file accumulates
+    classes across sessions. Classes that cannot be imported by name, such as
+    classes defined inside of functions, and classes whose modules have no
+    file, are not saved. The file is only written if it would change.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``
+        The index file
+
+    Returns
+    -------
+    saved: ``bool``
+        ``True`` if the file was written
+    """
+    data = dict(_saved_index)
+    for device_cls, paths in list(_component_index.items()):
+        entry = _index_entry(device_cls, paths)
+        if entry is not None:
+            data[_class_path(device_cls)] = entry
+    if data == _saved_index:
+        return False
+    if write_cache(path, data):
+        _saved_index.update(data)
+        return True
+    return False
+
+
+def _class_path(cls):
+    # Module and qualified name, which also works for nested classes
+    return '{}:{}'.format(cls.__module__, cls.__qualname__)
+
 
-        # Determine whether or not to include any subdevices
-        if isinstance(obj, Device):
-            subdevice_attrs = inspect_device_cls(obj.__class__, cls, cache)
-            for attrs in subdevice_attrs:
-                device = obj
-                for attr in attrs:
-                    device = getattr(device, attr)
-                logger.debug('Adding %s to %s namespace',
-                             device.name, cls)
-                setattr(class_space, device.name, device)
+def _class_version(cls):
+    package = sys.modules.get(cls.__module__.split('.')[0])
+    return str(getattr(package, '__version__', None))
 
-    return class_space
+
+def _module_stamps(classes):
+    """
+    Describe the files that define some classes and their parents.
+
+    Returns
+    -------
+    stamps: ``dict`` or ``None``
+        Mapping from module name to the size and modification time of its
+        file. ``None`` if any module has no file.
+    """
+    stamps = {}
+    for cls in classes:
+        for parent in cls.__mro__:
+            name = parent.__module__
+            if name in stamps or name == 'builtins':
+                continue
+            path = getattr(sys.modules.get(name), '__file__', None)
+            try:
+                info = os.stat(path)
+            except (OSError, TypeError):
+                return None
+            stamps[name] = '{}:{}'.format(info.st_mtime_ns, info.st_size)
+    return stamps
+
+
+def _import_class(class_path):
+    module_path, _, qualname = class_path.partition(':')
+    return reduce(getattr, qualname.split('.'), import_module(module_path))
+
+
+def _index_entry(device_cls, paths):
+    """
+    Convert component paths to a JSON-compatible index entry.
+    """
+    if not isinstance(device_cls, type) or not issubclass(device_cls, Device):
+        return None
+    classes = []
+    all_classes = [device_cls] + [sub_cls for attrs, sub_cls in paths]
+    for cls in all_classes:
+        if '<locals>' in cls.__qualname__:
+            return None
+        classes.append(_class_path(cls))
+    modules = _module_stamps(all_classes)
+    if modules is None:
+        return None
+    return dict(version=_class_version(device_cls), modules=modules,
+                paths=[[list(attrs), cls_path] for (attrs, _), cls_path
+                       in zip(paths, classes[1:])])
+
+
+def _saved_paths(device_cls):
+    """
+    Get the saved component paths for a class, or ``None`` if not usable.
+    """
+    if not _saved_index or not isinstance(device_cls, type):
+        return None
+    try:
+        entry = _saved_index[_class_path(device_cls)]
+    except KeyError:
+        return None
+    if entry.get('version') != _class_version(device_cls):
+        logger.debug('Saved component paths for %s are out of date',
+                     device_cls)
+        return None
+    try:
+        paths = [(tuple(attrs), _import_class(cls_path))
+                 for attrs, cls_path in entry['paths']]
+    except Exception:
+        logger.debug('Unable to use saved component paths for %s',
+                     device_cls, exc_info=True)
+        return None
+    modules = _module_stamps([device_cls] + [cls for attrs, cls in paths])
+    if modules is None or modules != entry.get('modules'):
+        logger.debug('Files defining %s have changed', device_cls)
+        return None
+    return paths
 
 
 def tree_namespace(scope=None):
     """
     Create a ``namespace`` that accumulates objects and creates a tree.
 
-    This tree is a nested set of `IterableNamespace` objects based on the
-    object names as defined in scope. We will split on underscores and use the
-    splits to create the tree.
+    This tree is a nested set of `TreeNode` objects based on the object names
+    as defined in scope. We will split on underscores and use the splits to
+    create the tree.
 
     Parameters
     ----------
@@ -128,31 +484,193 @@ def tree_namespace(scope=None):
 
     Returns
     -------
-    namespace: `IterableNamespace`
+    namespace: `TreeNode`
     """
     logger.debug('Create tree_namespace scope=%s', scope)
-    tree_space = IterableNamespace()
+    tree_space = TreeNode()
     scope_objs = extract_objs(scope=scope, stack_offset=1)
 
     for name, obj in scope_objs.items():
-        logger.debug('Add %s to tree namespace', name)
-        upper_space = tree_space
-        keys = name.split('_')[:-1]
-
-        if keys:
-            # Add key to existing namespace branch, create new if needed
-            for key in keys:
-                name = strip_prefix(name, key)
-                # Force lowercase
-                key = key.lower()
-                if not hasattr(upper_space, key):
-                    setattr(upper_space, key, IterableNamespace())
-                upper_space = getattr(upper_space, key)
-            if hasattr(upper_space, name):
-                logger.warning(('Tried to add {} to {}, but something was '
-                                'already there. Two devices share the same '
-                                'name!'.format(name, upper_space)))
-            else:
-                setattr(upper_space, name, obj)
+        _tree_add(tree_space, name, obj)
     logger.debug('Created tree namespace %s', tree_space)
     return tree_space
+
+
+class TreeNode(IterableNamespace):
+    """
+    One branch of a `tree_namespace`.
+
+    Each node is an `IterableNamespace` of its leaves and sub-branches, and
+    also remembers the full name of each leaf and the number of objects
+    beneath it, so `count_ns_leaves` and `TreeNode.query` do not need to walk
+    the whole tree. Use `TreeNamespace` to add or remove objects, rather than
+    setting attributes on the nodes, so these stay correct.
+    """
+    __slots__ = ('_count', '_names')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        object.__setattr__(self, '_count', 0)
+        object.__setattr__(self, '_names', {})
+
+    def _known_leaf_count(self):
+        return self._count
+
+    def query(self, prefix):
+        """
+        Find every object whose full name starts with ``prefix``.
+
+        Parameters
+        ----------
+        prefix: ``str``
+            The start of the object names, e.g. ``mfx_dg2``, leaving out the
+            names of the branches above this node. This is not
+            case-sensitive.
+
+        Returns
+        -------
+        objs: ``dict``
+            Mapping from full name to object, sorted by name
+        """
+        *keys, partial = prefix.split('_')
+        node = self
+        for key in keys:
+            node = vars(node).get(key.lower())
+            if not isinstance(node, TreeNode):
+                return {}
+        found = {}
+        partial = partial.lower()
+        for attr in node._keys():
+            if attr.lower().startswith(partial):
+                child = vars(node)[attr]
+                if attr in node._names:
+                    found[node._names[attr]] = child
+                elif isinstance(child, TreeNode):
+                    found.update(child._leaves())
+        return {name: found[name] for name in sorted(found)}
+
+    def _leaves(self):
+        """
+        Mapping from full name to object for everything beneath this node.
+        """
+        leaves = {}
+        for attr in self._keys():
+            child = vars(self)[attr]
+            if attr in self._names:
+                leaves[self._names[attr]] = child
+            elif isinstance(child, TreeNode):
+                leaves.update(child._leaves())
+        return leaves
+
+
+def _tree_add(tree_space, name, obj):
+    """
+    Add one object to a tree made by `tree_namespace`.
+    """
+    logger.debug('Add %s to tree namespace', name)
+    *keys, leaf = name.split('_')
+    if not keys:
+        return
+    # Add key to existing namespace branch, create new if needed
+    branches = [tree_space]
+    for key in keys:
+        # Force lowercase
+        key = key.lower()
+        upper_space = branches[-1]
+        branch = vars(upper_space).get(key)
+        if branch is None:
+            branch = TreeNode()
+            setattr(upper_space, key, branch)
+        elif not isinstance(branch, TreeNode):
+            branches = None
+            break
+        branches.append(branch)
+    if branches is None or leaf in vars(branches[-1]):
+        logger.warning(('Tried to add {} to {}, but something was '
+                        'already there. Two devices share the same '
+                        'name!'.format(leaf, upper_space)))
+        return
+    setattr(branches[-1], leaf, obj)
+    branches[-1]._names[leaf] = name
+    for branch in branches:
+        object.__setattr__(branch, '_count', branch._count + 1)
+
+
+def _tree_remove(tree_space, name, obj):
+    """
+    Remove one object from a tree, and any branches this leaves empty.
+    """
+    *keys, leaf = name.split('_')
+    if not keys:
+        return
+    keys = [key.lower() for key in keys]
+    branches = [tree_space]
+    for key in keys:
+        branches.append(vars(branches[-1]).get(key))
+        if not isinstance(branches[-1], TreeNode):
+            return
+    if (branches[-1]._names.get(leaf) != name
+            or vars(branches[-1]).get(leaf) is not obj):
+        return
+    logger.debug('Remove %s from tree namespace', name)
+    delattr(branches[-1], leaf)
+    del branches[-1]._names[leaf]
+    for branch in branches:
+        object.__setattr__(branch, '_count', branch._count - 1)
+    for parent, key, branch in zip(reversed(branches[:-1]),
+                                   reversed(keys), reversed(branches[1:])):
+        if len(branch) > 0:
+            break
+        delattr(parent, key)
+
+
+class TreeNamespace:
+    """
+    A `tree_namespace` that is kept up to date as objects come and go.
+
+    Pass `TreeNamespace.update` to `LoadCache.subscribe` and the tree will
+    follow the contents of the cache. Each event only checks the objects that
+    were added or removed.
+
+    Parameters
+    ----------
+    skip: ``set`` of ``str``, optional
+        Names that should never be added to the tree. This is checked at each
+        event, so it may be changed later.
+
+    Attributes
+    ----------
+    space: `TreeNode`
+        The root of the tree
+    """
+    def __init__(self, skip=None):
+        self.skip = skip if skip is not None else set()
+        self.space = TreeNode()
+
+    def query(self, prefix):
+        """
+        Find every object in the tree whose name starts with ``prefix``.
+
+        See `TreeNode.query`.
+        """
+        return self.space.query(prefix)
+
+    def update(self, event, objs):
+        """
+        Add or remove objects from the tree.
+
+        Parameters
+        ----------
+        event: ``str``
+            Either ``add`` or ``remove``
+
+        objs: ``dict``
+            Mapping from name to object for the objects that changed
+        """
+        for name, obj in objs.items():
+            if name.startswith('_') or name in self.skip:
+                continue
+            if event == 'add':
+                _tree_add(self.space, name, obj)
+            elif event == 'remove':
+                _tree_remove(self.space, name, obj)
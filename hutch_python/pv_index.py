@@ -0,0 +1,237 @@
+"""
+This module finds the ``hutch-python`` objects that own an EPICS PV. A
+`PVIndex` follows the `LoadCache` and maps the ``happi`` prefixes, device
+prefixes and signal PV names of the loaded objects back to the object and
+component that use them.
+"""
+from bisect import bisect_left
+from collections import namedtuple
+import logging
+
+from ophyd import Device
+
+from .lazy import LazyDevice
+from .namespace import component_devices
+
+logger = logging.getLogger(__name__)
+
+PVMatch = namedtuple('PVMatch', ['pvname', 'name', 'attr', 'obj'])
+PVMatch.__doc__ = """
+One object that uses a PV, from a `PVIndex` lookup.
+
+``pvname`` is the PV or prefix in the index, ``name`` is the name of the
+object in the session, ``attr`` is the dotted path from that object to the
+component that uses the PV, or an empty ``str`` for the object itself, and
+``obj`` is the object or component.
+"""
+
+
+class PVIndex:
+    """
+    Index from EPICS PV names and prefixes to loaded objects.
+
+    Pass `PVIndex.update` to `LoadCache.subscribe` to keep the index up to
+    date. Objects are only inspected when the index is first used after they
+    are added, and each object is only inspected once.
+
+    A `LazyDevice` that has not been loaded is indexed by its ``happi``
+    prefix alone, so that the index never creates devices.
+
+    Parameters
+    ----------
+    skip: ``set`` of ``str``, optional
+        Names that should never be indexed. This is checked when the objects
+        are inspected, so it may be changed later.
+    """
+    def __init__(self, skip=None):
+        self.skip = skip if skip is not None else set()
+        # Full PV names and device prefixes, mapped to lists of PVMatch
+        self._pvs = {}
+        self._prefixes = {}
+        # The keys each object added, by object name
+        self._keys = {}
+        # Objects that have not been inspected yet
+        self._pending = {}
+        self._sorted_pvs = None
+
+    def update(self, event, objs):
+        """
+        Add or remove objects from the index.
+
+        Parameters
+        ----------
+        event: ``str``
+            Either ``add`` or ``remove``
+
+        objs: ``dict``
+            Mapping from name to object for the objects that changed
+        """
+        for name, obj in objs.items():
+            if event == 'add':
+                self._remove(name)
+                self._pending[name] = obj
+            elif event == 'remove':
+                self._remove(name)
+
+    def lookup(self, pvname):
+        """
+        Find the objects that use exactly this PV.
+
+        Parameters
+        ----------
+        pvname: ``str``
+            The full PV name, or a device prefix
+
+        Returns
+        -------
+        matches: ``list`` of `PVMatch`
+        """
+        self._index_pending()
+        return (list(self._pvs.get(pvname, []))
+                + list(self._prefixes.get(pvname, [])))
+
+    def lookup_prefix(self, prefix):
+        """
+        Find the objects that use any PV that starts with ``prefix``.
+
+        Parameters
+        ----------
+        prefix: ``str``
+            The start of the PV names
+
+        Returns
+        -------
+        matches: ``list`` of `PVMatch`
+            Sorted by PV name
+        """
+        self._index_pending()
+        if self._sorted_pvs is None:
+            self._sorted_pvs = sorted(self._pvs)
+        keys = self._sorted_pvs
+        matches = []
+        for index in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[index].startswith(prefix):
+                break
+            matches.extend(self._pvs[keys[index]])
+        return matches
+
+    def owner(self, pvname):
+        """
+        Find the objects that own a PV.
+
+        This is the exact match from `PVIndex.lookup` if there is one.
+        Otherwise, it is the device with the longest prefix that the PV
+        starts with, e.g. the device with prefix ``MFX:DG2:PIM`` for the PV
+        ``MFX:DG2:PIM:ZOOM``. This finds the device for PVs that are not
+        components of the loaded objects.
+
+        Parameters
+        ----------
+        pvname: ``str``
+            The full PV name
+
+        Returns
+        -------
+        matches: ``list`` of `PVMatch`
+        """
+        matches = self.lookup(pvname)
+        if matches:
+            return matches
+        for end in range(len(pvname) - 1, 0, -1):
+            matches = self._prefixes.get(pvname[:end])
+            if matches:
+                return list(matches)
+        return []
+
+    def _index_pending(self):
+        """
+        Inspect the objects added since the last lookup.
+        """
+        while self._pending:
+            name, obj = self._pending.popitem()
+            if name.startswith('_') or name in self.skip:
+                continue
+            try:
+                pvs, prefixes = object_pvs(name, obj)
+            except Exception:
+                logger.debug('Unable to find PVs for %s', name, exc_info=True)
+                continue
+            keys = []
+            for key, match in pvs:
+                self._pvs.setdefault(key, []).append(match)
+                keys.append((self._pvs, key))
+            for key, match in prefixes:
+                self._prefixes.setdefault(key, []).append(match)
+                keys.append((self._prefixes, key))
+            if keys:
+                self._keys[name] = keys
+                self._sorted_pvs = None
+
+    def _remove(self, name):
+        self._pending.pop(name, None)
+        for mapping, key in self._keys.pop(name, []):
+            matches = [match for match in mapping.get(key, [])
+                       if match.name != name]
+            if matches:
+                mapping[key] = matches
+            else:
+                mapping.pop(key, None)
+            self._sorted_pvs = None
+
+
+def object_pvs(name, obj):
+    """
+    Find the PVs and prefixes used by one object.
+
+    This never creates the real object behind a `LazyDevice`.
+
+    Parameters
+    ----------
+    name: ``str``
+        The object's name in the session
+
+    obj: ``object``
+
+    Returns
+    -------
+    pvs: ``list`` of ``(str, PVMatch)``
+        The full PV names of the object's signals
+
+    prefixes: ``list`` of ``(str, PVMatch)``
+        The ``happi`` prefix and the device prefixes of the object and its
+        subdevices
+    """
+    pvs = []
+    prefixes = []
+    if isinstance(obj, LazyDevice):
+        md = obj.lazy_md
+        if md is not None and getattr(md, 'prefix', None):
+            prefixes.append((md.prefix, PVMatch(md.prefix, name, '', obj)))
+        if not obj.lazy_loaded:
+            return pvs, prefixes
+        obj = obj.lazy_load()
+
+    if isinstance(obj, Device):
+        devices = [('', obj)]
+        for attrs, cls, device in component_devices(obj):
+            if issubclass(cls, Device):
+                devices.append(('.'.join(attrs), device))
+        seen = set((key, match.attr) for key, match in prefixes)
+        for attr, device in devices:
+            prefix = getattr(device, 'prefix', None)
+            if prefix and (prefix, attr) not in seen:
+                seen.add((prefix, attr))
+                prefixes.append((prefix, PVMatch(prefix, name, attr, device)))
+        signals = [(walk.dotted_name, walk.item)
+                   for walk in obj.walk_signals(include_lazy=False)]
+    else:
+        signals = [('', obj)]
+
+    for attr, signal in signals:
+        found = set()
+        for pv_attr in ('pvname', 'setpoint_pvname'):
+            pvname = getattr(signal, pv_attr, None)
+            if isinstance(pvname, str) and pvname and pvname not in found:
+                found.add(pvname)
+                pvs.append((pvname, PVMatch(pvname, name, attr, signal)))
+    return pvs, prefixes
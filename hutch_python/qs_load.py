@@ -1,22 +1,314 @@
 import logging
 import os.path
+import time
+from concurrent.futures import Future
 from configparser import NoOptionError, ConfigParser
+from pathlib import Path
+from threading import Thread
 
 import happi
-from happi.loader import load_devices
 from happi.backends.qs_db import QSBackend
 
+from .constants import QS_CACHE_TTL
+from .disk_cache import read_cache, write_cache
+from .happi import load_containers, IndexedBackend
 from .utils import safe_load
 
 logger = logging.getLogger(__name__)
 
+# The most recent background refresh of a saved questionnaire
+refresh_thread = None
 
-def get_qs_objs(proposal, run):
+# Login details that the questionnaire adds to each document. These are never
+# saved, and are filled in again from the current login when a saved copy is
+# used.
+CREDENTIAL_FIELDS = ('user', 'pw', 'kerberos')
+
+
+def get_qs_objs(proposal, run, max_workers=None, lazy=False, cache_dir=None,
+                ttl=QS_CACHE_TTL, docs=None):
     """
     Gather user objects from the experiment questionnaire.
 
     Connects to the questionnaire webservice via the ``happi`` ``QSBackend``
-    using ``psdm_qs_cli`` to collect well-defined devices.
+    using ``psdm_qs_cli`` to collect well-defined devices. See `get_qs_docs`
+    for details on authentication and on the saved copy of the questionnaire
+    that is used if ``cache_dir`` is provided.
+
+    Parameters
+    ----------
+    proposal: ``str``
+        The experiment's proposal number
+
+    run: ``str``
+        A string representation of the run number
+
+    max_workers: ``int``, optional
+        Number of threads to use to instantiate the devices. See
+        `happi.load_containers`.
+
+    lazy: ``bool``, optional
+        If ``True``, return `LazyDevice` placeholders instead of devices. See
+        `happi.load_containers`.
+
+    cache_dir: ``Path``, optional
+        Directory to save the questionnaire in. See `get_qs_docs`.
+
+    ttl: ``float``, optional
+        Seconds to trust the saved questionnaire. See `get_qs_docs`.
+
+    docs: ``dict`` or ``Future``, optional
+        Documents that were already requested, e.g. by a background call to
+        `get_qs_docs`. A ``Future`` is waited on, and any error it raised is
+        handled like an error requesting the documents here.
+
+    Returns
+    -------
+    objs: ``dict``
+        Mapping from questionnaire ``python name`` to loaded object.
+    """
+    logger.debug('get_qs_objs(%s, %s)', proposal, run)
+    with safe_load('questionnaire'):
+        proposal = proposal.upper()
+        if docs is None:
+            docs = get_qs_docs(proposal, run, cache_dir=cache_dir, ttl=ttl)
+        elif isinstance(docs, Future):
+            docs = docs.result()
+        return load_qs_docs(proposal, docs, max_workers=max_workers,
+                            lazy=lazy)
+    return {}
+
+
+def load_qs_docs(proposal, docs, max_workers=None, lazy=False):
+    """
+    Create the devices described by questionnaire documents.
+
+    Parameters
+    ----------
+    proposal: ``str``
+        The experiment's proposal number, used for log messages
+
+    docs: ``dict``
+        Mapping from ``_id`` to questionnaire document, as returned by
+        `get_qs_docs`
+
+    max_workers: ``int``, optional
+        See `happi.load_containers`.
+
+    lazy: ``bool``, optional
+        See `happi.load_containers`.
+
+    Returns
+    -------
+    objs: ``dict``
+        Mapping from questionnaire ``python name`` to loaded object.
+    """
+    # Create namespace
+    if not docs:
+        logger.warning("No devices found in PCDS Questionnaire for %s",
+                       proposal)
+        return dict()
+    qs_client = happi.Client(database=IndexedBackend(docs=docs))
+    return load_containers(*qs_client.all_devices,
+                           max_workers=max_workers, lazy=lazy)
+
+
+def get_qs_docs(proposal, run, cache_dir=None, ttl=QS_CACHE_TTL):
+    """
+    Get the device documents from the experiment questionnaire.
+
+    If ``cache_dir`` is provided, the documents are saved there for each
+    proposal and run. A saved copy that is newer than ``ttl`` seconds is
+    returned right away, and the questionnaire is checked again in a
+    background thread so that the next session gets any changes. An older
+    copy is only used if the questionnaire cannot be reached. The login
+    details in the documents are not saved, see `strip_credentials`.
+
+    Parameters
+    ----------
+    proposal: ``str``
+        The experiment's proposal number
+
+    run: ``str``
+        A string representation of the run number
+
+    cache_dir: ``Path``, optional
+        Directory to save the questionnaire in. If omitted, always ask the
+        questionnaire webservice.
+
+    ttl: ``float``, optional
+        Seconds to trust the saved questionnaire without asking the
+        webservice first.
+
+    Returns
+    -------
+    docs: ``dict``
+        Mapping from ``_id`` to questionnaire document
+    """
+    global refresh_thread
+    if cache_dir is None:
+        return fetch_qs_docs(proposal, run)
+    path = Path(cache_dir) / 'qs_{}{}.json'.format(proposal.lower(), run)
+    key = dict(proposal=proposal.upper(), run=str(run))
+    saved = read_cache(path, key=key)
+    if saved is not None and time.time() - saved['fetched'] < ttl:
+        logger.debug('Using saved questionnaire from %s', path)
+        refresh_thread = Thread(target=save_qs_docs,
+                                args=(proposal, run, path, key),
+                                name='qs_refresh', daemon=True)
+        refresh_thread.start()
+        return add_credentials(saved['docs'], saved.get('login_ids', []))
+    try:
+        return save_qs_docs(proposal, run, path, key, raise_errors=True)
+    except Exception:
+        if saved is None:
+            raise
+        logger.warning('Unable to reach the questionnaire, using the copy '
+                       'saved on %s', time.ctime(saved['fetched']))
+        logger.debug('', exc_info=True)
+        return add_credentials(saved['docs'], saved.get('login_ids', []))
+
+
+def save_qs_docs(proposal, run, path, key, raise_errors=False):
+    """
+    Ask the questionnaire for the device documents and save them.
+
+    Parameters
+    ----------
+    proposal: ``str``
+        The experiment's proposal number
+
+    run: ``str``
+        A string representation of the run number
+
+    path: ``Path``
+        The file to save the documents in
+
+    key: ``dict``
+        The key to save with the documents, see `disk_cache.write_cache`
+
+    raise_errors: ``bool``, optional
+        If ``False``, the default, log errors instead of raising them. This is
+        used for the background refresh.
+
+    Returns
+    -------
+    docs: ``dict`` or ``None``
+        ``None`` if there was an error and ``raise_errors`` is ``False``.
+    """
+    try:
+        docs = fetch_qs_docs(proposal, run)
+    except Exception:
+        if raise_errors:
+            raise
+        logger.debug('Unable to refresh the saved questionnaire',
+                     exc_info=True)
+        return None
+    stripped, login_ids = strip_credentials(docs)
+    write_cache(path, dict(fetched=time.time(), docs=stripped,
+                           login_ids=login_ids),
+                key=key)
+    return docs
+
+
+def strip_credentials(docs):
+    """
+    Remove the login details from questionnaire documents.
+
+    Parameters
+    ----------
+    docs: ``dict``
+        Mapping from ``_id`` to questionnaire document
+
+    Returns
+    -------
+    stripped: ``dict``
+        Copies of the documents without the `CREDENTIAL_FIELDS`
+
+    login_ids: ``list`` of ``str``
+        The ``_id`` of each document that had login details, so that
+        `add_credentials` can fill them in
+    """
+    stripped = {}
+    login_ids = []
+    for _id, doc in docs.items():
+        if any(field in doc for field in CREDENTIAL_FIELDS):
+            login_ids.append(_id)
+        stripped[_id] = {field: value for field, value in doc.items()
+                         if field not in CREDENTIAL_FIELDS}
+    return stripped, login_ids
+
+
+def add_credentials(docs, login_ids):
+    """
+    Fill in the login details removed by `strip_credentials`.
+
+    The values come from the current user's login, see `qs_login`, rather
+    than from whoever saved the documents.
+
+    Parameters
+    ----------
+    docs: ``dict``
+        Mapping from ``_id`` to questionnaire document
+
+    login_ids: ``list`` of ``str``
+        The ``_id`` of each document to fill in
+
+    Returns
+    -------
+    docs: ``dict``
+        Copies of the documents with the `CREDENTIAL_FIELDS` filled in
+    """
+    if not login_ids:
+        return docs
+    login = qs_login()
+    values = dict(user=login['user'], pw=login['pw'],
+                  kerberos=login['use_kerberos'])
+    filled = dict(docs)
+    for _id in login_ids:
+        if _id in filled:
+            filled[_id] = dict(filled[_id], **values)
+    return filled
+
+
+def qs_login():
+    """
+    Find out how to log in to the questionnaire.
+
+    See `fetch_qs_docs` for the configuration files that are checked.
+
+    Returns
+    -------
+    login: ``dict``
+        The ``use_kerberos``, ``user`` and ``pw`` arguments for the
+        ``QSBackend``
+    """
+    # Determine which method of authentication we are going to use.
+    # Search for a configuration file, either in the current directory
+    # or hidden in the users home directory. If not found, attempt to
+    # launch the client via Kerberos
+    cfg = ConfigParser()
+    cfgs = cfg.read(['qs.cfg', '.qs.cfg',
+                     os.path.expanduser('~/.qs.cfg'),
+                     'web.cfg', '.web.cfg',
+                     os.path.expanduser('~/.web.cfg')])
+    # Ws-auth
+    if cfgs:
+        user = cfg.get('DEFAULT', 'user', fallback=None)
+        try:
+            pw = cfg.get('DEFAULT', 'pw')
+        except NoOptionError as exc:
+            raise ValueError("Must specify password as 'pw' in "
+                             "configuration file") from exc
+        return dict(use_kerberos=False, user=user, pw=pw)
+    # Kerberos
+    else:
+        return dict(use_kerberos=True, user=None, pw=None)
+
+
+def fetch_qs_docs(proposal, run):
+    """
+    Ask the questionnaire webservice for the device documents.
 
     There are two possible methods of authentication to the
     ``QuestionnaireClient``, ``Kerberos`` and ``WS-Auth``. The first is simpler
@@ -43,41 +335,10 @@ def get_qs_objs(proposal, run):
 
     Returns
     -------
-    objs: ``dict``
-        Mapping from questionnaire ``python name`` to loaded object.
+    docs: ``dict``
+        Mapping from ``_id`` to questionnaire document
     """
-    logger.debug('get_qs_objs(%s, %s)', proposal, run)
-    with safe_load('questionnaire'):
-        proposal = proposal.upper()
-        # Determine which method of authentication we are going to use.
-        # Search for a configuration file, either in the current directory
-        # or hidden in the users home directory. If not found, attempt to
-        # launch the client via Kerberos
-        cfg = ConfigParser()
-        cfgs = cfg.read(['qs.cfg', '.qs.cfg',
-                         os.path.expanduser('~/.qs.cfg'),
-                         'web.cfg', '.web.cfg',
-                         os.path.expanduser('~/.web.cfg')])
-        # Ws-auth
-        if cfgs:
-            user = cfg.get('DEFAULT', 'user', fallback=None)
-            try:
-                pw = cfg.get('DEFAULT', 'pw')
-            except NoOptionError as exc:
-                raise ValueError("Must specify password as 'pw' in "
-                                 "configuration file") from exc
-            qs_client = happi.Client(database=QSBackend(run, proposal,
-                                                        use_kerberos=False,
-                                                        user=user, pw=pw))
-        # Kerberos
-        else:
-            qs_client = happi.Client(database=QSBackend(run, proposal,
-                                                        use_kerberos=True))
-        # Create namespace
-        if not qs_client.all_devices:
-            logger.warning("No devices found in PCDS Questionnaire for %s",
-                           proposal)
-            return dict()
-        dev_namespace = load_devices(*qs_client.all_devices, pprint=False)
-        return dev_namespace.__dict__
-    return {}
+    proposal = proposal.upper()
+    backend = QSBackend(run, proposal, **qs_login())
+    docs = backend.find(multiples=True) or []
+    return {doc['_id']: doc for doc in docs}
@@ -0,0 +1,235 @@
+"""
+This module provides a search over the objects loaded by ``hutch-python``.
+A `SearchIndex` follows the `LoadCache` and indexes the name, class, ``happi``
+metadata and component names of each object, so that ``search('dg2')`` can
+find devices without scanning every object on each query.
+"""
+from collections import Counter, namedtuple
+import logging
+from types import ModuleType
+
+from .lazy import LazyDevice
+from .namespace import component_paths
+from .utils import IterableNamespace
+
+logger = logging.getLogger(__name__)
+
+# happi metadata to include in the index
+MD_FIELDS = ('prefix', 'location', 'purpose', 'beamline', 'stand')
+
+# Order of the results for matches in each field
+FIELD_RANKS = {'name': 0, 'component': 1, 'prefix': 2, 'location': 3,
+               'purpose': 4, 'beamline': 5, 'stand': 6, 'class': 7}
+
+SearchResult = namedtuple('SearchResult', ['name', 'obj', 'field', 'text'])
+SearchResult.__doc__ = """
+One match from `SearchIndex.search`.
+
+``name`` and ``obj`` are the matching object and its name in the session,
+``field`` is where the query was found, e.g. ``name``, ``prefix`` or
+``component``, and ``text`` is the text that matched.
+"""
+
+
+class SearchIndex:
+    """
+    Index of object names and metadata for fast searches.
+
+    Pass `SearchIndex.update` to `LoadCache.subscribe` to keep the index up to
+    date. Each event only indexes the objects that were added or removed, and
+    a search only checks the objects that share the query's three-letter
+    sequences.
+
+    Parameters
+    ----------
+    skip: ``set`` of ``str``, optional
+        Names that should never be indexed, such as the names of namespaces.
+        This is checked at each event, so it may be changed later.
+    """
+    def __init__(self, skip=None):
+        self.skip = skip if skip is not None else set()
+        self._objs = {}
+        # Mapping from name to a list of (field, text) pairs
+        self._fields = {}
+        # Mapping from three-letter sequence to names
+        self._trigrams = {}
+
+    def update(self, event, objs):
+        """
+        Add or remove objects from the index.
+
+        Parameters
+        ----------
+        event: ``str``
+            Either ``add`` or ``remove``
+
+        objs: ``dict``
+            Mapping from name to object for the objects that changed
+        """
+        for name, obj in objs.items():
+            if event == 'add':
+                self.add(name, obj)
+            elif event == 'remove' and self._objs.get(name) is obj:
+                self.remove(name)
+
+    def add(self, name, obj):
+        """
+        Add one object to the index, replacing any object with this name.
+        """
+        self.remove(name)
+        if (name.startswith('_') or name in self.skip
+                or isinstance(obj, (IterableNamespace, ModuleType))):
+            return
+        fields = object_fields(name, obj)
+        self._objs[name] = obj
+        self._fields[name] = fields
+        for field, text in fields:
+            for tri in trigrams(text):
+                self._trigrams.setdefault(tri, set()).add(name)
+
+    def remove(self, name):
+        """
+        Remove one object from the index.
+        """
+        fields = self._fields.pop(name, None)
+        if fields is None:
+            return
+        del self._objs[name]
+        for field, text in fields:
+            for tri in trigrams(text):
+                names = self._trigrams.get(tri)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self._trigrams[tri]
+
+    def search(self, query, fuzzy=True, limit=None):
+        """
+        Find the objects that match a query.
+
+        Objects are found if any of their indexed text contains ``query``,
+        ignoring case. Matches in the object's name are listed first, then
+        component names, ``happi`` metadata and finally the class.
+
+        Parameters
+        ----------
+        query: ``str``
+            The text to look for
+
+        fuzzy: ``bool``, optional
+            If ``True``, the default, and nothing contains ``query``, return
+            the objects that share the most three-letter sequences with it
+            instead. This finds names with small typos.
+
+        limit: ``int``, optional
+            The maximum number of results to return
+
+        Returns
+        -------
+        results: ``list`` of `SearchResult`
+        """
+        query = query.lower().strip()
+        if not query:
+            return []
+        query_tris = trigrams(query)
+        if query_tris:
+            sets = sorted((self._trigrams.get(tri, set())
+                           for tri in query_tris), key=len)
+            candidates = set.intersection(*sets)
+        else:
+            candidates = self._fields.keys()
+
+        results = []
+        for name in candidates:
+            matches = [(FIELD_RANKS.get(field, len(FIELD_RANKS)), field, text)
+                       for field, text in self._fields[name]
+                       if query in text]
+            if matches:
+                rank, field, text = min(matches)
+                if field == 'name':
+                    # Exact names, then names that start with the query
+                    rank = (rank, text != query, not text.startswith(query))
+                else:
+                    rank = (rank, True, True)
+                results.append((rank, name, field, text))
+
+        if not results and fuzzy and query_tris:
+            results = self._fuzzy(query_tris)
+
+        results.sort()
+        if limit is not None:
+            results = results[:limit]
+        return [SearchResult(name, self._objs[name], field, text)
+                for rank, name, field, text in results]
+
+    def _fuzzy(self, query_tris, cutoff=0.5):
+        """
+        Find the objects that share most of the query's trigrams.
+        """
+        hits = Counter()
+        for tri in query_tris:
+            hits.update(self._trigrams.get(tri, ()))
+        results = []
+        for name, count in hits.items():
+            score = count / len(query_tris)
+            if score < cutoff:
+                continue
+            # Report the field that shares the most trigrams
+            field, text = max(self._fields[name],
+                              key=lambda item: len(trigrams(item[1])
+                                                   & query_tris))
+            results.append((-score, name, field, text))
+        return results
+
+    def __len__(self):
+        return len(self._objs)
+
+
+def object_fields(name, obj):
+    """
+    Find the text to index for one object.
+
+    This never creates the real object behind a `LazyDevice`.
+
+    Parameters
+    ----------
+    name: ``str``
+        The object's name in the session
+
+    obj: ``object``
+
+    Returns
+    -------
+    fields: ``list`` of ``(str, str)``
+        Pairs of field name and lowercase text
+    """
+    fields = [('name', name)]
+    if isinstance(obj, LazyDevice):
+        cls = obj.lazy_class
+    else:
+        cls = type(obj)
+    if cls is not None:
+        fields.append(('class', '{}.{}'.format(cls.__module__,
+                                               cls.__qualname__)))
+        for attrs, sub_cls in component_paths(cls):
+            fields.append(('component', '_'.join((name,) + attrs)))
+    if isinstance(obj, LazyDevice):
+        md = obj.lazy_md
+    else:
+        try:
+            md = getattr(obj, 'md', None)
+        except Exception:
+            md = None
+    if md is not None:
+        for field in MD_FIELDS:
+            value = getattr(md, field, None)
+            if isinstance(value, str) and value:
+                fields.append((field, value))
+    return [(field, text.lower()) for field, text in fields]
+
+
+def trigrams(text):
+    """
+    Return the ``set`` of three-letter sequences in ``text``.
+    """
+    return set(text[i:i+3] for i in range(len(text) - 2))
@@ -0,0 +1,272 @@
+"""
+This module schedules the steps of the ``hutch-python`` startup. Each step is
+a `Stage` that declares which other stages it needs, and `run_stages` runs
+independent stages concurrently while adding their objects to the
+`LoadCache` with the same result as a fully serial startup.
+
+A `SessionSnapshot` records the inputs and outputs of each stage, so that the
+next startup can rebuild the objects of stages with unchanged inputs without
+repeating their slow steps.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
+import logging
+
+from .disk_cache import normalize_key, read_cache, write_cache
+from .timing import startup_timer
+from .utils import safe_load
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    A single step of the startup sequence.
+
+    Parameters
+    ----------
+    name: ``str``
+        The name of the stage. If ``safe`` is ``True``, this is also the name
+        that is used in the `safe_load` log messages.
+
+    func: ``callable``
+        Function with no arguments that runs the stage. If this returns a
+        ``dict``, the contents will be added to the `LoadCache`.
+
+    requires: ``list`` of ``str``, optional
+        Names of the stages that must be finished, with their objects added
+        to the `LoadCache`, before this stage can begin.
+
+    safe: ``bool``, optional
+        If ``True``, the default, run ``func`` inside of `safe_load`. Set this
+        to ``False`` for stages that do their own error handling.
+
+    inputs: ``callable``, optional
+        Function with no arguments that returns a JSON-compatible description
+        of everything the stage's results depend on. Used with a
+        `SessionSnapshot`.
+
+    record: ``callable``, optional
+        Function that takes the stage's objects and returns a JSON-compatible
+        description of them to save in the `SessionSnapshot`.
+
+    replay: ``callable``, optional
+        Function that takes a description from ``record`` and returns the
+        stage's objects. This is used instead of ``func`` when the ``inputs``
+        match the snapshot, and should skip the stage's slow steps.
+    """
+    def __init__(self, name, func, requires=None, safe=True, inputs=None,
+                 record=None, replay=None):
+        self.name = name
+        self.func = func
+        self.requires = list(requires or [])
+        self.safe = safe
+        self.inputs = inputs
+        self.record = record
+        self.replay = replay
+
+    def run(self, snapshot=None):
+        """
+        Run the stage and return its objects.
+
+        Parameters
+        ----------
+        snapshot: `SessionSnapshot`, optional
+            If provided, replay the stage from the snapshot when possible and
+            record the new results.
+
+        Returns
+        -------
+        objs: ``dict``
+            Mapping from name to object. This is empty if the stage failed or
+            did not return a ``dict``.
+        """
+        objs = None
+        # A safe stage is timed once, by safe_load
+        if self.safe:
+            timer = safe_load(self.name, kind='stage')
+        else:
+            timer = startup_timer.time(self.name, kind='stage')
+        with timer:
+            inputs = None
+            if snapshot is not None and self.inputs is not None:
+                try:
+                    inputs = self.inputs()
+                except Exception:
+                    logger.debug('Unable to find inputs for stage %s',
+                                 self.name, exc_info=True)
+            if inputs is not None and self.replay is not None:
+                objs = self._replay(snapshot.get(self.name, inputs))
+            if objs is None:
+                objs = self.func()
+                if inputs is not None and self.record is not None:
+                    self._record(snapshot, inputs, objs)
+        if not isinstance(objs, dict):
+            objs = {}
+        return objs
+
+    def _replay(self, outputs):
+        """
+        Rebuild the objects from saved outputs, or return ``None``.
+        """
+        if outputs is None:
+            return None
+        try:
+            objs = self.replay(outputs)
+        except Exception:
+            logger.warning('Unable to reuse the saved %s, loading normally',
+                           self.name)
+            logger.debug('', exc_info=True)
+            return None
+        logger.debug('Rebuilt stage %s from the session snapshot', self.name)
+        return objs
+
+    def _record(self, snapshot, inputs, objs):
+        if not isinstance(objs, dict):
+            return
+        try:
+            snapshot.record(self.name, inputs, self.record(objs))
+        except Exception:
+            logger.debug('Unable to record stage %s', self.name,
+                         exc_info=True)
+
+    def __repr__(self):
+        return 'Stage({}, requires={})'.format(self.name, self.requires)
+
+
+def run_stages(stages, cache, max_workers=None, snapshot=None):
+    """
+    Run a sequence of `Stage` objects on a thread pool.
+
+    A stage is started as soon as all of the stages it requires have finished
+    and had their objects added to the ``cache``, without waiting for any
+    unrelated stage. Each stage's objects are added as soon as it finishes.
+    If two stages make objects with the same name, the stage that was given
+    later keeps it, regardless of which stage finishes first, so the final
+    contents of the ``cache`` match a serial run of the same stages.
+
+    Requirements that name a stage that is not part of ``stages`` are ignored.
+    This lets the caller skip stages that are not configured without
+    rewriting the requirements of the others.
+
+    Parameters
+    ----------
+    stages: ``list`` of `Stage`
+        The stages to run. Every stage must be listed after all of the stages
+        it requires.
+
+    cache: `LoadCache`
+        The cache to add each stage's objects to. The name of the stage is
+        saved as the source of its objects.
+
+    max_workers: ``int``, optional
+        The maximum number of stages to run at the same time. If omitted, use
+        the ``ThreadPoolExecutor`` default.
+
+    snapshot: `SessionSnapshot`, optional
+        If provided, stages with unchanged inputs are replayed from the
+        snapshot, and the results of the others are recorded in it. The
+        snapshot is not saved here.
+    """
+    names = [stage.name for stage in stages]
+    for index, stage in enumerate(stages):
+        for req in stage.requires:
+            if req in names and names.index(req) > index:
+                raise ValueError('Stage {} requires {}, which is scheduled '
+                                 'later'.format(stage.name, req))
+
+    waiting = list(enumerate(stages))
+    finished = set()
+    running = {}
+    # Index of the stage that set each object, to resolve name conflicts
+    owners = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while waiting or running:
+            # Start everything that has all its requirements in the cache
+            for index, stage in list(waiting):
+                if all(req in finished or req not in names
+                       for req in stage.requires):
+                    logger.debug('Starting stage %s', stage.name)
+                    running[executor.submit(
+                        stage.run, snapshot=snapshot)] = (index, stage)
+                    waiting.remove((index, stage))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, stage = running.pop(future)
+                objs = {name: obj for name, obj in future.result().items()
+                        if owners.get(name, index) <= index}
+                owners.update((name, index) for name in objs)
+                cache.update(objs, source=stage.name)
+                finished.add(stage.name)
+                logger.debug('Finished stage %s', stage.name)
+
+
+class SessionSnapshot:
+    """
+    The saved inputs and outputs of each `Stage` of a startup.
+
+    Parameters
+    ----------
+    path: ``str`` or ``Path``
+        The snapshot file
+
+    key: ``object``, optional
+        JSON-compatible description of the whole session, e.g. the
+        configuration. The saved stages are only used if this matches the
+        ``key`` they were saved with.
+    """
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = key
+        self._lock = Lock()
+        self._saved = read_cache(path, key=key) or {}
+        self._stages = dict(self._saved)
+
+    def get(self, name, inputs):
+        """
+        Get the saved outputs of a stage.
+
+        Parameters
+        ----------
+        name: ``str``
+            The name of the stage
+
+        inputs: ``object``
+            The stage's current inputs
+
+        Returns
+        -------
+        outputs: ``object`` or ``None``
+            ``None`` if the stage was not saved or had different inputs.
+        """
+        with self._lock:
+            entry = self._stages.get(name)
+        if entry is None or entry.get('inputs') != normalize_key(inputs):
+            logger.debug('No matching snapshot for stage %s', name)
+            return None
+        return entry.get('outputs')
+
+    def record(self, name, inputs, outputs):
+        """
+        Save the inputs and outputs of a stage for the next session.
+        """
+        entry = normalize_key(dict(inputs=inputs, outputs=outputs))
+        with self._lock:
+            self._stages[name] = entry
+
+    def save(self):
+        """
+        Write the snapshot file if anything was recorded.
+
+        Returns
+        -------
+        written: ``bool``
+        """
+        with self._lock:
+            if self._stages == self._saved:
+                return False
+            stages = dict(self._stages)
+        if write_cache(self.path, stages, key=self.key):
+            self._saved = stages
+            return True
+        return False
@@ -11,6 +11,7 @@ import pytest
 from elog import HutchELog
 
 import hutch_python.utils
+from hutch_python.log_setup import stop_queue
 
 # We need to have the tests directory importable to match what we'd have in a
 # real hutch-python install
@@ -37,6 +38,7 @@ def restore_logging():
     """
     prev_handlers = copy(logging.root.handlers)
     yield
+    stop_queue()
     logging.root.handlers = prev_handlers
 
 
@@ -1,7 +1,14 @@
+import json
 import logging
+from pathlib import Path
+from types import SimpleNamespace
 
 from hutch_python.cache import LoadCache
-from hutch_python.load_conf import default_class_namespace
+from hutch_python.lazy import LazyDevice
+from hutch_python.load_conf import (default_class_namespace,
+                                    default_class_namespaces,
+                                    default_tree_namespace,
+                                    default_all_objects)
 from hutch_python.utils import extract_objs
 
 logger = logging.getLogger(__name__)
@@ -28,3 +35,67 @@ def test_load_cache_importable():
 
     import hutch_python.db
     assert hutch_python.db.one == 1
+
+
+def test_load_cache_events():
+    logger.debug('test_load_cache_events')
+    cache = LoadCache('fake3.db', one=1)
+    events = []
+    cache.subscribe(lambda event, objs: events.append((event, objs)))
+    cache(two=2)
+    cache(one=1.0)
+    cache.remove('two', 'three')
+    assert events == [('add', dict(two=2)),
+                      ('remove', dict(one=1)), ('add', dict(one=1.0)),
+                      ('remove', dict(two=2))]
+    assert not hasattr(cache.objs, 'two')
+
+
+def test_load_cache_incremental_groups():
+    logger.debug('test_load_cache_incremental_groups')
+    cache = LoadCache('fake4.db', tst_one_a=1)
+    skip = set(['a', 'all_objects'])
+    default_class_namespaces([(int, 'nums'), (float, 'floats')], cache,
+                             skip=skip)
+    default_tree_namespace(cache, skip=skip)
+    default_all_objects(cache)
+    assert cache.objs.nums.tst_one_a == 1
+    assert not hasattr(cache.objs, 'floats')
+    assert not hasattr(cache.objs, 'tst')
+    cache(tst_two_b=2.0)
+    assert cache.objs.floats.tst_two_b == 2.0
+    assert cache.objs.f is cache.objs.floats
+    assert cache.objs.tst.two.b == 2.0
+    assert cache.objs.all_objects.tst_two_b == 2.0
+    assert cache.objs.all_objects.tst is cache.objs.tst
+    cache.remove('tst_one_a')
+    assert len(cache.objs.nums) == 0
+    assert not hasattr(cache.objs.tst, 'one')
+    assert not hasattr(cache.objs.all_objects, 'tst_one_a')
+
+
+def test_write_manifest(tmpdir):
+    logger.debug('test_write_manifest')
+    hutch_dir = Path(str(tmpdir))
+    (hutch_dir / 'tst').mkdir()
+    cache = LoadCache('tst.db', hutch_dir=hutch_dir)
+    md = SimpleNamespace(_id='tst_lazy', prefix='TST:LAZY')
+    lazy = LazyDevice(lambda: 1, 'tst_lazy', cls=int, md=md)
+    cache.update(dict(tst_lazy=lazy), source='database')
+    cache(one=1)
+    cache.write_file()
+    assert not lazy.lazy_loaded
+    assert 'tst_lazy' in (hutch_dir / 'tst' / 'db.txt').read_text()
+    manifest_path = hutch_dir / 'tst' / 'db.json'
+    with manifest_path.open() as f:
+        manifest = json.load(f)
+    assert manifest['module'] == 'tst.db'
+    assert manifest['objects'] == [
+        {'name': 'tst_lazy', 'class': 'builtins.int', 'happi_id': 'tst_lazy',
+         'prefix': 'TST:LAZY', 'source': 'database'},
+        {'name': 'one', 'class': 'builtins.int', 'happi_id': None,
+         'prefix': None, 'source': None}]
+    # Only written when something changed
+    assert not cache.write_manifest(manifest_path)
+    cache.remove('one')
+    assert cache.write_manifest(manifest_path)
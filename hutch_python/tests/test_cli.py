@@ -8,6 +8,7 @@ import pytest
 from hutch_python.cli import (setup_cli_env, hutch_ipython_embed, run_script,
                               start_user)
 from hutch_python.load_conf import load
+from hutch_python.log_setup import get_debug_handler
 import hutch_python.cli
 
 from conftest import cli_args, restore_logging
@@ -50,6 +51,17 @@ def test_sim_arg():
             setup_cli_env()
 
 
+def test_profile_startup_arg():
+    logger.debug('test_profile_startup_arg')
+
+    with cli_args(['hutch_python', '--cfg', CFG, '--profile-startup']):
+        with restore_logging():
+            setup_cli_env()
+            log_path = Path(get_debug_handler().baseFilename)
+
+    assert log_path.with_name(log_path.stem + '_startup.json').exists()
+
+
 def create_arg_test(env=None):
     hutch = 'temp_create'
     test_dir = CFG_PATH.parent.parent.parent / hutch
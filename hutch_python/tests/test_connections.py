@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+
+from ophyd.device import Device, Component
+from ophyd.signal import Signal
+from ophyd.sim import SynAxis
+
+from hutch_python.connections import (connection_report,
+                                      start_connection_report,
+                                      device_signals)
+from hutch_python.lazy import LazyDevice
+
+logger = logging.getLogger(__name__)
+
+
+class SlowSignal(Signal):
+    """
+    Simulated signal that connects when ``online`` is set.
+    """
+    online = None
+
+    @property
+    def connected(self):
+        return self.online is not None and self.online.is_set()
+
+
+class Gauge(Device):
+    pressure = Component(SlowSignal)
+    status = Component(SlowSignal)
+
+
+def make_gauge(name, *online):
+    gauge = Gauge(name=name)
+    for signal, event in zip((gauge.pressure, gauge.status), online):
+        signal.online = event
+    return gauge
+
+
+def test_device_signals():
+    logger.debug('test_device_signals')
+    gauge = make_gauge('gauge')
+    assert [attr for attr, sig in device_signals(gauge)] == ['pressure',
+                                                             'status']
+    assert device_signals(gauge.pressure) == [('', gauge.pressure)]
+    assert device_signals(1) == []
+    lazy = LazyDevice(lambda: make_gauge('lazy'), 'lazy', cls=Gauge)
+    assert device_signals(lazy) == []
+    assert not lazy.lazy_loaded
+
+
+def test_connection_report():
+    logger.debug('test_connection_report')
+    up = threading.Event()
+    up.set()
+    late = threading.Event()
+    never = threading.Event()
+    objs = dict(motor=SynAxis(name='motor'),
+                good=make_gauge('good', up, late),
+                half=make_gauge('half', up, never),
+                bad=make_gauge('bad', never, never),
+                num=1)
+    threading.Timer(0.2, late.set).start()
+    start = time.monotonic()
+    report = connection_report(objs=objs, timeout=1, poll=0.01)
+    # All devices share one deadline
+    assert time.monotonic() - start < 2
+    assert report.connected == ['good', 'motor']
+    assert report.partial == ['half']
+    assert report.disconnected == ['bad']
+    assert report.devices['half'].missing == ['status']
+    assert report.devices['half'].connected == 1
+    assert report.devices['half'].total == 2
+    assert 'bad' in report.table()
+    assert 'motor' not in report.table()
+    assert '2 connected' in repr(report)
+
+
+def test_connection_report_background():
+    logger.debug('test_connection_report_background')
+    reports = []
+    objs = dict(bad=make_gauge('bad'))
+    thread = start_connection_report(objs=objs, timeout=0.1,
+                                     callback=reports.append)
+    thread.join(timeout=5)
+    assert reports[0].disconnected == ['bad']
+    # The default callback logs the report
+    start_connection_report(objs=objs, timeout=0.1).join(timeout=5)
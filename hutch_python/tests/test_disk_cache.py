@@ -0,0 +1,55 @@
+import logging
+import os
+import stat
+from pathlib import Path
+
+from hutch_python.disk_cache import get_cache_dir, read_cache, write_cache
+
+logger = logging.getLogger(__name__)
+
+
+def test_get_cache_dir(tmpdir):
+    logger.debug('test_get_cache_dir')
+    assert get_cache_dir(None) is None
+    cache_dir = get_cache_dir(str(tmpdir))
+    assert cache_dir.exists()
+    assert cache_dir.parent == Path(str(tmpdir)) / '.cache'
+    assert get_cache_dir(str(tmpdir)) == cache_dir
+    # Only the user can change their own directory
+    assert stat.S_IMODE(cache_dir.stat().st_mode) == 0o700
+    assert cache_dir.parent.stat().st_mode & stat.S_ISVTX
+    assert not cache_dir.parent.stat().st_mode & stat.S_IWOTH
+    # Caches left writable by older versions are fixed
+    cache_dir.parent.chmod(0o777)
+    cache_dir.chmod(0o777)
+    get_cache_dir(str(tmpdir))
+    assert not cache_dir.parent.stat().st_mode & stat.S_IWOTH
+    assert stat.S_IMODE(cache_dir.stat().st_mode) == 0o700
+
+
+def test_get_cache_dir_other_owner(tmpdir, monkeypatch):
+    logger.debug('test_get_cache_dir_other_owner')
+    cache_dir = get_cache_dir(str(tmpdir))
+    # A directory that someone else owns is not used
+    monkeypatch.setattr(os, 'getuid', lambda: cache_dir.stat().st_uid + 1)
+    assert get_cache_dir(str(tmpdir)) is None
+
+
+def test_read_write_cache(tmpdir):
+    logger.debug('test_read_write_cache')
+    path = tmpdir.join('cache.json')
+    assert read_cache(path) is None
+    key = dict(mtime=1, conf=('a', 'b'))
+    assert write_cache(path, {'one': 1}, key=key)
+    assert read_cache(path, key=key) == {'one': 1}
+    assert read_cache(path) == {'one': 1}
+    assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o600
+    assert write_cache(path, {'one': 1}, key=key, mode=0o640)
+    assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o640
+    assert read_cache(path, key=dict(mtime=2, conf=('a', 'b'))) is None
+    # Unusable data and files are not errors
+    assert not write_cache(path, object())
+    assert read_cache(path, key=key) == {'one': 1}
+    path.write('not json')
+    assert read_cache(path) is None
+    assert len(tmpdir.listdir()) == 1
@@ -1,11 +1,18 @@
 import os.path
 import logging
+import pytest
 import simplejson
 import tempfile
+from types import SimpleNamespace
 
+from happi.backends.json_db import JSONBackend
 from lightpath.config import beamlines
 
-from hutch_python.happi import get_happi_objs, get_lightpath
+import hutch_python.happi
+from hutch_python.happi import (get_happi_objs, get_lightpath,
+                                get_happi_client, IndexedBackend,
+                                load_containers, get_hutch_client,
+                                get_happi_docs, load_docs, database_key)
 
 logger = logging.getLogger(__name__)
 
@@ -38,3 +45,99 @@ def test_get_lightpath():
     # Check that we created a valid BeamPath with no inactive objects
     assert obj.name == 'TST'
     assert len(obj.devices) == 2
+
+
+def test_shared_client(monkeypatch):
+    logger.debug("test_shared_client")
+    db = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                      'happi_db.json')
+    monkeypatch.setattr(hutch_python.happi, '_clients', {})
+    loads = []
+    orig_load = JSONBackend.load
+
+    def counted_load(self):
+        loads.append(self.path)
+        return orig_load(self)
+
+    monkeypatch.setattr(JSONBackend, 'load', counted_load)
+    assert get_happi_client(db) is get_happi_client(db)
+    get_happi_objs(db, 'tst')
+    get_lightpath(db, 'tst')
+    assert len(loads) == 1
+
+
+def test_indexed_backend():
+    logger.debug("test_indexed_backend")
+    docs = {'a': dict(_id='a', beamline='TST', active=True, z=2.0),
+            'b': dict(_id='b', beamline='TST', active=True, z=1.0),
+            'c': dict(_id='c', beamline='TST', active=False, z=0.0),
+            'd': dict(_id='d', beamline='RBD', active=True, z=None)}
+    backend = IndexedBackend(docs=docs)
+    found = backend.find(multiples=True, beamline='TST', active=True)
+    assert [doc['_id'] for doc in found] == ['b', 'a']
+    assert backend.find(_id='c')['active'] is False
+    assert backend.find(_id='e') is None
+    assert len(backend.find(multiples=True, active=True)) == 3
+
+
+def test_threaded_load():
+    logger.debug("test_threaded_load")
+    db = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                      'happi_db.json')
+    serial = get_happi_objs(db, 'tst')
+    threaded = get_happi_objs(db, 'tst', max_workers=4)
+    assert list(serial) == list(threaded)
+    # Failures are stored in place of the device
+    objs = load_containers(SimpleNamespace(name='bad1'),
+                           SimpleNamespace(name='bad2'), max_workers=2)
+    assert list(objs) == ['bad1', 'bad2']
+    assert all(isinstance(obj, Exception) for obj in objs.values())
+
+
+def test_search_snapshot(monkeypatch, tmpdir):
+    logger.debug("test_search_snapshot")
+    db = str(tmpdir.join('db.json'))
+    with open(os.path.join(os.path.dirname(__file__), 'happi_db.json')) as f:
+        contents = f.read()
+    with open(db, 'w') as f:
+        f.write(contents)
+    cache_dir = tmpdir.mkdir('cache')
+    monkeypatch.setattr(hutch_python.happi, '_clients', {})
+    objs = get_happi_objs(db, 'tst', cache_dir=cache_dir)
+    assert len(objs) == 2
+    assert cache_dir.join('happi_tst.json').exists()
+
+    # New session should not need the full database
+    def no_full_client(db):
+        raise RuntimeError('Should have used the snapshot')
+
+    monkeypatch.setattr(hutch_python.happi, '_clients', {})
+    monkeypatch.setattr(hutch_python.happi, 'get_happi_client',
+                        no_full_client)
+    assert list(get_happi_objs(db, 'tst', cache_dir=cache_dir)) == list(objs)
+    assert get_lightpath(db, 'tst', cache_dir=cache_dir).name == 'TST'
+
+    # Changing the database means we need to search again
+    with open(db, 'w') as f:
+        f.write(contents + '\n')
+    monkeypatch.setattr(hutch_python.happi, '_clients', {})
+    with pytest.raises(RuntimeError):
+        get_hutch_client(db, 'tst', cache_dir=cache_dir)
+
+
+def test_load_docs(monkeypatch):
+    logger.debug("test_load_docs")
+    db = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                      'happi_db.json')
+    objs = get_happi_objs(db, 'tst')
+    names = list(objs)[::-1] + ['not_in_db']
+    docs = get_happi_docs(db, 'tst', names)
+    assert [doc['name'] for doc in docs] == names[:-1]
+
+    # Loading from the documents should not search the database
+    def no_search(client, hutch):
+        raise RuntimeError('Should not search')
+
+    monkeypatch.setattr(hutch_python.happi, 'search_hutch', no_search)
+    assert list(load_docs(docs)) == names[:-1]
+    assert database_key(db, 'tst')['hutch'] == 'TST'
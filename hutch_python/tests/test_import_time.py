@@ -0,0 +1,64 @@
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+logger = logging.getLogger(__name__)
+
+# Seconds allowed for "import hutch_python.cli", override with the
+# HUTCH_PYTHON_IMPORT_BUDGET environment variable on slow machines
+CLI_IMPORT_BUDGET = float(os.environ.get('HUTCH_PYTHON_IMPORT_BUDGET', 0.5))
+
+# Modules that should only be imported by the code that uses them
+HEAVY_MODULES = ('matplotlib', 'IPython', 'cookiecutter', 'pcdsdaq',
+                 'bluesky', 'ophyd', 'happi', 'lightpath', 'elog',
+                 'pcdsdevices')
+
+
+def run_python(*args):
+    return subprocess.run([sys.executable] + list(args),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+def import_breakdown(module, count=15):
+    """
+    The slowest imports under ``module``, from ``-X importtime``.
+    """
+    if sys.version_info < (3, 7):
+        return '(-X importtime needs Python 3.7 for a breakdown)'
+    # Each line is "import time: self [us] | cumulative | imported package"
+    result = run_python('-X', 'importtime', '-c', 'import ' + module)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    rows.sort(reverse=True)
+    return '\n'.join('{:8.3f}s {}'.format(us / 1e6, name)
+                     for us, name in rows[:count])
+
+
+def test_cli_import_time():
+    logger.debug('test_cli_import_time')
+    code = ('import time; start = time.perf_counter(); '
+            'import hutch_python.cli; '
+            'print(time.perf_counter() - start)')
+    elapsed = float(run_python('-c', code).stdout.split()[-1])
+    logger.info('import hutch_python.cli took %.3fs', elapsed)
+    if elapsed >= CLI_IMPORT_BUDGET:
+        pytest.fail('import hutch_python.cli took {:.3f}s, over the {}s '
+                    'budget. Slowest imports:\n{}'
+                    ''.format(elapsed, CLI_IMPORT_BUDGET,
+                              import_breakdown('hutch_python.cli')))
+
+
+def test_cli_lazy_imports():
+    logger.debug('test_cli_lazy_imports')
+    code = ('import sys, hutch_python.cli; '
+            'print(" ".join(sys.modules))')
+    modules = run_python('-c', code).stdout.split()
+    for name in HEAVY_MODULES:
+        assert name not in modules, '{} imported by cli'.format(name)
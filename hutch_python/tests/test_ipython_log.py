@@ -1,9 +1,11 @@
 import logging
 import sys
 
+import numpy as np
 import pytest
 
-from hutch_python.ipython_log import IPythonLogger
+import hutch_python.ipython_log
+from hutch_python.ipython_log import IPythonLogger, short_repr, skip_output
 
 logger = logging.getLogger(__name__)
 
@@ -73,3 +75,40 @@ def test_ipython_logger(log_queue, fake_ipython):
     ipylog.In = None
     ipylog.log()
     assert 'Logging error' in log_queue.get(block=False).getMessage()
+
+
+class SlowRepr:
+    def __repr__(self):
+        raise AssertionError('Built the full repr')
+
+    def __str__(self):
+        raise AssertionError('Built the full str')
+
+
+class Text:
+    def __str__(self):
+        return 'text'
+
+
+def test_short_repr(monkeypatch):
+    logger.debug('test_short_repr')
+    monkeypatch.setattr(hutch_python.ipython_log, '_skip_types', set())
+    assert short_repr(2) == '2'
+    # Outputs are logged like str
+    assert short_repr('text') == 'text'
+    assert short_repr(Text()) == 'text'
+    items = [Text(), np.arange(3)]
+    assert short_repr(items) == str(items)
+    assert short_repr(np.arange(3)) == '[0 1 2]'
+    assert len(short_repr('x' * 10000)) <= 280
+    assert len(short_repr(list(range(100000)))) <= 280
+    assert short_repr(list(range(100))).endswith('...]')
+    text = short_repr(np.arange(1000000))
+    assert text == str(np.arange(1000000))
+    assert '...' in text
+    assert text.endswith('999999]')
+    assert len(short_repr('x' * 100, limit=10)) == 10
+
+    skip_output(SlowRepr, 'numpy.ndarray')
+    assert 'SlowRepr' in short_repr(SlowRepr())
+    assert short_repr(np.arange(3)) == '<numpy.ndarray object>'
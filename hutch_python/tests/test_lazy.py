@@ -0,0 +1,90 @@
+import logging
+from types import SimpleNamespace
+
+from ophyd.device import Device, Component
+
+from hutch_python.cache import LoadCache
+from hutch_python.lazy import LazyDevice
+from hutch_python.namespace import (ClassNamespaces, class_namespace,
+                                    tree_namespace)
+
+logger = logging.getLogger(__name__)
+
+
+class Inner(Device):
+    leaf = Component(Device)
+
+
+class Outer(Device):
+    inner = Component(Inner)
+
+
+def make_lazy(name, loads):
+    def loader():
+        loads.append(name)
+        return Outer(name=name)
+    return LazyDevice(loader, name, cls=Outer,
+                      md=SimpleNamespace(prefix='TST:' + name))
+
+
+def test_lazy_device():
+    logger.debug('test_lazy_device')
+    loads = []
+    lazy = make_lazy('tst_outer', loads)
+    # Metadata does not create the device
+    assert lazy.name == 'tst_outer'
+    assert lazy.md.prefix == 'TST:tst_outer'
+    assert lazy.lazy_class is Outer
+    assert 'not loaded' in repr(lazy)
+    assert not lazy.lazy_loaded
+    assert loads == []
+    # Anything else does, but only once
+    assert lazy.inner.leaf.name == 'tst_outer_inner_leaf'
+    assert isinstance(lazy.lazy_load(), Outer)
+    assert lazy.lazy_loaded
+    assert loads == ['tst_outer']
+    # Class from an import path
+    lazy = LazyDevice(dict, 'str_cls', cls='ophyd.device.Device')
+    assert lazy.lazy_class is Device
+    lazy = LazyDevice(dict, 'bad_cls', cls='not.a.module.Class')
+    assert lazy.lazy_class is None
+
+
+def test_lazy_namespaces():
+    logger.debug('test_lazy_namespaces')
+    loads = []
+    scope = SimpleNamespace(tst_outer=make_lazy('tst_outer', loads),
+                            tst_other=make_lazy('tst_other', loads))
+    inner_space = class_namespace(Inner, scope)
+    device_space = class_namespace(Device, scope)
+    tree = tree_namespace(scope)
+    assert loads == []
+    assert len(inner_space) == 2
+    assert isinstance(inner_space.tst_outer_inner, LazyDevice)
+    assert len(device_space) == 6
+    assert len(tree.tst) == 2
+    # Loading a component loads the parent
+    assert isinstance(inner_space.tst_outer_inner.lazy_load(), Inner)
+    assert loads == ['tst_outer']
+
+
+def test_lazy_load_events():
+    logger.debug('test_lazy_load_events')
+    loads = []
+    cache = LoadCache('lazy.db')
+    spaces = ClassNamespaces([Inner])
+    cache.subscribe(spaces.update)
+    events = []
+    cache.subscribe(lambda event, objs: events.append((event, list(objs))))
+    lazy = make_lazy('tst_outer', loads)
+    cache.update(dict(tst_outer=lazy))
+    assert isinstance(spaces.spaces[0].tst_outer_inner, LazyDevice)
+    # Loading the device sends the events again with the real components
+    lazy.lazy_load()
+    assert events[-2:] == [('remove', ['tst_outer']), ('add', ['tst_outer'])]
+    inner = spaces.spaces[0].tst_outer_inner
+    assert isinstance(inner, Inner)
+    assert inner is lazy.inner
+    # Only once
+    lazy.lazy_load()
+    assert len(events) == 3
@@ -1,13 +1,17 @@
 import logging
 import os.path
+import threading
 from socket import gethostname
 from types import SimpleNamespace
 
+import pytest
 from pcdsdaq.sim import set_sim_mode
 from pcdsdevices.mv_interface import Presets
 
+import hutch_python.ipython_log
 import hutch_python.qs_load
-from hutch_python.load_conf import load, load_conf
+from hutch_python.constants import CONNECTION_TIMEOUT, QS_CACHE_TTL
+from hutch_python.load_conf import load, load_conf, session_key, module_stamps
 
 from .conftest import QSBackend, ELog
 
@@ -81,6 +85,7 @@ def test_skip_failures():
     logger.debug('test_skip_failures')
     # Should not raise
     load_conf(dict(hutch=345243, db=12351324, experiment=2341234, load=123454,
+                   device_workers='many', check_connections='yes',
                    bananas='dole'))
 
 
@@ -93,7 +98,155 @@ def test_auto_experiment(fake_curexp_script):
     assert objs['x'].inj_x == objs['inj_x']
 
 
+def test_prefetch_experiment(monkeypatch):
+    logger.debug('test_prefetch_experiment')
+    hutch_python.qs_load.QSBackend = QSBackend
+    threads = []
+
+    def fake_current_experiment(hutch, **kwargs):
+        threads.append(threading.current_thread())
+        return hutch + 'lr1215'
+
+    monkeypatch.setattr(hutch_python.load_conf, 'get_current_experiment',
+                        fake_current_experiment)
+    objs = load_conf(dict(hutch='tst'))
+    assert objs['inj_x'].run == '15'
+    # Looked up once, off of the main thread
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
 def test_cannot_auto():
     logger.debug('test_cannot_auto')
     # Fail silently
     load_conf(dict(hutch='tst'))
+
+
+@pytest.fixture(scope='function')
+def happi_calls(monkeypatch):
+    calls = []
+
+    def fake_get_happi_objs(db, hutch, **kwargs):
+        calls.append(kwargs)
+        return {}
+
+    monkeypatch.setattr(hutch_python.load_conf, 'get_happi_objs',
+                        fake_get_happi_objs)
+    monkeypatch.setattr(hutch_python.load_conf, 'get_lightpath',
+                        lambda *args, **kwargs: None)
+    return calls
+
+
+def happi_conf(**conf):
+    return dict(db='/nonexistent/db.json', **conf)
+
+
+def test_conf_device_workers(happi_calls):
+    logger.debug('test_conf_device_workers')
+    for value, expected in ((4, 4), ('many', None), (0, None), (2.5, None)):
+        load_conf(happi_conf(device_workers=value))
+        assert happi_calls[-1]['max_workers'] == expected
+
+
+def test_conf_lazy_devices(happi_calls):
+    logger.debug('test_conf_lazy_devices')
+    for value, expected in ((True, True), (False, False), ('yes', False)):
+        load_conf(happi_conf(lazy_devices=value))
+        assert happi_calls[-1]['lazy'] is expected
+
+
+def test_conf_qs_cache_ttl(monkeypatch):
+    logger.debug('test_conf_qs_cache_ttl')
+    ttls = []
+
+    def fake_get_qs_docs(proposal, run, **kwargs):
+        ttls.append(kwargs['ttl'])
+        return {}
+
+    monkeypatch.setattr(hutch_python.load_conf, 'get_qs_docs',
+                        fake_get_qs_docs)
+    experiment = dict(proposal='lr12', run='15')
+    for value, expected in ((600, 600), (0, 0), (-1, QS_CACHE_TTL),
+                            ('soon', QS_CACHE_TTL)):
+        load_conf(dict(experiment=experiment, qs_cache_ttl=value))
+        assert ttls[-1] == expected
+
+
+def test_conf_check_connections(monkeypatch):
+    logger.debug('test_conf_check_connections')
+    timeouts = []
+
+    def fake_connection_report(objs, timeout):
+        timeouts.append(timeout)
+
+    monkeypatch.setattr(hutch_python.load_conf, 'start_connection_report',
+                        fake_connection_report)
+    for value, expected in ((True, [CONNECTION_TIMEOUT]), (2, [2]),
+                            (False, []), ('yes', []), (-1, []),
+                            (None, [])):
+        timeouts.clear()
+        load_conf(dict(check_connections=value))
+        assert timeouts == expected
+
+
+def test_conf_experiment_max_age(monkeypatch):
+    logger.debug('test_conf_experiment_max_age')
+    ages = []
+
+    def fake_current_experiment(hutch, **kwargs):
+        ages.append(kwargs['max_age'])
+        raise RuntimeError('No experiment')
+
+    monkeypatch.setattr(hutch_python.load_conf, 'get_current_experiment',
+                        fake_current_experiment)
+    for value, expected in ((1800, 1800), (-5, 0), ('long', 0), (True, 0)):
+        load_conf(dict(hutch='tst', experiment_max_age=value))
+        assert ages[-1] == expected
+
+
+def test_conf_skip_output(monkeypatch):
+    logger.debug('test_conf_skip_output')
+    monkeypatch.setattr(hutch_python.ipython_log, '_skip_types', set())
+    load_conf(dict(skip_output='numpy.ndarray'))
+    load_conf(dict(skip_output=['pandas.DataFrame', 'xarray.Dataset']))
+    load_conf(dict(skip_output=5))
+    assert hutch_python.ipython_log._skip_types == {
+        'numpy.ndarray', 'pandas.DataFrame', 'xarray.Dataset'}
+
+
+def test_warm_start_questionnaire(monkeypatch, tmpdir):
+    logger.debug('test_warm_start_questionnaire')
+    hutch_python.qs_load.QSBackend = QSBackend
+    conf = dict(experiment=dict(proposal='lr12', run='15'), warm_start=True)
+    objs = load_conf(conf, hutch_dir=str(tmpdir))
+    assert objs['inj_x'].run == '15'
+    snapshot = next(tmpdir.join('.cache').visit('session_*.json'))
+    # The login is never saved
+    assert '"pw"' not in snapshot.read()
+
+    def no_questionnaire(*args, **kwargs):
+        raise ConnectionError('Questionnaire is down')
+
+    monkeypatch.setattr(hutch_python.load_conf, 'get_qs_docs',
+                        no_questionnaire)
+    # Replayed from the snapshot without the questionnaire
+    objs = load_conf(conf, hutch_dir=str(tmpdir))
+    assert objs['inj_x'].run == '15'
+    # Not after a change to the hutch's files
+    tmpdir.mkdir('experiments').join('lr1215.py').write('x = 1\n')
+    objs = load_conf(conf, hutch_dir=str(tmpdir))
+    assert 'inj_x' not in objs
+    # Or without warm_start
+    conf['warm_start'] = False
+    assert 'inj_x' not in load_conf(conf, hutch_dir=str(tmpdir))
+
+
+def test_session_key(tmpdir):
+    logger.debug('test_session_key')
+    conf = dict(hutch='tst')
+    key = session_key(conf, str(tmpdir), 'tst')
+    assert key == session_key(dict(hutch='tst'), str(tmpdir), 'tst')
+    assert key != session_key(dict(hutch='xpp'), str(tmpdir), 'tst')
+    tmpdir.mkdir('tst').join('beamline.py').write('x = 1\n')
+    assert list(module_stamps(str(tmpdir), 'tst')) == ['tst/beamline.py']
+    assert key != session_key(conf, str(tmpdir), 'tst')
@@ -0,0 +1,123 @@
+import gzip
+import json
+import logging
+import shutil
+import sys
+
+import pytest
+
+from hutch_python.log_query import (query_logs, build_index, index_file,
+                                    format_entry, find_log_files, main)
+from hutch_python.log_setup import JSONFormatter
+
+logger = logging.getLogger(__name__)
+
+
+def write_entries(path, entries, mode='w'):
+    formatter = JSONFormatter()
+    with open(str(path), mode) as f:
+        for created, level, name, msg in entries:
+            record = logging.makeLogRecord(dict(
+                created=created, levelno=level,
+                levelname=logging.getLevelName(level), name=name, msg=msg))
+            f.write(formatter.format(record) + '\n')
+
+
+ENTRIES = [(100 + i, logging.DEBUG, 'ophyd.signal', 'debug {}'.format(i))
+           for i in range(10)]
+ENTRIES[3] = (103, logging.WARNING, 'ophyd.signal', 'warning 3')
+ENTRIES[7] = (107, logging.INFO, 'hutch_python', 'info 7')
+
+
+def messages(entries):
+    return [entry['message'] for entry in entries]
+
+
+def test_json_formatter():
+    logger.debug('test_json_formatter')
+    try:
+        raise RuntimeError('oops')
+    except RuntimeError:
+        record = logging.getLogger('tst').makeRecord(
+            'tst', logging.ERROR, 'file.py', 10, 'hello %s', ('world',),
+            sys.exc_info(), func='func')
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry['message'] == 'hello world'
+    assert entry['level'] == 'ERROR'
+    assert entry['logger'] == 'tst'
+    assert entry['line'] == 10
+    assert 'RuntimeError' in entry['exc']
+    assert 'hello world' in format_entry(entry)
+
+
+def test_query_logs(tmpdir):
+    logger.debug('test_query_logs')
+    path = tmpdir.join('session.jsonl')
+    write_entries(path, ENTRIES)
+
+    assert len(list(query_logs(str(path), block_size=3))) == 10
+    assert messages(query_logs(str(path), start=102, end=104,
+                               block_size=3)) == ['debug 2', 'warning 3',
+                                                  'debug 4']
+    assert messages(query_logs(str(path), level='INFO',
+                               block_size=3)) == ['warning 3', 'info 7']
+    assert messages(query_logs(str(path), level=logging.INFO,
+                               name='hutch_python',
+                               block_size=3)) == ['info 7']
+    assert len(list(query_logs(str(path), name='ophyd', block_size=3))) == 9
+    assert not list(query_logs(str(path), name='oph', block_size=3))
+    with pytest.raises(ValueError):
+        list(query_logs(str(path), level='LOUD'))
+
+
+def test_build_index(tmpdir):
+    logger.debug('test_build_index')
+    path = tmpdir.join('session.jsonl')
+    write_entries(path, ENTRIES[:5])
+    blocks = build_index(str(path), block_size=3)
+    assert index_file(str(path)).exists()
+    # The index follows the umask like the log file itself
+    mode = index_file(str(path)).stat().st_mode & 0o777
+    assert mode == path.stat().mode & 0o777
+    assert [(block['start'], block['stop']) for block in blocks] == [
+        (100, 102), (103, 104)]
+    assert blocks[1]['levelno'] == logging.WARNING
+    assert blocks[0]['loggers'] == ['ophyd.signal']
+
+    # New lines extend the saved index
+    write_entries(path, ENTRIES[5:], mode='a')
+    with open(str(path), 'a') as f:
+        f.write('{"time": 200, "partial')
+    blocks = build_index(str(path), block_size=3)
+    assert [(block['start'], block['stop']) for block in blocks] == [
+        (100, 102), (103, 105), (106, 108), (109, 109)]
+    assert build_index(str(path), block_size=3) == blocks
+
+    # A new file with the same name is indexed from the start
+    write_entries(path, ENTRIES[8:])
+    blocks = build_index(str(path), block_size=3)
+    assert [(block['start'], block['stop']) for block in blocks] == [
+        (108, 109)]
+
+
+def test_query_compressed(tmpdir, capsys):
+    logger.debug('test_query_compressed')
+    month = tmpdir.mkdir('2018_03')
+    path = month.join('session.jsonl')
+    write_entries(path, ENTRIES)
+    with open(str(path), 'rb') as f_in:
+        with gzip.open(str(path) + '.1.gz', 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+    month.join('session.log').write('not json\n')
+
+    assert len(find_log_files(str(tmpdir))) == 2
+    assert messages(query_logs(str(path) + '.1.gz', level='WARNING',
+                               block_size=3)) == ['warning 3']
+    # Compressed files are read in full instead of indexed
+    assert not index_file(str(path) + '.1.gz').exists()
+    with pytest.raises(ValueError):
+        build_index(str(path) + '.1.gz')
+    assert len(list(query_logs(str(tmpdir), level='WARNING'))) == 2
+
+    main([str(path), '--level', 'WARNING'])
+    assert 'warning 3' in capsys.readouterr().out
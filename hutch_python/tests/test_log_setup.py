@@ -1,22 +1,31 @@
+import gzip
+import os
+import time
 import logging
+import threading
 from logging.handlers import QueueHandler
 from pathlib import Path
+from queue import Queue
 
 import pytest
 
 from hutch_python.log_setup import (setup_logging, get_session_logfiles,
                                     get_console_handler, set_console_level,
                                     debug_mode, debug_context, debug_wrapper,
-                                    get_debug_handler)
+                                    get_debug_handler, get_handler,
+                                    setup_queue, stop_queue,
+                                    DroppingQueueHandler,
+                                    CompressingRotatingFileHandler,
+                                    clean_logs, RateLimitFilter)
 
 from conftest import restore_logging
 
 logger = logging.getLogger(__name__)
 
 
-def test_setup_logging():
+def test_setup_logging(tmpdir):
     logger.debug('test_setup_logging')
-    dir_logs = Path(__file__).parent / 'logs'
+    dir_logs = Path(str(tmpdir)) / 'logs'
 
     with restore_logging():
         setup_logging()
@@ -39,11 +48,11 @@ def test_console_handler(log_queue):
         assert isinstance(handler, QueueHandler)
 
 
-def test_get_session_logfiles():
+def test_get_session_logfiles(tmpdir):
     logger.debug('test_get_session_logfiles')
     with restore_logging():
         # Create a parent log file
-        setup_logging(dir_logs=Path(__file__).parent / 'logs')
+        setup_logging(dir_logs=Path(str(tmpdir)) / 'logs')
         debug_handler = get_debug_handler()
         debug_handler.doRollover()
         debug_handler.doRollover()
@@ -52,6 +61,181 @@ def test_get_session_logfiles():
                     for log in get_session_logfiles()])
 
 
+def test_setup_queue(tmpdir):
+    logger.debug('test_setup_queue')
+    with restore_logging():
+        setup_logging(dir_logs=Path(str(tmpdir)) / 'logs', use_queue=True)
+        root = logging.getLogger('')
+        debug_handler = get_debug_handler()
+        assert debug_handler not in root.handlers
+        assert isinstance(get_handler('queue'), DroppingQueueHandler)
+        logger.debug('through the queue')
+        stop_queue()
+        with open(debug_handler.baseFilename) as f:
+            assert 'through the queue' in f.read()
+
+    # Off by default
+    with restore_logging():
+        setup_logging(dir_logs=Path(str(tmpdir)) / 'logs')
+        assert get_debug_handler() in logging.getLogger('').handlers
+        with pytest.raises(RuntimeError):
+            get_handler('queue')
+
+    with restore_logging():
+        assert setup_queue(['not_a_handler']) is None
+
+
+def test_setup_structured(tmpdir):
+    logger.debug('test_setup_structured')
+    with restore_logging():
+        setup_logging(dir_logs=Path(str(tmpdir)) / 'logs',
+                      use_queue=True, structured=True)
+        json_handler = get_handler('json')
+        assert json_handler not in logging.getLogger('').handlers
+        logger.info('structured message')
+        stop_queue()
+        with open(json_handler.baseFilename) as f:
+            assert 'structured message' in f.read()
+
+    # Not written unless asked for
+    with restore_logging():
+        setup_logging(dir_logs=Path(str(tmpdir)) / 'logs')
+        with pytest.raises(RuntimeError):
+            get_handler('json')
+
+
+def test_queue_overflow():
+    logger.debug('test_queue_overflow')
+    queue = Queue(maxsize=2)
+    handler = DroppingQueueHandler(queue)
+    for i in range(5):
+        handler.handle(logging.makeLogRecord(dict(msg=str(i))))
+    assert handler.dropped == 3
+    assert queue.qsize() == 2
+
+    # The next record after the queue has room reports the drops
+    queue.get()
+    queue.get()
+    handler.handle(logging.makeLogRecord(dict(msg='after')))
+    assert 'Dropped 3' in queue.get().getMessage()
+    assert queue.get().getMessage() == 'after'
+
+
+def test_compressing_handler(tmpdir):
+    logger.debug('test_compressing_handler')
+    path = str(tmpdir.join('session.log'))
+    handler = CompressingRotatingFileHandler(path, backupCount=2)
+    for text in ('first', 'second', 'third', 'fourth'):
+        handler.handle(logging.makeLogRecord(dict(msg=text)))
+        handler.doRollover()
+    handler.close()
+    assert sorted(os.listdir(str(tmpdir))) == ['session.log',
+                                               'session.log.1.gz',
+                                               'session.log.2.gz']
+    with gzip.open(path + '.1.gz', 'rt') as f:
+        assert f.read().strip() == 'fourth'
+    with gzip.open(path + '.2.gz', 'rt') as f:
+        assert f.read().strip() == 'third'
+
+
+def test_clean_logs(tmpdir):
+    logger.debug('test_clean_logs')
+    old = time.time() - 10 * 86400
+    files = {}
+    for month, name, size, mtime in (('2018_01', 'a.log', 10, old),
+                                     ('2018_02', 'b.log', 10, old + 1),
+                                     ('2018_02', 'c.log.1.gz', 10, None),
+                                     ('2018_03', 'd.log', 10, None),
+                                     ('2018_03', 'e.log', 10, old - 1)):
+        path = tmpdir.join(month).ensure(name)
+        path.write('x' * size)
+        if mtime is not None:
+            os.utime(str(path), (mtime, mtime))
+        files[name] = path
+    other = tmpdir.ensure('other', 'f.log')
+    os.utime(str(other), (old, old))
+
+    # e.log is the current session and is kept
+    removed = clean_logs(str(tmpdir), max_days=5, keep=[str(files['e.log'])])
+    assert sorted(path.name for path in removed) == ['a.log', 'b.log']
+    assert not tmpdir.join('2018_01').exists()
+    assert other.exists()
+
+    removed = clean_logs(str(tmpdir), max_bytes=15)
+    assert [path.name for path in removed] == ['e.log', 'c.log.1.gz']
+    assert files['d.log'].exists()
+
+
+def test_clean_logs_other_users(tmpdir, monkeypatch):
+    logger.debug('test_clean_logs_other_users')
+    old = time.time() - 10 * 86400
+    path = tmpdir.join('2018_01').ensure('other_user.log')
+    path.write('x' * 10)
+    os.utime(str(path), (old, old))
+    # Every file belongs to someone else
+    monkeypatch.setattr(os, 'getuid', lambda: path.stat().uid + 1)
+    assert not clean_logs(str(tmpdir), max_bytes=0, max_days=1)
+    assert path.exists()
+
+
+def test_setup_retention(tmpdir):
+    logger.debug('test_setup_retention')
+    dir_logs = Path(str(tmpdir)) / 'logs'
+    old_file = dir_logs / '2018_01' / 'old.log'
+    old_file.parent.mkdir(parents=True)
+    old_file.touch()
+    os.utime(str(old_file), (0, 0))
+    # Nothing is deleted unless asked for
+    with restore_logging():
+        setup_logging(dir_logs=dir_logs)
+    assert old_file.exists()
+    with restore_logging():
+        setup_logging(dir_logs=dir_logs, use_retention=True)
+    for thread in threading.enumerate():
+        if thread.name == 'clean_logs':
+            thread.join()
+    assert not old_file.exists()
+
+
+def make_record(msg, *args, name='ophyd', level=logging.WARNING):
+    return logging.makeLogRecord(dict(name=name, levelno=level, msg=msg,
+                                      args=args))
+
+
+def test_rate_limit_filter(log_queue):
+    logger.debug('test_rate_limit_filter')
+    rate_limit = RateLimitFilter(window=0.2, burst=2, min_level=logging.INFO)
+    kept = [rate_limit.filter(make_record('PV %s down', i)) for i in range(5)]
+    assert kept == [True, True, False, False, False]
+    assert rate_limit.suppressed == 3
+    # Different loggers, templates and low levels are counted separately
+    assert rate_limit.filter(make_record('PV %s down', 0, name='pyepics'))
+    assert rate_limit.filter(make_record('Other'))
+    assert all(rate_limit.filter(make_record('Low', level=logging.DEBUG))
+               for i in range(5))
+
+    # A second handler reuses the decision for the same record
+    record = make_record('PV %s down', 5)
+    assert not rate_limit.filter(record)
+    assert not rate_limit.filter(record)
+    assert rate_limit.suppressed == 4
+
+    # The next kept repeat reports the dropped count
+    time.sleep(0.25)
+    record = make_record('PV %s down', 6)
+    assert rate_limit.filter(record)
+    assert 'suppressed 4 similar' in record.getMessage()
+    assert record.getMessage().startswith('PV 6 down')
+
+    # Windows that end without a repeat are reported by a log message
+    for i in range(3):
+        rate_limit.filter(make_record('Other'))
+    clear(log_queue)
+    time.sleep(0.25)
+    rate_limit.filter(make_record('Another'))
+    assert 'Suppressed 1 similar' in log_queue.get(block=False).getMessage()
+
+
 def setup_queue_console():
     root_logger = logging.getLogger('')
     for handler in root_logger.handlers:
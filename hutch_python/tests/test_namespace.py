@@ -4,7 +4,14 @@ from types import SimpleNamespace
 from ophyd.device import Device, Component
 from ophyd.signal import Signal
 
-from hutch_python.namespace import class_namespace, tree_namespace
+import hutch_python.namespace
+from hutch_python.namespace import (class_namespace, class_namespaces,
+                                    component_paths, component_devices,
+                                    tree_namespace,
+                                    ClassNamespaces, TreeNamespace,
+                                    load_component_index,
+                                    save_component_index)
+from hutch_python.utils import count_ns_leaves
 
 
 logger = logging.getLogger(__name__)
@@ -51,6 +58,102 @@ def test_class_namespace_subdevices():
     assert not hasattr(device_space, 'tree_oranges')
 
 
+def test_class_namespaces():
+    logger.debug('test_class_namespaces')
+    scope = SimpleNamespace(one=1, two=2.0, four=lambda x: 4,
+                            tree=NormalDevice(name='tree'))
+    int_space, func_space, err_space, layer_space = class_namespaces(
+        [int, 'function', 'erqwerasd', Layer], scope)
+    assert int_space.one == 1
+    assert func_space.four(1) == 4
+    assert len(err_space) == 0
+    assert isinstance(layer_space.tree_veggies, Layer)
+    assert len(layer_space) == 1
+    # Same results as one class at a time
+    device_space, = class_namespaces([Device], scope)
+    assert (sorted(vars(device_space)) ==
+            sorted(vars(class_namespace(Device, scope))))
+
+
+def test_class_namespaces_update():
+    logger.debug('test_class_namespaces_update')
+    namespaces = ClassNamespaces([int, Layer], skip=set(['skipped']))
+    ints, layers = namespaces.spaces
+    namespaces.update('add', dict(one=1, two=2.0, skipped=3, _hidden=4))
+    assert vars(ints) == dict(one=1)
+    tree = NormalDevice(name='tree')
+    namespaces.update('add', dict(tree=tree))
+    assert layers.tree_veggies is tree.veggies
+    namespaces.update('remove', dict(one=1, tree=tree))
+    assert len(ints) == 0
+    assert len(layers) == 0
+
+
+def test_component_paths():
+    logger.debug('test_component_paths')
+    cache = {}
+    paths = component_paths(NormalDevice, cache)
+    assert paths == [(('apples',), Device), (('oranges',), Signal),
+                     (('veggies',), Layer), (('veggies', 'potato'), Device)]
+    assert cache[Layer] == [(('potato',), Device)]
+    assert component_paths(NormalDevice, cache) is paths
+    assert component_paths(int) == []
+
+
+def test_component_index(tmpdir, monkeypatch):
+    logger.debug('test_component_index')
+    monkeypatch.setattr(hutch_python.namespace, '_component_index', {})
+    monkeypatch.setattr(hutch_python.namespace, '_saved_index', {})
+    index_file = str(tmpdir.join('components.json'))
+    paths = component_paths(NormalDevice)
+    assert component_paths(NormalDevice) is paths
+    assert save_component_index(index_file)
+    # Nothing new to save
+    assert not save_component_index(index_file)
+
+    # A new session reads the paths instead of scanning the class
+    hutch_python.namespace._component_index.clear()
+    hutch_python.namespace._saved_index.clear()
+    monkeypatch.setattr(NormalDevice, 'component_names', ())
+    assert load_component_index(index_file) == 3
+    assert component_paths(NormalDevice) == paths
+
+    # Saved paths from a different package version are ignored
+    hutch_python.namespace._component_index.clear()
+    for entry in hutch_python.namespace._saved_index.values():
+        entry['version'] = 'old'
+    assert component_paths(NormalDevice) == []
+
+    # So are saved paths from a different version of the file
+    hutch_python.namespace._component_index.clear()
+    hutch_python.namespace._saved_index.clear()
+    assert load_component_index(index_file) == 3
+    for entry in hutch_python.namespace._saved_index.values():
+        entry['modules'][__name__] = 'edited'
+    assert component_paths(NormalDevice) == []
+
+    assert load_component_index(str(tmpdir.join('missing.json'))) == 0
+
+
+def test_component_devices(monkeypatch):
+    logger.debug('test_component_devices')
+    monkeypatch.setattr(hutch_python.namespace, '_component_index', {})
+    monkeypatch.setattr(hutch_python.namespace, '_saved_index', {})
+    device = NormalDevice(name='normal')
+    components = component_devices(device)
+    assert [(attrs, cls) for attrs, cls, obj in components] == (
+        component_paths(NormalDevice))
+    assert components[0][2] is device.apples
+
+    # A path that no longer exists is dropped and the class is scanned again
+    hutch_python.namespace._component_index[NormalDevice] = [
+        (('removed',), Device)]
+    components = component_devices(device)
+    assert [attrs for attrs, cls, obj in components] == [
+        ('apples',), ('oranges',), ('veggies',), ('veggies', 'potato')]
+    assert class_namespace(Device, SimpleNamespace(normal=device))
+
+
 def test_tree_namespace():
     logger.debug('test_metadata_namespace')
     scope = SimpleNamespace(mfx_dia_obj1=1, mfx_dia_obj2=2,
@@ -66,6 +169,44 @@ def test_tree_namespace():
     assert xpp.sb2.obj5 == 5
 
 
+def test_tree_namespace_query():
+    logger.debug('test_tree_namespace_query')
+    scope = SimpleNamespace(mfx_dg2_obj1=1, mfx_dg2_obj2=2,
+                            MFX_dg3_obj3=3, mfx_query=4, xpp_sb2_obj5=5)
+    tree = tree_namespace(scope=scope)
+    assert tree.query('mfx_dg2') == dict(mfx_dg2_obj1=1, mfx_dg2_obj2=2)
+    assert list(tree.query('mfx_dg')) == ['MFX_dg3_obj3', 'mfx_dg2_obj1',
+                                          'mfx_dg2_obj2']
+    assert tree.query('xpp_sb2_obj5') == dict(xpp_sb2_obj5=5)
+    assert tree.query('cxi') == {}
+    assert tree.mfx.dg2.query('obj1') == dict(mfx_dg2_obj1=1)
+    # Objects take precedence over the query method
+    assert tree.mfx.query == 4
+    assert count_ns_leaves(tree) == 5
+    assert count_ns_leaves(tree.mfx) == 4
+
+
+def test_tree_namespace_update():
+    logger.debug('test_tree_namespace_update')
+    tree = TreeNamespace(skip=set(['all_objects']))
+    tree.update('add', dict(mfx_dia_obj1=1, mfx_dg2_obj3=3, all_objects=0))
+    assert tree.space.mfx.dia.obj1 == 1
+    assert not hasattr(tree.space, 'all')
+    tree.update('add', dict(mfx_dia_obj2=2))
+    assert tree.space.mfx.dia.obj2 == 2
+    tree.update('remove', dict(mfx_dia_obj1=1, mfx_dia_obj2=2))
+    assert not hasattr(tree.space.mfx, 'dia')
+    assert tree.space.mfx.dg2.obj3 == 3
+    # Only remove the object that was added under this name
+    tree.update('remove', dict(mfx_dg2_obj3=4))
+    assert tree.space.mfx.dg2.obj3 == 3
+    assert tree.query('mfx') == dict(mfx_dg2_obj3=3)
+    assert count_ns_leaves(tree.space) == 1
+    tree.update('remove', dict(mfx_dg2_obj3=3))
+    assert len(tree.space) == 0
+    assert count_ns_leaves(tree.space) == 0
+
+
 def test_conflicting_name():
     logger.debug('test_conflicting_name')
     # This should be ok, but make sure the warning is covered
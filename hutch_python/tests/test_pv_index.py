@@ -0,0 +1,64 @@
+import logging
+from types import SimpleNamespace
+
+from ophyd.device import Device, Component
+from ophyd.signal import EpicsSignal, EpicsSignalRO
+
+from hutch_python.lazy import LazyDevice
+from hutch_python.pv_index import PVIndex, object_pvs
+
+logger = logging.getLogger(__name__)
+
+
+class Valve(Device):
+    state = Component(EpicsSignal, ':STATE', write_pv=':SET')
+
+
+class Manifold(Device):
+    valve = Component(Valve, ':V1')
+    pressure = Component(EpicsSignalRO, ':PRESS')
+    spare = Component(EpicsSignalRO, ':SPARE', lazy=True)
+
+
+def test_object_pvs():
+    logger.debug('test_object_pvs')
+    manifold = Manifold('TST:MAN', name='tst_man')
+    pvs, prefixes = object_pvs('tst_man', manifold)
+    assert [(pv, match.attr) for pv, match in pvs] == [
+        ('TST:MAN:V1:STATE', 'valve.state'), ('TST:MAN:V1:SET', 'valve.state'),
+        ('TST:MAN:PRESS', 'pressure')]
+    assert [(pv, match.attr) for pv, match in prefixes] == [
+        ('TST:MAN', ''), ('TST:MAN:V1', 'valve')]
+    assert prefixes[1][1].obj is manifold.valve
+
+
+def test_pv_index():
+    logger.debug('test_pv_index')
+    manifold = Manifold('TST:MAN', name='tst_man')
+    signal = EpicsSignalRO('TST:GAUGE', name='tst_gauge')
+
+    def loader():
+        raise RuntimeError('Should not be loaded')
+
+    lazy = LazyDevice(loader, 'tst_lazy', cls=Manifold,
+                      md=SimpleNamespace(prefix='TST:LAZY'))
+    index = PVIndex(skip=set(['skipped']))
+    index.update('add', dict(tst_man=manifold, tst_gauge=signal,
+                             tst_lazy=lazy, skipped=signal, num=1))
+
+    match, = index.lookup('TST:MAN:V1:SET')
+    assert (match.name, match.attr) == ('tst_man', 'valve.state')
+    assert match.obj is manifold.valve.state
+    assert index.lookup('TST:GAUGE')[0].name == 'tst_gauge'
+    assert index.lookup('TST:NONE') == []
+    assert ([match.pvname for match in index.lookup_prefix('TST:MAN:V1')]
+            == ['TST:MAN:V1:SET', 'TST:MAN:V1:STATE'])
+    # Unknown PVs belong to the device with the longest matching prefix
+    assert index.owner('TST:MAN:V1:OTHER')[0].obj is manifold.valve
+    assert index.owner('TST:LAZY:ANY')[0].obj is lazy
+    assert index.owner('OTHER:PV') == []
+    assert not lazy.lazy_loaded
+
+    index.update('remove', dict(tst_man=manifold))
+    assert index.lookup_prefix('TST:MAN') == []
+    assert index.owner('TST:MAN:V1:OTHER') == []
@@ -1,4 +1,7 @@
+import json
 import logging
+import stat
+from concurrent.futures import Future
 
 import happi
 
@@ -27,6 +30,19 @@ def test_qs_load():
     QSBackend.empty = False
 
 
+def test_qs_load_future():
+    logger.debug('test_qs_load_future')
+    hutch_python.qs_load.QSBackend = QSBackend
+    docs = Future()
+    docs.set_result(hutch_python.qs_load.fetch_qs_docs('LR12', '15'))
+    objs = get_qs_objs('LR12', '15', docs=docs)
+    assert objs['inj_x'].run == '15'
+    # A failed request is handled like a failure to load here
+    docs = Future()
+    docs.set_exception(ConnectionError('Questionnaire is down'))
+    assert get_qs_objs('LR12', '15', docs=docs) == {}
+
+
 def test_ws_auth_conf(temporary_config):
     logger.debug('test_ws_auth_conf')
     hutch_python.qs_load.QSBackend = QSBackend
@@ -35,3 +51,51 @@ def test_ws_auth_conf(temporary_config):
     assert objs['inj_x'].kerberos == 'False'
     assert objs['inj_x'].user == 'user'
     assert objs['inj_x'].pw == 'pw'
+
+
+class BrokenQSBackend(QSBackend):
+    def find(self, multiples=False, **kwargs):
+        raise ConnectionError('Questionnaire is down')
+
+
+def test_qs_cache(monkeypatch, tmpdir):
+    logger.debug('test_qs_cache')
+    # Nothing saved and no connection
+    monkeypatch.setattr(hutch_python.qs_load, 'QSBackend', BrokenQSBackend)
+    assert get_qs_objs('LR12', '15', cache_dir=tmpdir) == {}
+    # Save the questionnaire
+    monkeypatch.setattr(hutch_python.qs_load, 'QSBackend', QSBackend)
+    objs = get_qs_objs('LR12', '15', cache_dir=tmpdir)
+    assert objs['inj_x'].run == '15'
+    assert tmpdir.join('qs_lr1215.json').exists()
+    # Use the saved copy first, check the questionnaire in the background
+    clear_happi_cache()
+    objs = get_qs_objs('LR12', '15', cache_dir=tmpdir)
+    hutch_python.qs_load.refresh_thread.join()
+    assert objs['inj_x'].proposal == 'LR12'
+    # Expired copy is still used when the questionnaire is down
+    clear_happi_cache()
+    monkeypatch.setattr(hutch_python.qs_load, 'QSBackend', BrokenQSBackend)
+    objs = get_qs_objs('LR12', '15', cache_dir=tmpdir, ttl=0)
+    assert objs['inj_x'].run == '15'
+
+
+def test_qs_cache_credentials(monkeypatch, tmpdir, temporary_config):
+    logger.debug('test_qs_cache_credentials')
+    monkeypatch.setattr(hutch_python.qs_load, 'QSBackend', QSBackend)
+    clear_happi_cache()
+    objs = get_qs_objs('LR12', '15', cache_dir=tmpdir)
+    assert objs['inj_x'].pw == 'pw'
+    # The login is not saved, and only the owner can change the file
+    path = tmpdir.join('qs_lr1215.json')
+    assert '"pw"' not in path.read()
+    docs = json.loads(path.read())['data']['docs']
+    assert all('user' not in doc for doc in docs.values())
+    assert not path.stat().mode & (stat.S_IWGRP | stat.S_IRWXO)
+    # The login is filled in from the current configuration
+    clear_happi_cache()
+    monkeypatch.setattr(hutch_python.qs_load, 'QSBackend', BrokenQSBackend)
+    objs = get_qs_objs('LR12', '15', cache_dir=tmpdir, ttl=0)
+    assert objs['inj_x'].kerberos == 'False'
+    assert objs['inj_x'].user == 'user'
+    assert objs['inj_x'].pw == 'pw'
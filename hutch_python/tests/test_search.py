@@ -0,0 +1,83 @@
+import logging
+from types import SimpleNamespace
+
+from ophyd.device import Device, Component
+
+from hutch_python.cache import LoadCache
+from hutch_python.lazy import LazyDevice
+from hutch_python.search import SearchIndex, object_fields, trigrams
+from hutch_python.utils import IterableNamespace
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(Device):
+    x = Component(Device)
+    y = Component(Device)
+
+
+def test_object_fields():
+    logger.debug('test_object_fields')
+    md = SimpleNamespace(prefix='MFX:DG2:PIM', location='Downstream')
+
+    def loader():
+        raise RuntimeError('Should not be loaded')
+
+    lazy = LazyDevice(loader, 'mfx_dg2_pim', cls=Stage, md=md)
+    fields = object_fields('mfx_dg2_pim', lazy)
+    assert ('name', 'mfx_dg2_pim') in fields
+    assert ('prefix', 'mfx:dg2:pim') in fields
+    assert ('location', 'downstream') in fields
+    assert ('component', 'mfx_dg2_pim_x') in fields
+    assert ('class', __name__.lower() + '.stage') in fields
+    assert not lazy.lazy_loaded
+
+
+def test_search_index():
+    logger.debug('test_search_index')
+    index = SearchIndex(skip=set(['skipped']))
+    stage = Stage(name='mfx_stage')
+    index.update('add', dict(mfx_stage=stage, mfx_dg2_yag=1, yag=2,
+                             stage_yag=3.0, skipped='yag',
+                             motors=IterableNamespace()))
+    assert len(index) == 4
+    # Exact names, then names that start with the query, then the rest
+    assert [res.name for res in index.search('YAG')] == ['yag', 'mfx_dg2_yag',
+                                                         'stage_yag']
+    assert [res.name for res in index.search('yag', limit=1)] == ['yag']
+    result, = index.search('stage_x')
+    assert result.name == 'mfx_stage'
+    assert result.obj is stage
+    assert result.field == 'component'
+    # Classes are searched last
+    assert index.search('float')[0].name == 'stage_yag'
+    # Short queries check every object
+    assert len(index.search('g')) == 4
+    # Small typos still find the object
+    assert index.search('mfx_dg2_yga')[0].name == 'mfx_dg2_yag'
+    assert index.search('mfx_dg2_yga', fuzzy=False) == []
+    assert index.search('') == []
+
+    index.update('remove', dict(yag=2, stage_yag=4.0))
+    assert [res.name for res in index.search('yag')] == ['mfx_dg2_yag',
+                                                         'stage_yag']
+    assert 'yag' not in [res.name for res in index.search('yag')]
+
+
+def test_search_follows_cache():
+    logger.debug('test_search_follows_cache')
+    cache = LoadCache('fake_search.db')
+    index = SearchIndex()
+    cache.subscribe(index.update)
+    cache(xpp_sb2_ipm=1)
+    assert index.search('ipm')[0].obj == 1
+    cache(xpp_sb2_ipm=2)
+    assert [res.obj for res in index.search('ipm')] == [2]
+    cache.remove('xpp_sb2_ipm')
+    assert index.search('ipm') == []
+
+
+def test_trigrams():
+    logger.debug('test_trigrams')
+    assert trigrams('abcd') == set(['abc', 'bcd'])
+    assert trigrams('ab') == set()
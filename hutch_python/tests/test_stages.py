@@ -0,0 +1,139 @@
+import logging
+import time
+from threading import Event
+
+import pytest
+
+from hutch_python.cache import LoadCache
+from hutch_python.stages import Stage, run_stages, SessionSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def test_run_stages_order():
+    logger.debug('test_run_stages_order')
+    cache = LoadCache('stages.db')
+    slow_started = Event()
+
+    def slow():
+        slow_started.set()
+        time.sleep(0.1)
+        return dict(shared='slow', slow=1)
+
+    def fast():
+        # Only possible if we are running alongside slow
+        assert slow_started.wait(timeout=1)
+        return dict(shared='fast', fast=2)
+
+    def after():
+        # Requirements must already be in the cache
+        return dict(total=cache.objs.slow + cache.objs.fast)
+
+    run_stages([Stage('slow', slow),
+                Stage('fast', fast),
+                Stage('after', after, requires=['slow', 'fast', 'missing'])],
+               cache)
+    # Later stages override earlier ones, same as a serial load
+    assert cache.objs.shared == 'fast'
+    assert cache.objs.total == 3
+    # Each object remembers the stage that made it
+    assert cache.sources['slow'] == 'slow'
+    assert cache.sources['shared'] == 'fast'
+    assert cache.sources['total'] == 'after'
+
+
+def test_run_stages_failure():
+    logger.debug('test_run_stages_failure')
+    cache = LoadCache('stages2.db')
+
+    def bad():
+        1/0
+
+    def good():
+        return dict(good=1)
+
+    run_stages([Stage('bad', bad), Stage('good', good, requires=['bad'])],
+               cache)
+    assert cache.objs.good == 1
+    assert not hasattr(cache.objs, 'bad')
+
+
+def test_run_stages_ready_first():
+    logger.debug('test_run_stages_ready_first')
+    cache = LoadCache('stages4.db')
+    after_started = Event()
+
+    def first():
+        return dict(first=1)
+
+    def slow():
+        # Only possible if after does not wait for this unrelated stage
+        assert after_started.wait(timeout=1)
+        return dict(slow=1, shared='slow')
+
+    def after():
+        after_started.set()
+        return dict(after=cache.objs.first + 1, shared='after')
+
+    run_stages([Stage('first', first),
+                Stage('slow', slow),
+                Stage('after', after, requires=['first'])],
+               cache)
+    assert cache.objs.slow == 1
+    assert cache.objs.after == 2
+    # The later stage wins even though it finished first
+    assert cache.objs.shared == 'after'
+    assert cache.sources['shared'] == 'after'
+
+
+def test_run_stages_bad_order():
+    logger.debug('test_run_stages_bad_order')
+    with pytest.raises(ValueError):
+        run_stages([Stage('one', dict, requires=['two']),
+                    Stage('two', dict)], LoadCache('stages3.db'))
+
+
+def test_session_snapshot(tmpdir):
+    logger.debug('test_session_snapshot')
+    path = str(tmpdir.join('session.json'))
+    calls = []
+
+    def load():
+        calls.append('load')
+        return dict(one=1, two=2)
+
+    def replay(outputs):
+        calls.append('replay')
+        return {name: value for name, value in outputs}
+
+    def stage(inputs):
+        return Stage('numbers', load, inputs=lambda: inputs,
+                     record=lambda objs: list(objs.items()), replay=replay)
+
+    snapshot = SessionSnapshot(path, key='conf')
+    cache = LoadCache('snapshot.db')
+    run_stages([stage('a')], cache, snapshot=snapshot)
+    assert snapshot.save()
+    assert not snapshot.save()
+
+    # Same inputs, replay
+    snapshot = SessionSnapshot(path, key='conf')
+    cache = LoadCache('snapshot2.db')
+    run_stages([stage('a')], cache, snapshot=snapshot)
+    assert cache.objs.two == 2
+    assert calls == ['load', 'replay']
+
+    # Different inputs, or a different session key, load again
+    run_stages([stage('b')], cache, snapshot=snapshot)
+    run_stages([stage('a')], cache,
+               snapshot=SessionSnapshot(path, key='other'))
+    assert calls == ['load', 'replay', 'load', 'load']
+
+    # Replay failures fall back to the normal load
+    def bad_replay(outputs):
+        raise RuntimeError('Bad snapshot')
+
+    run_stages([Stage('numbers', load, inputs=lambda: 'b',
+                      replay=bad_replay)],
+               cache, snapshot=snapshot)
+    assert calls[-1] == 'load'
@@ -0,0 +1,60 @@
+import json
+import logging
+
+import pytest
+
+from hutch_python.stages import Stage
+from hutch_python.timing import StartupTimer
+from hutch_python.utils import safe_load
+
+logger = logging.getLogger(__name__)
+
+
+def test_startup_timer(tmpdir):
+    logger.debug('test_startup_timer')
+    timer = StartupTimer()
+    # Nothing is recorded by default
+    with timer.time('skipped'):
+        pass
+    assert timer.records == []
+    timer.enabled = True
+    with timer.time('one', kind='stage'):
+        pass
+    with pytest.raises(ZeroDivisionError):
+        with timer.time('two', kind='device'):
+            1/0
+    assert [rec['name'] for rec in timer.records] == ['one', 'two']
+    assert all(rec['wall'] >= 0 for rec in timer.records)
+    table = timer.table(sort='name')
+    assert table.index('one') < table.index('two')
+    with pytest.raises(ValueError):
+        timer.table(sort='bananas')
+    path = str(tmpdir.join('timing.json'))
+    timer.save(path)
+    with open(path) as f:
+        assert len(json.load(f)['records']) == 2
+    timer.clear()
+    assert timer.records == []
+
+
+def test_safe_load_timing(monkeypatch):
+    logger.debug('test_safe_load_timing')
+    timer = StartupTimer()
+    timer.enabled = True
+    monkeypatch.setattr('hutch_python.utils.startup_timer', timer)
+    with safe_load('zerodiv'):
+        1/0
+    assert timer.records[0]['name'] == 'zerodiv'
+
+
+def test_stage_timing(monkeypatch):
+    logger.debug('test_stage_timing')
+    timer = StartupTimer()
+    timer.enabled = True
+    monkeypatch.setattr('hutch_python.utils.startup_timer', timer)
+    monkeypatch.setattr('hutch_python.stages.startup_timer', timer)
+    Stage('safe', lambda: None).run()
+    Stage('unsafe', lambda: None, safe=False).run()
+    # Each stage is one row, whether or not safe_load ran it
+    assert [(rec['name'], rec['kind']) for rec in timer.records] == [
+        ('safe', 'stage'), ('unsafe', 'stage')]
@@ -1,4 +1,5 @@
 import logging
+import timeit
 
 import pytest
 
@@ -25,6 +26,66 @@ def test_get_current_experiment(fake_curexp_script):
     assert utils.get_current_experiment('tst') == 'tstlr1215'
 
 
+class CountingBackend(utils.ExperimentBackend):
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def get_experiment(self, hutch):
+        if self.fail:
+            raise RuntimeError('No experiment')
+        self.calls += 1
+        return hutch + 'lr12' + str(self.calls)
+
+
+def test_experiment_backends(monkeypatch, tmpdir):
+    logger.debug('test_experiment_backends')
+    monkeypatch.setattr(utils, '_experiment_backend', utils.ScriptBackend())
+    monkeypatch.setattr(utils, '_experiment_cache', {})
+    # Read from a file
+    path = tmpdir.join('tst_exp')
+    path.write('tstlr3215\n')
+    utils.set_experiment_backend(utils.FileBackend(str(tmpdir) + '/{}_exp'))
+    assert utils.get_current_experiment('tst') == 'tstlr3215'
+    # Repeated calls are cached
+    backend = CountingBackend()
+    utils.set_experiment_backend(backend)
+    assert utils.get_current_experiment('tst') == 'tstlr121'
+    assert utils.get_current_experiment('tst') == 'tstlr121'
+    assert utils.get_current_experiment('tst', ttl=0) == 'tstlr122'
+    # Last known experiment is saved
+    assert utils.get_current_experiment('tst', ttl=0,
+                                        cache_dir=tmpdir) == 'tstlr123'
+    backend.fail = True
+    # But only used when allowed
+    with pytest.raises(RuntimeError):
+        utils.get_current_experiment('tst', ttl=0, cache_dir=tmpdir)
+    assert utils.get_current_experiment('tst', ttl=0, cache_dir=tmpdir,
+                                        max_age=60) == 'tstlr123'
+    with pytest.raises(RuntimeError):
+        utils.get_current_experiment('tst', ttl=0, max_age=60)
+    # Unless it is too old
+    with pytest.raises(RuntimeError):
+        utils.get_current_experiment('tst', ttl=0, cache_dir=tmpdir,
+                                     max_age=1e-9)
+    # Or from another hutch
+    path = tmpdir.join('experiment_xpp.json')
+    tmpdir.join('experiment_tst.json').copy(path)
+    with pytest.raises(RuntimeError):
+        utils.get_current_experiment('xpp', ttl=0, cache_dir=tmpdir,
+                                     max_age=60)
+
+
+def test_experiment_backend_abstract():
+    logger.debug('test_experiment_backend_abstract')
+
+    class NoLookup(utils.ExperimentBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoLookup()
+
+
 def test_iterable_namespace():
     logger.debug('test_iterable_namespace')
 
@@ -32,6 +93,37 @@ def test_iterable_namespace():
 
     assert list(ns) == [1, 2, 3]
     assert len(ns) == 3
+    # Changes are picked up by the next iteration
+    ns.aa = 4
+    del ns.b
+    assert list(ns) == [1, 4, 3]
+    assert len(ns) == 3
+    assert vars(ns) == dict(a=1, c=3, aa=4)
+
+
+def test_iterable_namespace_benchmark():
+    logger.debug('test_iterable_namespace_benchmark')
+    size = 10000
+    # Reverse the names so the first sort has real work to do
+    ns = utils.IterableNamespace(**{'obj{}'.format(size - i): i
+                                    for i in range(size)})
+    objs = list(ns)
+    assert len(objs) == size
+    # Alphabetical, so obj1 then obj10
+    assert objs[:2] == [size - 1, size - 10]
+    keys = ns._sorted_keys
+
+    def sorted_iter():
+        return [obj for _, obj in sorted(ns.__dict__.items())]
+
+    sorted_time = min(timeit.repeat(sorted_iter, number=10, repeat=3))
+    cached_time = min(timeit.repeat(lambda: list(ns), number=10, repeat=3))
+    logger.info('Iterating over %s objects 10 times took %.4fs when sorting '
+                'each time and %.4fs with cached keys', size, sorted_time,
+                cached_time)
+    # Iterating did not sort again. The timings are only logged, because
+    # they are not reliable on a busy machine.
+    assert ns._sorted_keys is keys
 
 
 def test_count_leaves():
@@ -48,6 +140,38 @@ def test_count_leaves():
     assert utils.count_ns_leaves(ns1) == 1
     assert utils.count_ns_leaves(ns2) == 2
     assert utils.count_ns_leaves(ns3) == 3
+    # Cached counts notice changes in nested namespaces
+    ns3.b.c = 3
+    assert utils.count_ns_leaves(ns3) == 4
+    del ns3.b.a
+    assert utils.count_ns_leaves(ns3) == 3
+
+
+def test_count_leaves_cached():
+    logger.debug('test_count_leaves_cached')
+    shared = utils.IterableNamespace(a=1)
+    first = utils.IterableNamespace(shared=shared, b=2)
+    second = utils.IterableNamespace(c=utils.IterableNamespace(c=3))
+    outer = utils.IterableNamespace(first=first)
+    outer.second = second
+    assert utils.count_ns_leaves(outer) == 3
+    counts = [ns._leaf_count for ns in (shared, first, second, outer)]
+    # A change elsewhere does not recount an untouched namespace
+    second.c.d = 4
+    assert utils.count_ns_leaves(first) == 2
+    assert first._leaf_count is counts[1]
+    assert shared._leaf_count is counts[0]
+    # Only the changed namespace and the ones that contain it are recounted
+    assert utils.count_ns_leaves(outer) == 4
+    assert outer._leaf_count is not counts[3]
+    assert second._leaf_count is not counts[2]
+    assert first._leaf_count is counts[1]
+    # A namespace in several places invalidates all of them
+    other = utils.IterableNamespace(shared=shared)
+    assert utils.count_ns_leaves(other) == 1
+    shared.e = 5
+    assert utils.count_ns_leaves(other) == 2
+    assert utils.count_ns_leaves(outer) == 5
 
 
 def test_extract_objs():
@@ -0,0 +1,137 @@
+"""
+This module keeps track of how long each part of the ``hutch-python`` startup
+takes. Timing is only recorded when `startup_timer` is enabled, for example by
+the ``--profile-startup`` command-line option.
+"""
+from contextlib import contextmanager
+from threading import Lock, current_thread
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Per-thread CPU time if available, otherwise the process CPU time
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+
+
+class StartupTimer:
+    """
+    Collects wall-clock and CPU timing of named blocks of code.
+
+    Timing is thread-safe so that blocks running in different startup stages
+    can be recorded at the same time. The CPU time of each block is measured
+    for the thread that ran it.
+
+    Attributes
+    ----------
+    enabled: ``bool``
+        If ``False``, the default, `StartupTimer.time` does not record
+        anything.
+
+    records: ``list`` of ``dict``
+        One entry per timed block with keys ``name``, ``kind``, ``start``,
+        ``wall``, ``cpu`` and ``thread``. ``start`` is the number of seconds
+        since the timer was last cleared.
+    """
+    columns = ('name', 'kind', 'start', 'wall', 'cpu', 'thread')
+
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self._lock = Lock()
+        self._t0 = time.perf_counter()
+
+    def clear(self):
+        """
+        Remove all records and restart the clock.
+        """
+        with self._lock:
+            self.records = []
+            self._t0 = time.perf_counter()
+
+    @contextmanager
+    def time(self, name, kind='load'):
+        """
+        Context manager to time a block of code.
+
+        The block is recorded even if it raises an exception.
+
+        Parameters
+        ----------
+        name: ``str``
+            Name of the block, e.g. the name of a loaded device.
+
+        kind: ``str``, optional
+            Category of the block, e.g. ``stage``, ``load`` or ``device``.
+        """
+        if not self.enabled:
+            yield
+            return
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        try:
+            yield
+        finally:
+            record = dict(name=str(name), kind=kind,
+                          start=wall_start - self._t0,
+                          wall=time.perf_counter() - wall_start,
+                          cpu=_cpu_time() - cpu_start,
+                          thread=current_thread().name)
+            with self._lock:
+                self.records.append(record)
+
+    def table(self, sort='wall', reverse=None):
+        """
+        Create a text table of the timing records.
+
+        Parameters
+        ----------
+        sort: ``str``, optional
+            Column to sort by, one of `StartupTimer.columns`. The default is
+            to show the slowest blocks first.
+
+        reverse: ``bool``, optional
+            If ``True``, sort in descending order. The default is descending
+            for the numeric columns and ascending for the others.
+
+        Returns
+        -------
+        table: ``str``
+        """
+        if sort not in self.columns:
+            raise ValueError('Cannot sort by {}, pick one of {}'
+                             ''.format(sort, self.columns))
+        if reverse is None:
+            reverse = sort in ('wall', 'cpu')
+        with self._lock:
+            records = sorted(self.records, key=lambda rec: rec[sort],
+                             reverse=reverse)
+        width = max([len(rec['name']) for rec in records] + [4])
+        row = '{:<%d} {:<8} {:>8} {:>8} {:>8} {}' % width
+        lines = [row.format('name', 'kind', 'start', 'wall', 'cpu',
+                            'thread')]
+        for rec in records:
+            lines.append(row.format(rec['name'], rec['kind'],
+                                    '{:.3f}'.format(rec['start']),
+                                    '{:.3f}'.format(rec['wall']),
+                                    '{:.3f}'.format(rec['cpu']),
+                                    rec['thread']))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        """
+        Write the timing records to a JSON file.
+
+        Parameters
+        ----------
+        path: ``str`` or ``Path``
+        """
+        with self._lock:
+            records = list(self.records)
+        with open(str(path), 'w') as f:
+            json.dump(dict(records=records), f, indent=2)
+
+
+# The timer used by the startup sequence
+startup_timer = StartupTimer()
@@ -3,18 +3,25 @@ Module that contains general-use utilities. Some of these are useful outside of
 ``hutch-python``, while others are used in multiple places throughout the
 module.
 """
+from abc import ABC, abstractmethod
 from contextlib import contextmanager
 from functools import partial
 from importlib import import_module
+from pathlib import Path
 from subprocess import check_output
+from threading import Lock
 from types import SimpleNamespace
+from weakref import WeakValueDictionary
 import logging
 import sys
+import time
 
 import pyfiglet
 
-from .constants import (CUR_EXP_SCRIPT, CLASS_SEARCH_PATH, HUTCH_COLORS,
-                        SUCCESS_LEVEL)
+from .constants import (CUR_EXP_SCRIPT, CUR_EXP_TTL, CUR_EXP_MAX_AGE,
+                        CLASS_SEARCH_PATH, HUTCH_COLORS, SUCCESS_LEVEL)
+from .disk_cache import read_cache, write_cache
+from .timing import startup_timer
 
 logging.addLevelName('SUCCESS', SUCCESS_LEVEL)
 logger = logging.getLogger(__name__)
@@ -22,13 +29,14 @@ logger.success = partial(logger.log, SUCCESS_LEVEL)
 
 
 @contextmanager
-def safe_load(name, cls=None):
+def safe_load(name, cls=None, kind='load'):
     """
     Context manager to safely run a block of code.
 
     This will abort running code and resume the rest of the program if
     something fails. This can be used to wrap user code with unknown behavior.
-    This will log standard messages to indicate success or failure.
+    This will log standard messages to indicate success or failure, and time
+    the block using `timing.startup_timer`.
 
     Parameters
     ----------
@@ -39,39 +47,185 @@ def safe_load(name, cls=None):
     cls: ``type``, optional
         The class of a loaded object to be logged. This will be used in the log
         message.
+
+    kind: ``str``, optional
+        The category of the timing record, see `timing.StartupTimer.time`.
     """
     if cls is None:
         identifier = name
     else:
         identifier = ' '.join((name, str(cls)))
     logger.info('Loading %s...', identifier)
-    try:
-        yield
-        logger.success('Successfully loaded %s', identifier)
-    except Exception as exc:
-        logger.error('Failed to load %s', identifier)
-        logger.debug(exc, exc_info=True)
+    with startup_timer.time(identifier, kind=kind):
+        try:
+            yield
+            logger.success('Successfully loaded %s', identifier)
+        except Exception as exc:
+            logger.error('Failed to load %s', identifier)
+            logger.debug(exc, exc_info=True)
+
+
+class ExperimentBackend(ABC):
+    """
+    Base class for ways to find the current experiment of a hutch.
+
+    Subclasses must implement `ExperimentBackend.get_experiment`. Use
+    `set_experiment_backend` to pick the backend used by
+    `get_current_experiment`.
+    """
+    @abstractmethod
+    def get_experiment(self, hutch):
+        """
+        Return the full experiment name for ``hutch``, e.g. ``xppls2516``.
+        """
+
+    def cache_key(self, hutch):
+        """
+        Return a hashable that identifies this lookup for ``hutch``.
+
+        `get_current_experiment` only reuses results with the same key.
+        """
+        return (id(self), hutch)
+
+
+class ScriptBackend(ExperimentBackend):
+    """
+    Find the current experiment by running the ``get_curr_exp`` script.
+
+    Parameters
+    ----------
+    script: ``str``, optional
+        Command to run, with ``{0}`` in place of the hutch name. If omitted,
+        use ``CUR_EXP_SCRIPT``, which runs the script on NFS.
+    """
+    def __init__(self, script=None):
+        self.script = script
+
+    def command(self, hutch):
+        """
+        The command to run for ``hutch``.
+        """
+        return (self.script or CUR_EXP_SCRIPT).format(hutch)
 
+    def get_experiment(self, hutch):
+        script = self.command(hutch)
+        return check_output(script.split(' '),
+                            universal_newlines=True).strip('\n')
 
-def get_current_experiment(hutch):
+    def cache_key(self, hutch):
+        return self.command(hutch)
+
+
+class FileBackend(ExperimentBackend):
+    """
+    Find the current experiment by reading it from a file.
+
+    Parameters
+    ----------
+    path: ``str``
+        Path to a file that contains only the experiment name. This may
+        include ``{0}`` in place of the hutch name.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def get_experiment(self, hutch):
+        with open(self.path.format(hutch), 'r') as f:
+            return f.read().strip()
+
+    def cache_key(self, hutch):
+        return self.path.format(hutch)
+
+
+_experiment_backend = ScriptBackend()
+_experiment_cache = {}
+_experiment_lock = Lock()
+
+
+def set_experiment_backend(backend):
+    """
+    Pick how `get_current_experiment` finds the current experiment.
+
+    Parameters
+    ----------
+    backend: `ExperimentBackend`
+        For example, a `FileBackend` to avoid running scripts on NFS, or a
+        subclass that returns a fixed experiment for testing.
+    """
+    global _experiment_backend
+    _experiment_backend = backend
+
+
+def get_current_experiment(hutch, ttl=CUR_EXP_TTL, cache_dir=None,
+                           max_age=CUR_EXP_MAX_AGE):
     """
     Get the current experiment for ``hutch``.
 
-    This currently works by running an external script on NFS, but this will be
-    changed in the future.
+    By default this runs an external script on NFS, but this can be changed
+    using `set_experiment_backend`. The answer is reused for ``ttl`` seconds.
+    If ``cache_dir`` is provided, the last answer is also saved there. If
+    ``max_age`` is also set, the saved answer is used when the backend fails,
+    e.g. when NFS is not available, as long as it is an experiment of the
+    same hutch that was found less than ``max_age`` seconds ago. A warning
+    says when it was found, because the experiment may have changed since.
 
     Parameters
     ----------
     hutch: ``str``
         The hutch we would like to know the current experiment of
 
+    ttl: ``float``, optional
+        Seconds to reuse a previous answer for
+
+    cache_dir: ``Path``, optional
+        Directory to save the last known experiment in
+
+    max_age: ``float``, optional
+        Seconds since the last known experiment was found for it to still be
+        used. Older answers are ignored and the backend's error is raised.
+        The default, 0, never uses the last known experiment.
+
     Returns
     -------
     expname: ``str``
         Full experiment name, e.g. ``xppls2516``
     """
-    script = CUR_EXP_SCRIPT.format(hutch)
-    return check_output(script.split(' '), universal_newlines=True).strip('\n')
+    backend = _experiment_backend
+    key = backend.cache_key(hutch)
+    with _experiment_lock:
+        try:
+            found_time, expname = _experiment_cache[key]
+            if time.monotonic() - found_time < ttl:
+                return expname
+        except KeyError:
+            pass
+    if cache_dir is None:
+        path = None
+    else:
+        path = Path(cache_dir) / 'experiment_{}.json'.format(hutch)
+    try:
+        expname = backend.get_experiment(hutch)
+    except Exception:
+        if path is None or not max_age:
+            raise
+        saved = read_cache(path, key=dict(hutch=hutch))
+        if (not isinstance(saved, dict)
+                or saved.get('hutch') != hutch
+                or not str(saved.get('expname')).startswith(hutch.lower())
+                or time.time() - saved.get('found', 0) > max_age):
+            raise
+        logger.warning('Unable to find current experiment. Using %s, which '
+                       'was the experiment on %s and may be out of date',
+                       saved['expname'], time.ctime(saved['found']))
+        logger.debug('', exc_info=True)
+        return saved['expname']
+    with _experiment_lock:
+        _experiment_cache[key] = (time.monotonic(), expname)
+    if path is not None:
+        write_cache(path, dict(hutch=hutch, expname=expname,
+                               found=time.time()),
+                    key=dict(hutch=hutch))
+    return expname
 
 
 class IterableNamespace(SimpleNamespace):
@@ -84,11 +238,75 @@ class IterableNamespace(SimpleNamespace):
 
     This class also has the added feature where ``len`` will correctly tell you
     the number of objects in the ``namespace``.
+
+    The sorted order of the keys is kept between iterations and only
+    recomputed after the namespace changes. Changes must be made through
+    ``setattr`` and ``delattr`` rather than through ``__dict__``.
     """
+    __slots__ = ('_sorted_keys', '_leaf_count', '_version', '_parents',
+                 '__weakref__')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        for value in kwargs.values():
+            self._adopt(value)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        self._adopt(value)
+        self._mutated()
+
+    def __delattr__(self, name):
+        super().__delattr__(name)
+        self._mutated()
+
+    def _adopt(self, value):
+        # Remember the namespaces that contain each namespace, so a change
+        # only invalidates the cached counts that can include it
+        if isinstance(value, IterableNamespace):
+            parents = getattr(value, '_parents', None)
+            if parents is None:
+                # Namespaces compare by value, so key them by id
+                parents = WeakValueDictionary()
+                object.__setattr__(value, '_parents', parents)
+            parents[id(self)] = self
+
+    def _mutated(self):
+        object.__setattr__(self, '_sorted_keys', None)
+        # Bump the version of this namespace and everything that contains it
+        seen = set()
+        pending = [self]
+        while pending:
+            namespace = pending.pop()
+            if id(namespace) in seen:
+                continue
+            seen.add(id(namespace))
+            object.__setattr__(namespace, '_version',
+                               getattr(namespace, '_version', 0) + 1)
+            parents = getattr(namespace, '_parents', None)
+            if parents is not None:
+                pending.extend(parents.values())
+
+    def _keys(self):
+        keys = getattr(self, '_sorted_keys', None)
+        if keys is None:
+            keys = sorted(self.__dict__)
+            object.__setattr__(self, '_sorted_keys', keys)
+        return keys
+
+    def _known_leaf_count(self):
+        # Subclasses that track their leaves can skip count_ns_leaves
+        return None
+
     def __iter__(self):
         # Sorts alphabetically by key
-        for _, obj in sorted(self.__dict__.items()):
-            yield obj
+        objs = self.__dict__
+        for key in self._keys():
+            try:
+                yield objs[key]
+            except KeyError:
+                # Removed during the iteration
+                pass
 
     def __len__(self):
         return len(self.__dict__)
@@ -101,13 +319,28 @@ def count_ns_leaves(namespace):
     Given an `IterableNamespace` that contains other `IterableNamespace`
     objects that may in themselves contain `IterableNamespace` objects,
     determine how many non-`IterableNamespace` objects are in the tree.
+
+    The count is saved and reused until the namespace, or a namespace inside
+    of it, changes.
+    Branches of a `tree_namespace` already know their count, which includes
+    each object once even if it is itself a namespace.
     """
+    if isinstance(namespace, IterableNamespace):
+        count = namespace._known_leaf_count()
+        if count is not None:
+            return count
+    version = getattr(namespace, '_version', 0)
+    cached = getattr(namespace, '_leaf_count', None)
+    if cached is not None and cached[0] == version:
+        return cached[1]
     count = 0
     for obj in namespace:
         if isinstance(obj, IterableNamespace):
             count += count_ns_leaves(obj)
         else:
             count += 1
+    if isinstance(namespace, IterableNamespace):
+        object.__setattr__(namespace, '_leaf_count', (version, count))
     return count
 
 